@@ -11,6 +11,10 @@ from pages_custom.reports_page import reports_app
 from pages_custom.settings_page import settings_app
 from utils.auth import validate_pin, can_access_page, is_admin
 from utils.logger import log_event
+from utils.write_behind import replay_journal
+
+# Apply saves a crash left in the write-behind journal (once per process)
+replay_journal()
 
 # ===========================
 # THEME ENGINE (Light/Dark Toggle)
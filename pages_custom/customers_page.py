@@ -1,154 +1,19 @@
 import streamlit as st
 import pandas as pd
 from datetime import datetime
-import os
 
+from utils.finance import customer_finances
+from utils.normalize import (
+    format_phone_input, format_phone_series, phone_flat10, phone_label_mask,
+    proper_case, proper_case_series,
+)
+from utils.record_index import get_record_index
+from utils.storage import ROW_ID, ConflictError, init_storage, insert_rows, load_customers, save_customers, load_records
 
-# ===== Excel Auto-Creation (as specified) =====
-def ensure_excel_files():
-    import pandas as pd
-    import os
-
-    if not os.path.exists("data"):
-        os.makedirs("data")
-
-    customers_path = "data/customers.xlsx"
-    if not os.path.exists(customers_path):
-        df = pd.DataFrame(columns=[
-            "client_name",
-            "phone",
-            "location",
-            "email",
-            "status",
-            "notes",
-            "tags",
-            "next_follow_up",
-            "assigned_to",
-            "last_activity"
-        ])
-        df.to_excel(customers_path, index=False)
-
-    records_path = "data/records.xlsx"
-    if not os.path.exists(records_path):
-        df = pd.DataFrame(columns=[
-            "base_id",
-            "date",
-            "type",
-            "number",
-            "amount",
-            "client_name",
-            "phone",
-            "location",
-            "note"
-        ])
-        df.to_excel(records_path, index=False)
-
-
-# ===== Utilities =====
-def proper_case(text):
-    if not text:
-        return ""
-    try:
-        return str(text).title().strip()
-    except Exception:
-        return str(text)
-
-
-def format_phone_input(raw_input):
-    if not raw_input:
-        return None
-    digits = ''.join(filter(str.isdigit, str(raw_input)))
-    if digits.startswith("0"):
-        digits = digits[1:]
-    if digits.startswith("5") and len(digits) == 9:
-        return f"+971 {digits[:2]} {digits[2:5]} {digits[5:]}"
-    return None
-
-
-def phone_flat10(raw_input):
-    if raw_input is None:
-        return ""
-    digits = ''.join(filter(str.isdigit, str(raw_input)))
-    if not digits:
-        return ""
-    if digits.startswith('971') and len(digits) >= 12 and digits[3] == '5':
-        return '0' + digits[3:12]
-    if len(digits) == 9 and digits.startswith('5'):
-        return '0' + digits
-    if len(digits) == 10 and digits.startswith('05'):
-        return digits
-    return digits[-10:]
-
-
-def phone_label_mask(raw_input):
-    flat = phone_flat10(raw_input)
-    return f"{flat} xxxxxxxxxx" if flat else "xxxxxxxxxx"
-
-
-# ===== Data IO =====
-CUSTOMERS_XLSX = "data/customers.xlsx"
-RECORDS_XLSX = "data/records.xlsx"
 
-
-def load_customers():
-    try:
-        df = pd.read_excel(CUSTOMERS_XLSX)
-    except Exception:
-        df = pd.DataFrame(columns=[
-            "client_name", "phone", "location", "email", "status",
-            "notes", "tags", "next_follow_up", "assigned_to", "last_activity"
-        ])
-    df.columns = [c.strip().lower() for c in df.columns]
-    for col in [
-        "client_name", "phone", "location", "email", "status",
-        "notes", "tags", "next_follow_up", "assigned_to", "last_activity"
-    ]:
-        if col not in df.columns:
-            df[col] = None
-    return df[[
-        "client_name", "phone", "location", "email", "status",
-        "notes", "tags", "next_follow_up", "assigned_to", "last_activity"
-    ]]
-
-
-def save_customers(df: pd.DataFrame):
-    os.makedirs("data", exist_ok=True)
-    df.to_excel(CUSTOMERS_XLSX, index=False)
-
-
-def load_records():
-    try:
-        df = pd.read_excel(RECORDS_XLSX)
-        df.columns = [c.strip().lower() for c in df.columns]
-        return df
-    except Exception:
-        return pd.DataFrame(columns=[
-            "base_id", "date", "type", "number", "amount",
-            "client_name", "phone", "location", "note"
-        ])
-
-
-def calculate_customer_finances(customer_name: str, customer_phone: str | None):
-    rec = load_records()
-    if rec.empty:
-        return 0.0, 0.0, 0.0, 0.0
-    # Normalize for matching
-    cname = str(customer_name).strip().lower()
-    cphone = phone_flat10(customer_phone) if customer_phone else ""
-    # Build mask: prefer phone if available, else fallback to name
-    name_mask = rec["client_name"].astype(str).str.strip().str.lower() == cname
-    if "phone" in rec.columns:
-        rec_phone_norm = rec["phone"].apply(phone_flat10)
-        phone_mask = rec_phone_norm == cphone if cphone else False
-    else:
-        phone_mask = False
-    mask = phone_mask | name_mask
-    sub = rec[mask]
-    total_q = sub[sub["type"] == "q"]["amount"].sum() if not sub.empty else 0.0
-    total_i = sub[sub["type"] == "i"]["amount"].sum() if not sub.empty else 0.0
-    total_r = sub[sub["type"] == "r"]["amount"].sum() if not sub.empty else 0.0
-    outstanding = total_i - total_r
-    return float(total_q or 0.0), float(total_i or 0.0), float(total_r or 0.0), float(outstanding or 0.0)
+# ===== Storage (SQLite engine, seeded from data/*.xlsx) =====
+def ensure_excel_files():
+    init_storage()
 
 
 # ===== Main Page =====
@@ -208,31 +73,28 @@ def customers_app():
         emp_filter = st.selectbox("Assigned To", options=["All"] + sorted(list({x for x in customers["assigned_to"].dropna().astype(str)})))
 
     tbl = customers.copy()
-    tbl["Client Name"] = tbl["client_name"].apply(proper_case)
-    tbl["Phone"] = tbl["phone"].apply(lambda p: format_phone_input(p) or p)
-    tbl["Location"] = tbl["location"].apply(proper_case)
+    tbl["Client Name"] = proper_case_series(tbl["client_name"])
+    tbl["Phone"] = format_phone_series(tbl["phone"])
+    tbl["Location"] = proper_case_series(tbl["location"])
     tbl["Status"] = tbl["status"].fillna("")
     tbl["Assigned To"] = tbl["assigned_to"].fillna("")
     tbl["Next Follow-up"] = tbl["next_follow_up"].fillna("")
     tbl["Last Activity"] = tbl["last_activity"].fillna("")
 
-    def compute_fin(row):
-        q,i,r,o = calculate_customer_finances(row.get("client_name",""), row.get("phone",""))
-        return pd.Series({
-            "Total Quotations (AED)": q,
-            "Total Invoices (AED)": i,
-            "Total Paid (AED)": r,
-            "Remaining (AED)": o,
-        })
-
-    fin_cols = tbl.apply(compute_fin, axis=1)
-    for c in ["Total Quotations (AED)","Total Invoices (AED)","Total Paid (AED)","Remaining (AED)"]:
-        tbl[c] = fin_cols[c]
+    # All customers' totals in one pass over the records
+    fin = customer_finances(customers, records)
+    tbl["Total Quotations (AED)"] = fin["total_q"]
+    tbl["Total Invoices (AED)"] = fin["total_i"]
+    tbl["Total Paid (AED)"] = fin["total_r"]
+    tbl["Remaining (AED)"] = fin["outstanding"]
 
     # Apply filters
     if q:
         ql = q.strip().lower()
-        tbl = tbl[tbl.apply(lambda r: ql in str(r["Client Name"]).lower() or ql in str(r["Phone"]).lower(), axis=1)]
+        tbl = tbl[
+            tbl["Client Name"].astype(str).str.lower().str.contains(ql, regex=False)
+            | tbl["Phone"].astype(str).str.lower().str.contains(ql, regex=False)
+        ]
     if status_filter != "All":
         tbl = tbl[tbl["Status"].astype(str) == status_filter]
     if location_filter != "All":
@@ -267,7 +129,6 @@ def customers_app():
         new_next = st.date_input("Next Follow-up", value=datetime.today(), key="new_c_next") if _new_next_has else None
 
     if st.button("Add Customer"):
-        cust = load_customers()
         row = {
             "client_name": proper_case(new_name),
             "phone": new_phone,
@@ -280,8 +141,7 @@ def customers_app():
             "assigned_to": new_assigned,
             "last_activity": datetime.today().strftime('%Y-%m-%d'),
         }
-        cust = pd.concat([cust, pd.DataFrame([row])], ignore_index=True)
-        save_customers(cust)
+        insert_rows("customers", [row])
         st.success(f"Saved {proper_case(new_name)}")
         st.rerun()
 
@@ -289,12 +149,13 @@ def customers_app():
     st.markdown("---")
     st.markdown("<div class='section-title'>Customer Profile</div>", unsafe_allow_html=True)
     names = customers["client_name"].dropna().astype(str).tolist()
-    labels = {n: f"{proper_case(n)}  |  {phone_label_mask(customers[customers['client_name']==n]['phone'].iloc[0])}" for n in names}
+    first = customers.dropna(subset=["client_name"]).drop_duplicates("client_name")
+    labels = {str(n): f"{proper_case(n)}  |  {phone_label_mask(k)}" for n, k in zip(first["client_name"], first["phone_key"])}
     selected_name = st.selectbox("Open Profile", options=[""] + names, format_func=lambda v: labels.get(v, v))
 
     if selected_name:
         row = customers[customers["client_name"].astype(str) == selected_name].iloc[0]
-        total_q, total_i, total_r, outstanding = calculate_customer_finances(selected_name)
+        total_q, total_i, total_r, outstanding = (float(v) for v in fin.loc[row.name, ["total_q", "total_i", "total_r", "outstanding"]])
 
         cA, cB = st.columns([1,1])
         with cA:
@@ -312,14 +173,18 @@ def customers_app():
             b1, b2, b3 = st.columns(3)
             with b1:
                 if st.button("Edit Customer"):
+                    # Remember the version being edited; saving over a newer one is refused
                     st.session_state["_cust_editing"] = True
+                    st.session_state["_cust_edit_row"] = {ROW_ID: row[ROW_ID], "version": row["version"]}
             with b2:
                 if st.button("Delete Customer"):
-                    cust = load_customers()
-                    cust = cust[cust["client_name"].astype(str) != selected_name]
-                    save_customers(cust)
-                    st.success("Customer deleted")
-                    st.rerun()
+                    try:
+                        save_customers(deleted=customers[customers["client_name"].astype(str) == selected_name])
+                    except ConflictError as e:
+                        st.error(str(e))
+                    else:
+                        st.success("Customer deleted")
+                        st.rerun()
             with b3:
                 pass
 
@@ -372,7 +237,7 @@ def customers_app():
 
             # Activity timeline
             st.markdown("<div class='section-title' style='margin-top:14px'>Activity Timeline</div>", unsafe_allow_html=True)
-            client_rows = records[records["client_name"].astype(str).str.lower() == selected_name.lower()]
+            client_rows = get_record_index().for_client(selected_name)
             if client_rows.empty:
                 st.info("No activity recorded yet.")
             else:
@@ -402,19 +267,31 @@ def customers_app():
             e_notes = st.text_area("Notes", value=row.get('notes',''), height=80)
 
             if st.button("Save Changes"):
-                cust = load_customers()
-                idx = cust.index[cust["client_name"].astype(str) == selected_name][0]
-                cust.loc[idx, [
-                    "phone","location","email","status","notes","tags","next_follow_up","assigned_to","last_activity"
-                ]] = [
-                    e_phone, e_location, e_email, e_status, e_notes, e_tags,
-                    e_next.strftime('%Y-%m-%d') if _has_next and e_next is not None else "",
-                    e_assigned, datetime.today().strftime('%Y-%m-%d')
-                ]
-                save_customers(cust)
-                st.session_state["_cust_editing"] = False
-                st.success("Customer updated")
-                st.rerun()
+                edited = st.session_state.get("_cust_edit_row")
+                if not edited or edited[ROW_ID] != row[ROW_ID]:
+                    edited = {ROW_ID: row[ROW_ID], "version": row["version"]}
+                change = {
+                    **edited,
+                    "phone": e_phone,
+                    "location": e_location,
+                    "email": e_email,
+                    "status": e_status,
+                    "notes": e_notes,
+                    "tags": e_tags,
+                    "next_follow_up": e_next.strftime('%Y-%m-%d') if _has_next and e_next is not None else "",
+                    "assigned_to": e_assigned,
+                    "last_activity": datetime.today().strftime('%Y-%m-%d'),
+                }
+                try:
+                    save_customers(pd.DataFrame([change]))
+                except ConflictError as e:
+                    st.error(str(e))
+                else:
+                    st.session_state["_cust_editing"] = False
+                    st.session_state.pop("_cust_edit_row", None)
+                    st.success("Customer updated")
+                    st.rerun()
             if st.button("Cancel"):
                 st.session_state["_cust_editing"] = False
+                st.session_state.pop("_cust_edit_row", None)
                 st.rerun()
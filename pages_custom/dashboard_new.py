@@ -3,6 +3,8 @@ import streamlit as st
 import pandas as pd
 from datetime import datetime
 
+from utils.storage import load_records, load_customers, load_projects
+
 # Apple-style icon grid for dashboard header
 def _app_icon_grid():
     pass
@@ -93,21 +95,20 @@ def _metric(title, value, subtitle=None):
 def dashboard_new_app():
     _apply_dashboard_theme()
     _app_icon_grid()
-    # ربط البيانات مع Excel
-    def _load_or_empty(path, columns):
+    # ربط البيانات مع محرك التخزين
+    def _load_or_empty(loader, columns):
         try:
-            df = pd.read_excel(path)
-            df.columns = [c.strip().lower() for c in df.columns]
+            df = loader()
         except Exception:
             df = pd.DataFrame(columns=columns)
         return df
 
     records = _load_or_empty(
-        "data/records.xlsx",
+        load_records,
         ["base_id", "date", "type", "number", "amount", "client_name", "phone", "location", "note"],
     )
     customers = _load_or_empty(
-        "data/customers.xlsx",
+        load_customers,
         ["client_name", "phone", "location", "last_activity", "status"],
     )
 
@@ -135,17 +136,23 @@ def dashboard_new_app():
     st.markdown('<div class="section-title">Project Lifecycle Tracking</div>', unsafe_allow_html=True)
     st.markdown('<div class="table-wrap">', unsafe_allow_html=True)
     # English Project Lifecycle Table with icons
-    lifecycle_data = pd.DataFrame([
-        {"Base ID": "20251116-002", "Client": "Fahad Ahmed Mohammed", "Phone": "5292932", "Location": "Abu Dhabi - Al Shamkha", "Quotation": True, "Invoice": True, "Receipt": True, "Amount": 5639.93, "Balance": 5639.93, "Last Update": "2025-11-20 00:00:00"},
-        {"Base ID": "20251116-004", "Client": None, "Phone": None, "Location": "Abu Dhabi - Al Shamkha", "Quotation": True, "Invoice": False, "Receipt": False, "Amount": 0, "Balance": 0, "Last Update": "2025-11-16 00:00:00"},
-        {"Base ID": "20251116-012", "Client": None, "Phone": None, "Location": "Abu Dhabi - Al Shamkha", "Quotation": True, "Invoice": False, "Receipt": False, "Amount": 0, "Balance": 0, "Last Update": "2025-11-16 00:00:00"},
-        {"Base ID": "20251117-003", "Client": None, "Phone": None, "Location": "Abu Dhabi - Al Shamkha", "Quotation": True, "Invoice": False, "Receipt": False, "Amount": 0, "Balance": 0, "Last Update": "2025-11-17 00:00:00"},
-        {"Base ID": "20251118-002", "Client": None, "Phone": None, "Location": "Abu Dhabi - Al Shamkha", "Quotation": True, "Invoice": False, "Receipt": False, "Amount": 0, "Balance": 0, "Last Update": "2025-11-18 00:00:00"},
-        {"Base ID": "20251119-002", "Client": None, "Phone": None, "Location": "Abu Dhabi - Al Shamkha", "Quotation": True, "Invoice": False, "Receipt": False, "Amount": 0, "Balance": 0, "Last Update": "2025-11-19 00:00:00"},
-        {"Base ID": "20251120-003", "Client": None, "Phone": None, "Location": "Abu Dhabi - Al Shamkha", "Quotation": True, "Invoice": False, "Receipt": False, "Amount": 0, "Balance": 0, "Last Update": "2025-11-20 00:00:00"},
-        {"Base ID": "20251120-005", "Client": None, "Phone": None, "Location": "Abu Dhabi - Al Shamkha", "Quotation": True, "Invoice": False, "Receipt": False, "Amount": 0, "Balance": 0, "Last Update": "2025-11-20 00:00:00"},
-        {"Base ID": "20251120-007", "Client": "Fahad Ahmed", "Phone": None, "Location": "Abu Dhabi - Al Shamkha", "Quotation": True, "Invoice": True, "Receipt": False, "Amount": 0, "Balance": 0, "Last Update": "2025-11-20 00:00:00"},
-    ])
+    projects = _load_or_empty(load_projects, ["base_id", "client_name", "phone", "location",
+                                              "q_count", "i_count", "r_count", "invoiced", "paid",
+                                              "last_update", "balance"])
+    # The most recently updated projects, read from the projects table
+    recent = projects.sort_values("last_update", ascending=False, na_position="last").head(10)
+    lifecycle_data = pd.DataFrame({
+        "Base ID": recent["base_id"],
+        "Client": recent["client_name"],
+        "Phone": recent["phone"],
+        "Location": recent["location"],
+        "Quotation": recent["q_count"] > 0,
+        "Invoice": recent["i_count"] > 0,
+        "Receipt": recent["r_count"] > 0,
+        "Amount": recent["invoiced"].astype(float),
+        "Balance": recent["balance"].astype(float),
+        "Last Update": recent["last_update"],
+    })
     # تحويل القيم True/False إلى رموز
     for col in ["Quotation", "Invoice", "Receipt"]:
         lifecycle_data[col] = lifecycle_data[col].apply(lambda x: "<span style='font-size:22px;'>✅</span>" if x else "<span style='font-size:22px;'>❌</span>")
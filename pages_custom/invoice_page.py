@@ -1,50 +1,20 @@
 import streamlit as st
 import pandas as pd
 from datetime import datetime
-import os
-from docx import Document
-from io import BytesIO
-from docx.enum.text import WD_ALIGN_PARAGRAPH
-from docx.shared import Pt
 
+from utils.documents import INVOICE_TEMPLATE, document_totals, invoice_fields, render_invoice_docx
+from utils.exports import lazy_export, lazy_pdf_export, numbered_export
+from utils.jobs import submit as submit_job, report_progress, get_job, any_active
+from utils.normalize import format_phone_input, phone_label_mask, proper_case
+from utils.pdf_renderer import render_invoice_pdf
+from utils.record_index import get_record_index
+from utils.sequences import claim, mark_saved, next_invoice_no, reserve, signature, superseded
+from utils.storage import load_products
+from utils.typeahead import suggest_for_inputs
+from utils.write_behind import save_document
 
-def proper_case(text):
-    if not text:
-        return ""
-    try:
-        return text.title().strip()
-    except:
-        return text
-def invoice_app():
-    # Phone formatter (same logic as quotation)
-    def format_phone_input(raw_input):
-        if not raw_input:
-            return None
-        digits = ''.join(filter(str.isdigit, str(raw_input)))
-        if digits.startswith("0"):
-            digits = digits[1:]
-        if digits.startswith("5") and len(digits) == 9:
-            return f"+971 {digits[:2]} {digits[2:5]} {digits[5:]}"
-        return None
-    # Phone as 10-digit local (0502992932) for labels
-    def phone_flat10(raw_input):
-        if raw_input is None:
-            return ""
-        digits = ''.join(filter(str.isdigit, str(raw_input)))
-        if not digits:
-            return ""
-        if digits.startswith('971') and len(digits) >= 12 and digits[3] == '5':
-            return '0' + digits[3:12]
-        if len(digits) == 9 and digits.startswith('5'):
-            return '0' + digits
-        if len(digits) == 10 and digits.startswith('05'):
-            return digits
-        return digits[-10:]
-
-    def phone_label_mask(raw_input):
-        flat = phone_flat10(raw_input)
-        return f"{flat} xxxxxxxxxx" if flat else "xxxxxxxxxx"
 
+def invoice_app():
     # Page CSS (colors handled globally; keep geometry only)
     st.markdown("""
     <style>
@@ -71,110 +41,28 @@ def invoice_app():
 
     # ---------------- LOAD DATA ----------------
     try:
-        catalog = pd.read_excel("data/products.xlsx")
+        catalog = load_products()
     except:
         st.error("❌ Cannot load products.xlsx")
         return
 
-    # simple records list for quotations to pick from
-    def load_records():
-        try:
-            df = pd.read_excel("data/records.xlsx")
-            df.columns = [c.strip().lower() for c in df.columns]
-            return df
-        except:
-            return pd.DataFrame(columns=[
-                "base_id","date","type","number","amount","client_name","phone","location","note"
-            ])
-
-    def save_record(rec: dict):
-        df = load_records()
-        if not df.empty and {"type", "number"}.issubset(df.columns):
-            df = df[~((df["type"] == rec.get("type")) & (df["number"] == rec.get("number")))]
-        df = pd.concat([df, pd.DataFrame([rec])], ignore_index=True)
-        if {"type", "number"}.issubset(df.columns):
-            df = df.drop_duplicates(subset=["type", "number"], keep="last")
-        df.to_excel("data/records.xlsx", index=False)
-
-    # ---- Customers helpers (auto add/update) ----
-    def ensure_customers_file():
-        os.makedirs("data", exist_ok=True)
-        path = "data/customers.xlsx"
-        if not os.path.exists(path):
-            cols = [
-                "client_name","phone","location","email","status",
-                "notes","tags","next_follow_up","assigned_to","last_activity"
-            ]
-            pd.DataFrame(columns=cols).to_excel(path, index=False)
-
-    def load_customers():
-        ensure_customers_file()
-        try:
-            df = pd.read_excel("data/customers.xlsx")
-            df.columns = [c.strip().lower() for c in df.columns]
-            return df
-        except Exception:
-            return pd.DataFrame(columns=[
-                "client_name","phone","location","email","status",
-                "notes","tags","next_follow_up","assigned_to","last_activity"
-            ])
-
-    def save_customers(df: pd.DataFrame):
-        os.makedirs("data", exist_ok=True)
-        df.to_excel("data/customers.xlsx", index=False)
-
-    def _norm_phone(x: str):
-        digits = ''.join(filter(str.isdigit, str(x)))
-        if digits.startswith('971') and len(digits) >= 12 and digits[3] == '5':
-            return '0' + digits[3:12]
-        if len(digits) == 9 and digits.startswith('5'):
-            return '0' + digits
-        if len(digits) == 10 and digits.startswith('05'):
-            return digits
-        return digits[-10:]
-
-    def upsert_customer_from_invoice(name: str, phone: str, location: str):
+    def customer_from_invoice(name: str, phone: str, location: str):
         if not str(name).strip():
-            return
-        cdf = load_customers()
-        key = str(name).strip().lower()
-        idx = None
-        if not cdf.empty and "client_name" in cdf.columns:
-            m = cdf["client_name"].astype(str).str.strip().str.lower() == key
-            if m.any():
-                idx = m[m].index[0]
-            elif phone:
-                cdf_phone = cdf.get("phone", pd.Series([], dtype=str)).apply(_norm_phone)
-                target = _norm_phone(phone)
-                pm = cdf_phone == target
-                if pm.any():
-                    idx = pm[pm].index[0]
-        if idx is None:
-            new_row = {
+            return None
+        return {
+            "fields": {
                 "client_name": proper_case(name),
                 "phone": phone,
                 "location": proper_case(location),
-                "email": "",
-                "status": "Active",
-                "notes": "",
-                "tags": "",
-                "next_follow_up": "",
-                "assigned_to": "",
                 "last_activity": datetime.today().strftime('%Y-%m-%d'),
-            }
-            cdf = pd.concat([cdf, pd.DataFrame([new_row])], ignore_index=True)
-        else:
-            cdf.loc[idx, "client_name"] = proper_case(name)
-            if phone:
-                cdf.loc[idx, "phone"] = phone
-            if location:
-                cdf.loc[idx, "location"] = proper_case(location)
-            if not str(cdf.loc[idx, "status"]).strip():
-                cdf.loc[idx, "status"] = "Active"
-            cdf.loc[idx, "last_activity"] = datetime.today().strftime('%Y-%m-%d')
-        save_customers(cdf)
-    records = load_records()
-    quotes_df = records[records["type"] == "q"].copy()
+            },
+            "defaults": {
+                "email": "", "status": "Active", "notes": "", "tags": "",
+                "next_follow_up": "", "assigned_to": "",
+            },
+        }
+    rindex = get_record_index()
+    quotes_df = rindex.of_type("q")
 
     # ---------------- LAYOUT: SAME ROWS ----------------
     st.markdown("<div class='section-title'>Invoice Summary</div>", unsafe_allow_html=True)
@@ -182,7 +70,18 @@ def invoice_app():
     mode = st.radio("Invoice Creation Method", ["From Quotation", "New Invoice"], horizontal=True, key="inv_mode")
 
     today = datetime.today().strftime('%Y%m%d')
-    auto_no = f"INV-{today}-{str(len(records[records['type']=='i']) + 1).zfill(3)}"
+    # Provisional until the first download takes it; kept after saving until the invoice is edited
+    inv_sig = signature(
+        *(st.session_state.get(k) for k in (
+            "inv_mode", "q_select_inline", "inv_client", "quo_phone", "inv_loc",
+            "install_cost_inv", "disc_value_inv", "disc_percent_inv",
+        )),
+        st.session_state["invoice_table"].to_json() if "invoice_table" in st.session_state else None,
+    )
+    auto_no = reserve(st.session_state, "inv_reserved", f"invoice:{today}", next_invoice_no, inv_sig,
+                      lambda: next_invoice_no(peek=True))
+    if st.session_state.get("inv_no") != auto_no:
+        st.session_state["inv_no"] = auto_no
 
     # Prefill defaults from previously selected quotation (before rendering widgets)
     sel_default_name = ""
@@ -190,14 +89,11 @@ def invoice_app():
     sel_default_phone = ""
     if mode == "From Quotation":
         selected_q = st.session_state.get("q_select_inline", None)
-        if selected_q:
-            try:
-                q_prefill = records[records["number"] == selected_q].iloc[0]
-                sel_default_name = q_prefill.get("client_name", "")
-                sel_default_loc = q_prefill.get("location", "")
-                sel_default_phone = q_prefill.get("phone", "")
-            except Exception:
-                pass
+        q_prefill = rindex.by_number(selected_q, "q") if selected_q else None
+        if q_prefill is not None:
+            sel_default_name = q_prefill.get("client_name", "")
+            sel_default_loc = q_prefill.get("location", "")
+            sel_default_phone = q_prefill.get("phone", "")
     else:
         selected_q = None
 
@@ -206,13 +102,11 @@ def invoice_app():
         current_q = st.session_state.get("q_select_inline")
         last_q = st.session_state.get("_last_q_selected")
         if current_q and current_q != last_q:
-            try:
-                q_prefill = records[records["number"] == current_q].iloc[0]
+            q_prefill = rindex.by_number(current_q, "q")
+            if q_prefill is not None:
                 st.session_state["inv_client"] = q_prefill.get("client_name", "")
                 st.session_state["inv_loc"] = q_prefill.get("location", "")
                 st.session_state["inv_phone"] = q_prefill.get("phone", "")
-            except Exception:
-                pass
             st.session_state["_last_q_selected"] = current_q
             st.rerun()
 
@@ -221,7 +115,7 @@ def invoice_app():
     with r1c1:
         client_name = st.text_input("Client Name", value=sel_default_name, key="inv_client")
     with r1c2:
-        invoice_no = st.text_input("Invoice Number", auto_no, disabled=True, key="inv_no")
+        invoice_no = st.text_input("Invoice Number", disabled=True, key="inv_no")
 
     # UAE Locations (same as quotation)
     uae_locations = [
@@ -262,6 +156,20 @@ def invoice_app():
         "UAQ - Al Maidan","UAQ - Emirates City",
     ]
 
+    def customer_label(c):
+        if c is None:
+            return "Select to fill in name, phone and location"
+        return f"{c.client_name}  |  {c.phone_key or c.phone or '-'}  |  {c.location or '-'}"
+
+    def pick_customer():
+        c = st.session_state.get("inv_pick")
+        if c is not None:
+            st.session_state["inv_client"] = c.client_name
+            st.session_state["quo_phone"] = c.phone_key or c.phone
+            if c.location in uae_locations:
+                st.session_state["inv_loc"] = c.location
+        st.session_state["inv_pick"] = None
+
     # Row 2: Location | Select Quotation
     r2c1, r2c2 = st.columns(2)
     with r2c1:
@@ -294,7 +202,18 @@ def invoice_app():
         if client_phone:
             st.success(f" {client_phone}")
     with r3c2:
-        st.write("")  # keep grid aligned
+        # Existing customers matching the typed name or phone
+        suggestions = suggest_for_inputs(client_name, phone_raw) if mode == "New Invoice" else []
+        if suggestions:
+            st.selectbox(
+                "Existing customer",
+                options=[None] + suggestions,
+                format_func=customer_label,
+                key="inv_pick",
+                on_change=pick_customer,
+            )
+        else:
+            st.write("")  # keep grid aligned
 
     # ---------- ITEMS (same logic/visuals as Quotation) ----------
     if "invoice_table" not in st.session_state:
@@ -439,73 +358,81 @@ def invoice_app():
     # ======================================================
     #      SAVE + EXPORT WORD
     # ======================================================
-    def generate_word_invoice(template, data):
-        doc = Document(template)
-        for table in doc.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    for k, v in data.items():
-                        if k in cell.text:
-                            safe_v = "" if v is None else str(v)
-                            cell.text = cell.text.replace(k, safe_v)
-        buf = BytesIO()
-        doc.save(buf)
-        buf.seek(0)
-        return buf
-
     st.markdown("---")
     st.markdown('<div class="section-title">Export Invoice</div>', unsafe_allow_html=True)
 
     # Recalculate for download (same logic as UI summary)
     formatted_phone = format_phone_input(phone_raw) or phone_raw
-    product_total = st.session_state.invoice_table["Line Total (AED)"].sum()
+    line_items = st.session_state.invoice_table.to_dict("records")
     installation_cost = st.session_state.get("install_cost_inv_value", 0.0)
     discount_value = st.session_state.get("disc_value_inv_value", 0.0)
     discount_percent = st.session_state.get("disc_percent_inv_value", 0.0)
-    percent_value = (product_total + installation_cost) * (discount_percent / 100)
-    total_discount = percent_value + discount_value
-    grand_total = (product_total + installation_cost) - total_discount
-
-    data = {
-        "{{client_name}}": client_name,
-        "{{invoice_no}}": invoice_no,
-        "{{client_location}}": client_location,
-        "{{client_phone}}": formatted_phone,
-        "{{total_products}}": f"{product_total:,.2f}",
-        "{{installation}}": f"{installation_cost:,.2f}",
-        "{{discount_value}}": f"{discount_value:,.2f}",
-        "{{discount_percent}}": f"{discount_percent:,.0f}",
-        "{{grand_total}}": f"{grand_total:,.2f}",
-    }
+    grand_total = document_totals(line_items, installation_cost, discount_value, discount_percent)["grand_total"]
 
-    try:
-        word_file = generate_word_invoice("data/invoice_template.docx", data)
-
-        clicked = st.download_button(
-            label="Download Invoice (Word)",
-            data=word_file,
-            file_name=f"Invoice_{invoice_no}.docx"
+    def fields_for(number):
+        return invoice_fields(
+            number, client_name, formatted_phone, client_location,
+            line_items, installation_cost, discount_value, discount_percent,
         )
 
-        if clicked:
-            # Determine base_id linkage
-            base_id = None
-            if mode == "From Quotation":
-                try:
-                    q_row = records[records["number"] == st.session_state.get("q_select_inline")].iloc[0]
-                    base_id = q_row.get("base_id", None)
-                except Exception:
-                    base_id = None
-            if not base_id:
-                # Generate a new base id for standalone invoices
-                today_id = datetime.today().strftime('%Y%m%d')
-                same_day = records[records.get("base_id", "").astype(str).str.contains(today_id, na=False)] if not records.empty else pd.DataFrame()
-                seq = len(same_day) + 1
-                base_id = f"{today_id}-{str(seq).zfill(3)}"
-
-            try:
-                save_record({
-                    "base_id": base_id,
+    # The invoice number is only taken from the counter when the invoice is downloaded
+    held = st.session_state["inv_reserved"]
+    take_number = lambda: claim(held)
+
+    try:
+        # Rendered on click only, cached by content
+        word_file = numbered_export(take_number, lambda n: lazy_export(
+            INVOICE_TEMPLATE, fields_for(n), None, render_invoice_docx))
+        pdf_file = numbered_export(take_number, lambda n: lazy_pdf_export(
+            INVOICE_TEMPLATE, fields_for(n), line_items, render_invoice_docx, render_invoice_pdf))
+
+        export_cols = st.columns([1, 1])
+        with export_cols[0]:
+            clicked = st.download_button(
+                label="Download Invoice (Word)",
+                data=word_file,
+                file_name=f"Invoice_{invoice_no}.docx",
+                # Stable key: the number (and file name) can change on the click's rerun
+                key="inv_dl_word",
+                on_click=take_number,
+            )
+        with export_cols[1]:
+            clicked_pdf = st.download_button(
+                label="Download Invoice (PDF)",
+                data=pdf_file,
+                file_name=f"Invoice_{invoice_no}.pdf",
+                mime="application/pdf",
+                key="inv_dl_pdf",
+                on_click=take_number,
+            )
+
+        if clicked or clicked_pdf:
+            invoice_no = take_number()
+            taken = superseded(held)
+            if taken:
+                st.warning(f"⚠️ {taken} was taken by another user meanwhile, so this invoice is "
+                           f"{invoice_no}. Download it again for a file named after it.")
+            quote_no = st.session_state.get("q_select_inline") if mode == "From Quotation" else None
+
+            def persist_invoice(rec, client_name, phone_raw, client_location):
+                report_progress(0.2, "Saving record")
+                # Link to the quotation's project; a standalone invoice keeps the
+                # id of an earlier save, else starts a new project. The customer is
+                # added/updated so future quotations/invoices link to the same record
+                base_id = save_document(
+                    rec,
+                    customer=customer_from_invoice(client_name, phone_raw, client_location),
+                    base_from=[("q", quote_no), ("i", rec["number"])],
+                )
+                if not base_id:
+                    return "✅ Saved to records (project id assigned when written)"
+                return f"✅ Saved to records as base {base_id}"
+
+            # Saved in the background so the page stays responsive
+            job_id = submit_job(
+                f"Invoice {invoice_no}", persist_invoice,
+                {
+                    "base_id": None,
                     "date": datetime.today().strftime('%Y-%m-%d'),
                     "type": "i",
                     "number": invoice_no,
@@ -514,11 +441,35 @@ def invoice_app():
                     "phone": phone_raw,
                     "location": client_location,
                     "note": st.session_state.get("q_select_inline") or ""
-                })
-                # Auto-add/update the customer so future quotations/invoices link to same record
-                upsert_customer_from_invoice(client_name, phone_raw, client_location)
-                st.success(f"✅ Saved to records as base {base_id}")
-            except Exception as e:
-                st.warning(f"⚠️ Downloaded, but failed to save record: {e}")
+                },
+                client_name, phone_raw, client_location,
+                owner=st.session_state.get("user", {}).get("name", ""),
+            )
+            st.session_state.setdefault("inv_jobs", []).append(job_id)
+            mark_saved(st.session_state, "inv_reserved", inv_sig)
     except Exception as e:
         st.error(f"❌ Unable to generate Word file: {e}")
+
+    # ======================================================
+    #      BACKGROUND JOBS
+    # ======================================================
+    job_ids = st.session_state.get("inv_jobs", [])
+    polling = any_active(job_ids)
+
+    def show_jobs():
+        for job_id in job_ids[-3:]:
+            job = get_job(job_id)
+            if job is None:
+                continue
+            if job.active:
+                st.progress(job.progress, text=f"⏳ {job.name}: {job.message or 'queued'}")
+            elif job.error:
+                st.warning(f"⚠️ Downloaded, but failed to save record: {job.error}")
+            else:
+                st.success(job.result)
+        # Stop polling once everything has finished
+        if polling and not any_active(job_ids):
+            st.rerun()
+
+    if job_ids:
+        st.fragment(show_jobs, run_every=1 if polling else None)()
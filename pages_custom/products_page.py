@@ -12,53 +12,42 @@ from docx import Document
 from docx.shared import Pt, Cm
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 
+from utils.fileio import atomic_write
+from utils.normalize import proper_case, proper_case_series
 from utils.settings import load_settings
+from utils import exports, storage
 
 
 # ==========================================
 # DATA SETUP
 # ==========================================
-def ensure_product_file() -> Path:
-    os.makedirs("data", exist_ok=True)
-    products_path = Path("data/products.xlsx")
-    if not products_path.exists():
-        df = pd.DataFrame(
-            columns=["Device", "Description", "UnitPrice", "Warranty", "ImageBase64", "ImagePath"]
-        )
-        df.to_excel(products_path, index=False)
-    return products_path
-
-
-def proper_case(text):
-    if text is None:
-        return ""
-    try:
-        return str(text).strip().title()
-    except Exception:
-        return str(text)
+def ensure_product_file():
+    storage.init_storage()
 
 
 def load_products() -> pd.DataFrame:
     ensure_product_file()
     try:
-        df = pd.read_excel("data/products.xlsx")
-        for col in ["Device", "Description", "UnitPrice", "Warranty", "ImageBase64", "ImagePath"]:
-            if col not in df.columns:
-                df[col] = None
-        return df[["Device", "Description", "UnitPrice", "Warranty", "ImageBase64", "ImagePath"]]
+        return storage.load_products()
     except Exception:
         return pd.DataFrame(
             columns=["Device", "Description", "UnitPrice", "Warranty", "ImageBase64", "ImagePath"]
         )
 
 
-def save_products(df: pd.DataFrame):
-    os.makedirs("data", exist_ok=True)
-    for col in ["Device", "Description", "UnitPrice", "Warranty", "ImageBase64", "ImagePath"]:
-        if col not in df.columns:
-            df[col] = None
-    df = df[["Device", "Description", "UnitPrice", "Warranty", "ImageBase64", "ImagePath"]]
-    df.to_excel("data/products.xlsx", index=False)
+def save_products(changed: pd.DataFrame = None, deleted: pd.DataFrame = None) -> bool:
+    """Save only the added/edited/deleted rows; shows the conflict and returns False if stale."""
+    try:
+        storage.save_products(changed, deleted)
+        return True
+    except storage.ConflictError as e:
+        st.error(str(e))
+        return False
+
+
+def _row_key(row) -> dict:
+    """Id and version a product row was loaded with."""
+    return {storage.ROW_ID: row[storage.ROW_ID], "version": row["version"]}
 
 
 # ==========================================
@@ -148,7 +137,9 @@ def save_original_image(uploaded_file, device_name: str) -> str:
             img = img.convert("RGBA")
         else:
             img = img.convert("RGB")
-        img.save(out_path, format="PNG", optimize=True)
+        out = BytesIO()
+        img.save(out, format="PNG", optimize=True)
+        atomic_write(str(out_path), out.getvalue(), lock=False)
         return str(out_path)
     except Exception:
         return None
@@ -354,10 +345,9 @@ def products_app():
                             "ImageBase64": img_b64,
                             "ImagePath": img_path,
                         }
-                        new_df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
-                        save_products(new_df)
-                        st.success("Product added")
-                        st.rerun()
+                        if save_products(pd.DataFrame([new_row])):
+                            st.success("Product added")
+                            st.rerun()
             with ac2:
                 if st.button("Reset Form"):
                     st.session_state["_a_dev"] = ""
@@ -504,31 +494,24 @@ def products_app():
                                         img_upload.seek(0)
                                         new_img_path = save_original_image(img_upload, proper_case(edit_device))
 
-                                    df.loc[
-                                        original_idx,
-                                        [
-                                            "Device",
-                                            "Description",
-                                            "UnitPrice",
-                                            "Warranty",
-                                            "ImageBase64",
-                                            "ImagePath",
-                                        ],
-                                    ] = [
-                                        proper_case(edit_device),
-                                        edit_desc,
-                                        edit_price,
-                                        edit_warranty,
-                                        new_img_b64,
-                                        new_img_path,
-                                    ]
-                                    save_products(df)
-                                    st.session_state.pop("_prod_edit_idx", None)
-                                    st.success("Product updated")
-                                    st.rerun()
+                                    change = {
+                                        **st.session_state.get("_prod_edit_row", _row_key(row)),
+                                        "Device": proper_case(edit_device),
+                                        "Description": edit_desc,
+                                        "UnitPrice": edit_price,
+                                        "Warranty": edit_warranty,
+                                        "ImageBase64": new_img_b64,
+                                        "ImagePath": new_img_path,
+                                    }
+                                    if save_products(pd.DataFrame([change])):
+                                        st.session_state.pop("_prod_edit_idx", None)
+                                        st.session_state.pop("_prod_edit_row", None)
+                                        st.success("Product updated")
+                                        st.rerun()
                     with c2:
                         if st.button("Cancel", key=f"cancel_{display_idx}", help="Cancel"):
                             st.session_state.pop("_prod_edit_idx", None)
+                            st.session_state.pop("_prod_edit_row", None)
                             st.rerun()
             else:
                 with dcol[0]:
@@ -569,10 +552,12 @@ def products_app():
                     with c1:
                         if st.button("Edit", key=f"edit_{display_idx}"):
                             st.session_state["_prod_edit_idx"] = original_idx
+                            st.session_state["_prod_edit_row"] = _row_key(row)
                             st.rerun()
                     with c2:
                         if st.button("Delete", key=f"del_{display_idx}"):
                             st.session_state["_prod_delete_idx"] = int(original_idx)
+                            st.session_state["_prod_delete_row"] = _row_key(row)
                             st.session_state["_prod_mode"] = "confirm_delete"
                             st.rerun()
 
@@ -584,15 +569,17 @@ def products_app():
             cdel1, cdel2 = st.columns(2)
             with cdel1:
                 if st.button("Yes, Delete"):
-                    new_df = df.drop(df.index[del_idx]).reset_index(drop=True)
-                    save_products(new_df)
-                    st.success("Product deleted")
-                    st.session_state.pop("_prod_delete_idx", None)
-                    st.session_state.pop("_prod_mode", None)
-                    st.rerun()
+                    target = st.session_state.get("_prod_delete_row", _row_key(df.iloc[del_idx]))
+                    if save_products(deleted=pd.DataFrame([target])):
+                        st.success("Product deleted")
+                        st.session_state.pop("_prod_delete_idx", None)
+                        st.session_state.pop("_prod_delete_row", None)
+                        st.session_state.pop("_prod_mode", None)
+                        st.rerun()
             with cdel2:
                 if st.button("Cancel"):
                     st.session_state.pop("_prod_delete_idx", None)
+                    st.session_state.pop("_prod_delete_row", None)
                     st.session_state.pop("_prod_mode", None)
                     st.rerun()
 
@@ -612,14 +599,15 @@ def products_app():
     st.markdown("---")
     st.markdown("<div class='section-title'>Import / Export</div>", unsafe_allow_html=True)
 
-    buf = BytesIO()
-    fdf[["Device", "Description", "UnitPrice", "Warranty", "ImageBase64", "ImagePath"]].to_excel(
-        buf, index=False
-    )
-    buf.seek(0)
+    # Built on click only, streamed row by row and reused until products change
+    export_cols = ["Device", "Description", "UnitPrice", "Warranty", "ImageBase64", "ImagePath"]
+    export_df = fdf[export_cols]
     st.download_button(
         "Download Products (Excel)",
-        data=buf,
+        data=exports.lazy_data_export(
+            ("products_export", storage.table_version("products"), q_text, only_with_images),
+            lambda: exports.xlsx_bytes(export_cols, exports.frame_rows(export_df)),
+        ),
         file_name=f"products_export_{datetime.today().strftime('%Y%m%d')}.xlsx",
     )
 
@@ -639,9 +627,10 @@ def products_app():
             ic1, ic2 = st.columns(2)
             with ic1:
                 if st.button("Confirm Replace"):
-                    imp["Device"] = imp["Device"].apply(proper_case)
-                    save_products(
-                        imp[["Device", "Description", "UnitPrice", "Warranty", "ImageBase64"]]
+                    imp["Device"] = proper_case_series(imp["Device"])
+                    storage.replace_table(
+                        "products",
+                        imp[["Device", "Description", "UnitPrice", "Warranty", "ImageBase64"]],
                     )
                     st.success("Products replaced from upload.")
                     st.rerun()
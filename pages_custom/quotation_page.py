@@ -2,28 +2,20 @@ import streamlit as st
 import pandas as pd
 from datetime import datetime
 import os
-from docx import Document
-from io import BytesIO
-from docx.enum.text import WD_ALIGN_PARAGRAPH
-from docx.shared import Pt, Cm
-import requests
-import base64
-import tempfile
-from streamlit.components.v1 import html as st_html
-import convertapi
-from pathlib import Path
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
-from utils.logger import log_event
 from utils.settings import load_settings
-
-def proper_case(text):
-    if not text:
-        return ""
-    try:
-        return text.title().strip()
-    except:
-        return text
+from utils.documents import (
+    QUOTATION_TEMPLATE, attach_product_images, document_totals, quotation_fields, render_quotation_docx
+)
+from utils.exports import lazy_export, lazy_pdf_export, numbered_export
+from utils.jobs import submit as submit_job, report_progress, get_job, any_active
+from utils.normalize import format_phone_input, proper_case
+from utils.pdf_renderer import render_quotation_pdf
+from utils.sequences import claim, mark_saved, next_quote_no, reserve, signature, superseded
+from utils.storage import load_products
+from utils.typeahead import suggest_for_inputs
+from utils.write_behind import save_document
 
 # Apply the same visual theme used in dashboard_page.py
 def _apply_quotation_theme():
@@ -42,16 +34,6 @@ def quotation_app():
 
         # (Header hero removed to match invoice page)
 
-    # =========================
-    # Helper
-    # =========================
-    def format_phone_input(raw_input):
-        digits = ''.join(filter(str.isdigit, raw_input))
-        if digits.startswith("0"): digits = digits[1:]
-        if digits.startswith("5") and len(digits) == 9:
-            return f"+971 {digits[:2]} {digits[2:5]} {digits[5:]}"
-        return None
-
     # =========================
     # UAE Locations
     # =========================
@@ -97,115 +79,47 @@ def quotation_app():
     # Setup
     # =========================
     try:
-        catalog = pd.read_excel("data/products.xlsx")
+        catalog = load_products()
     except:
         st.error("❌ ERROR: Cannot load product catalog")
         return
 
     required_cols = ["Device", "Description", "UnitPrice", "Warranty"]
     for col in required_cols:
-            cols = st.columns([4,0.7,1,1,0.9,0.7])
+        if col not in catalog.columns:
             st.error(f"❌ Missing column: {col}")
             return
 
-    # Records helpers (match invoice logic)
-    def load_records():
-        try:
-            df = pd.read_excel("data/records.xlsx")
-            df.columns = [c.strip().lower() for c in df.columns]
-            return df
-        except:
-            return pd.DataFrame(columns=[
-                "base_id","date","type","number","amount","client_name","phone","location","note"
-            ])
-
-    def save_record(rec: dict):
-        df = load_records()
-        if not df.empty and {"type", "number"}.issubset(df.columns):
-            df = df[~((df["type"] == rec.get("type")) & (df["number"] == rec.get("number")))]
-        df = pd.concat([df, pd.DataFrame([rec])], ignore_index=True)
-        if {"type", "number"}.issubset(df.columns):
-            df = df.drop_duplicates(subset=["type", "number"], keep="last")
-        df.to_excel("data/records.xlsx", index=False)
-
-    # Customers helpers (auto add from quotation)
-    def ensure_customers_file():
-        os.makedirs("data", exist_ok=True)
-        path = "data/customers.xlsx"
-        if not os.path.exists(path):
-            cols = [
-                "client_name","phone","location","email","status",
-                "notes","tags","next_follow_up","assigned_to","last_activity"
-        cols = st.columns([4,0.7,1,1,0.9,0.7])
-            pd.DataFrame(columns=cols).to_excel(path, index=False)
-
-    def load_customers():
-        ensure_customers_file()
-        try:
-            df = pd.read_excel("data/customers.xlsx")
-            df.columns = [c.strip().lower() for c in df.columns]
-            return df
-        except:
-            return pd.DataFrame(columns=[
-                "client_name","phone","location","email","status",
-                "notes","tags","next_follow_up","assigned_to","last_activity"
-            ])
-
-    def save_customers(df: pd.DataFrame):
-        os.makedirs("data", exist_ok=True)
-        df.to_excel("data/customers.xlsx", index=False)
-
-    def upsert_customer_from_quotation(name: str, phone: str, location: str):
+    def customer_from_quotation(name: str, phone: str, location: str):
         if not str(name).strip():
-            return
-        ensure_customers_file()
-        cdf = load_customers()
-        key = str(name).strip().lower()
-        exists = None
-        if not cdf.empty and "client_name" in cdf.columns:
-            m = cdf["client_name"].astype(str).str.strip().str.lower() == key
-            if m.any():
-                exists = cdf[m].index[0]
-            else:
-                # Try phone-based matching when names differ
-                cdf_phone = cdf.get("phone", pd.Series([], dtype=str)).apply(lambda x: x if pd.isna(x) else str(x))
-                try_phone = phone
-                def norm(x):
-                    digits = ''.join(filter(str.isdigit, str(x)))
-                    if digits.startswith('971') and len(digits) >= 12 and digits[3] == '5':
-                        return '0' + digits[3:12]
-                    if len(digits) == 9 and digits.startswith('5'):
-                        return '0' + digits
-                    if len(digits) == 10 and digits.startswith('05'):
-                        return digits
-                    return digits[-10:]
-                if try_phone:
-                    m2 = cdf_phone.apply(norm) == norm(try_phone)
-                    if m2.any():
-                        exists = cdf[m2].index[0]
-        if exists is None:
-            new_row = {
+            return None
+        # Quotation marks engagement start; an existing status is kept
+        return {
+            "fields": {
                 "client_name": proper_case(name),
                 "phone": phone,
                 "location": proper_case(location),
-                "email": "",
-                "status": "New",
-                "notes": "",
-                "tags": "",
-                "next_follow_up": "",
-                "assigned_to": "",
                 "last_activity": datetime.today().strftime('%Y-%m-%d'),
-            }
-            cdf = pd.concat([cdf, pd.DataFrame([new_row])], ignore_index=True)
-        else:
-            # Update phone/location/last_activity for existing
-            cdf.loc[exists, "client_name"] = proper_case(name)
-            cdf.loc[exists, "phone"] = phone or cdf.loc[exists, "phone"]
-            cdf.loc[exists, "location"] = proper_case(location) or cdf.loc[exists, "location"]
-            # Quotation marks engagement start; keep status if set
-            cdf.loc[exists, "status"] = cdf.loc[exists, "status"] or "New"
-            cdf.loc[exists, "last_activity"] = datetime.today().strftime('%Y-%m-%d')
-        save_customers(cdf)
+            },
+            "defaults": {
+                "email": "", "status": "New", "notes": "", "tags": "",
+                "next_follow_up": "", "assigned_to": "",
+            },
+        }
+
+    def customer_label(c):
+        if c is None:
+            return "Select to fill in name, phone and location"
+        return f"{c.client_name}  |  {c.phone_key or c.phone or '-'}  |  {c.location or '-'}"
+
+    def pick_customer():
+        c = st.session_state.get("quo_pick")
+        if c is not None:
+            st.session_state["quo_client_name"] = c.client_name
+            st.session_state["quo_phone"] = c.phone_key or c.phone
+            if c.location in uae_locations:
+                st.session_state["quo_loc"] = c.location
+        st.session_state["quo_pick"] = None
 
     if "product_table" not in st.session_state:
         st.session_state.product_table = pd.DataFrame(columns=[
@@ -231,10 +145,32 @@ def quotation_app():
         if client_phone:
             st.success(f" {client_phone}")
 
+        suggestions = suggest_for_inputs(raw_name, phone_raw)
+        if suggestions:
+            st.selectbox(
+                "Existing customer",
+                options=[None] + suggestions,
+                format_func=customer_label,
+                key="quo_pick",
+                on_change=pick_customer,
+            )
+
     with c2:
         today = datetime.today().strftime('%Y%m%d')
-        auto_quote = f"QUO-{today}-{len(st.session_state.product_table)+1:03d}"
-        quote_no = st.text_input("Quotation No", value=auto_quote, key="quo_no")
+        # Provisional until the first download takes it; kept after saving until the quotation is edited
+        quo_sig = signature(
+            *(st.session_state.get(k) for k in (
+                "quo_client_name", "quo_phone", "quo_loc", "quo_prepared", "quo_approved",
+                "install_cost_quo", "disc_value_quo", "disc_percent_quo",
+            )),
+            st.session_state.product_table.to_json(),
+        )
+        auto_quote = reserve(st.session_state, "quo_reserved", f"quotation:{today}", next_quote_no, quo_sig,
+                             lambda: next_quote_no(peek=True))
+        if st.session_state.get("quo_no_for") != auto_quote:
+            st.session_state["quo_no"] = auto_quote
+            st.session_state["quo_no_for"] = auto_quote
+        quote_no = st.text_input("Quotation No", key="quo_no")
 
         prepared_by = proper_case(st.text_input("Prepared By", value="Mr Bukhari", key="quo_prepared"))
         approved_by = proper_case(st.text_input("Approved By", value="Mr Mohammed", key="quo_approved"))
@@ -445,180 +381,6 @@ def quotation_app():
             discount_percent = st.number_input("Discount %", min_value=0.0, max_value=100.0, key="disc_percent_quo")
             st.session_state["disc_percent_quo_value"] = discount_percent
 
-    # =========================
-    # EXPORT HELPERS (on-click only)
-    # =========================
-    def generate_word_file(data: dict) -> BytesIO:
-        doc = Document("data/quotation_template.docx")
-
-        # قراءة أبعاد الصور من الإعدادات (سم)
-        _s = load_settings()
-        _wcm = float(_s.get("quote_product_image_width_cm", 3.49))
-        _hcm = float(_s.get("quote_product_image_height_cm", 1.5))
-
-        # خريطة أسماء المنتجات إلى صورة Base64 أو مسارها الأصلي (إن وُجدت)
-        image_map = {}
-        image_path_map = {}
-        try:
-            if 'ImageBase64' in catalog.columns:
-                image_map = dict(zip(catalog['Device'].astype(str), catalog['ImageBase64']))
-            if 'ImagePath' in catalog.columns:
-                image_path_map = dict(zip(catalog['Device'].astype(str), catalog['ImagePath']))
-        except Exception:
-            image_map = {}
-            image_path_map = {}
-
-        def insert_image_in_cell(cell, b64_str: str, width_cm: float, height_cm: float, img_path: str = None):
-            try:
-                bio = None
-                if img_path and os.path.exists(img_path):
-                    with open(img_path, "rb") as f:
-                        bio = BytesIO(f.read())
-                elif b64_str and not pd.isna(b64_str):
-                    img_bytes = base64.b64decode(b64_str)
-                    bio = BytesIO(img_bytes)
-                if bio is None:
-                    return False
-                # تفريغ محتوى الخلية ثم إدراج الصورة في فقرة محاذاة للوسط
-                cell.text = ""
-                p = cell.paragraphs[0] if cell.paragraphs else cell.add_paragraph("")
-                p.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                run = p.add_run()
-                run.add_picture(bio, width=Cm(width_cm), height=Cm(height_cm))
-                return True
-            except Exception:
-                return False
-
-        def format_cell(cell, font_name, font_size, align):
-            for paragraph in cell.paragraphs:
-                paragraph.alignment = align
-                for run in paragraph.runs:
-                    run.font.name = font_name
-                    run.font.size = Pt(font_size)
-
-        for table in doc.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    old = cell.text
-                    new = old
-                    for key, val in data.items():
-                        new = new.replace(key, "" if val is None else str(val))
-                    if old != new:
-                        cell.text = new
-                        # إذا كانت الخلية تحتوي على قيمة QTY بعد الاستبدال، اجعل المحاذاة Center
-                        if "{{QTY}}" in old or (str(data.get("{{QTY}}")) in new and "QTY" in old):
-                            format_cell(cell, "Times New Roman (Headings CS)", 10, WD_ALIGN_PARAGRAPH.CENTER)
-                        else:
-                            format_cell(cell, "Times New Roman (Headings CS)", 10, WD_ALIGN_PARAGRAPH.LEFT)
-
-        # Insert products from session state
-        products = st.session_state.product_table.to_dict("records") if "product_table" in st.session_state else []
-
-        target_table = None
-        for table in doc.tables:
-            try:
-                if table.cell(0, 0).text.strip().lower() in ["item no", "item no."]:
-                    target_table = table
-                    break
-            except Exception:
-                continue
-        if not target_table:
-            raise Exception("❌ Product table not found")
-
-        start_row = 1
-        last_index = None
-        for idx, row in enumerate(target_table.rows):
-            if row.cells[0].text.strip().lower() == "last":
-                last_index = idx
-                break
-        if last_index is None:
-            raise Exception("❌ 'last' row missing in Word template")
-
-        for i, product in enumerate(products):
-            row_index = start_row + i
-            if row_index >= last_index:
-                break
-            row = target_table.rows[row_index]
-            row.cells[0].text = str(product.get("Item No", i + 1))
-            # إدراج الصورة في عمود المنتج إن وُجدت، وإلا نكتب الاسم نصياً
-            prod_name = str(product.get("Product / Device", ""))
-            b64_img = image_map.get(prod_name)
-            img_path = image_path_map.get(prod_name)
-            placed = insert_image_in_cell(row.cells[1], b64_img, _wcm, _hcm, img_path)
-            if not placed:
-                row.cells[1].text = prod_name
-            row.cells[2].text = str(product.get("Description", ""))
-            row.cells[3].text = str(product.get("Qty", ""))
-            row.cells[4].text = f"{float(product.get('Unit Price (AED)', 0)):,.2f}"
-            row.cells[5].text = f"{float(product.get('Line Total (AED)', 0)):,.2f}"
-            row.cells[6].text = str(product.get("Warranty (Years)", ""))
-            for cell in row.cells:
-                format_cell(cell, "Arial MT", 9, WD_ALIGN_PARAGRAPH.CENTER)
-
-        # حذف الصفوف الفارغة بعد المنتجات وأيضاً صف 'last' نفسه
-        delete_start = start_row + len(products)
-        for j in range(last_index, delete_start - 1, -1):
-            row = target_table.rows[j]
-            target_table._tbl.remove(row._tr)
-
-        buffer = BytesIO()
-        doc.save(buffer)
-        buffer.seek(0)
-        return buffer
-
-    def convert_to_pdf(word_buffer: BytesIO) -> bytes:
-        # Use official ConvertAPI SDK; write temp DOCX then convert
-        convertapi.api_credentials = 'kbUBO3z9214I9rxEoRQwhkProocqlwJD'
-        with tempfile.TemporaryDirectory() as tmpdir:
-            docx_path = os.path.join(tmpdir, 'quotation.docx')
-            with open(docx_path, 'wb') as f:
-                f.write(word_buffer.getvalue())
-            result = convertapi.convert(
-                'pdf',
-                {
-                    'File': docx_path,
-                    'FileName': 'quotation'
-                },
-                from_format='docx'
-            )
-            saved = result.save_files(tmpdir)
-            if not saved:
-                raise Exception('ConvertAPI returned no files')
-            pdf_path = saved[0]
-            with open(pdf_path, 'rb') as pf:
-                return pf.read()
-
-    def _auto_download(data_bytes: bytes, filename: str, mime: str):
-        b64 = base64.b64encode(data_bytes).decode('utf-8')
-        # Visible fallback link (in case browser blocks auto-download)
-        st.markdown(f"If the download doesn't start, click here: [Download {filename}](data:{mime};base64,{b64})", unsafe_allow_html=True)
-        st_html(f"""
-            <script>
-            (function(){{
-              const b64 = '{b64}';
-              const mime = '{mime}';
-              const fname = '{filename}'.replace(/[^\w\-\./]/g,'_');
-              const byteChars = atob(b64);
-              const byteNumbers = new Array(byteChars.length);
-              for (let i = 0; i < byteChars.length; i++) byteNumbers[i] = byteChars.charCodeAt(i);
-              const byteArray = new Uint8Array(byteNumbers);
-              const blob = new Blob([byteArray], {{type: mime}});
-              const url = URL.createObjectURL(blob);
-              const a = document.createElement('a');
-              a.href = url; a.download = fname; document.body.appendChild(a); a.click();
-              setTimeout(()=>{{ URL.revokeObjectURL(url); a.remove(); }}, 1000);
-            }})();
-            </script>
-        """, height=0)
-
-    def _save_export_locally(data_bytes: bytes, filename: str) -> str:
-        out_dir = Path('data') / 'exports'
-        out_dir.mkdir(parents=True, exist_ok=True)
-        out_path = out_dir / filename
-        with open(out_path, 'wb') as f:
-            f.write(data_bytes)
-        return str(out_path)
-
     st.markdown("---")
     st.markdown('<div class="section-title">Export Quotation</div>', unsafe_allow_html=True)
 
@@ -642,93 +404,136 @@ def quotation_app():
     )
 
     # Recalculate using the Installation & Discount values (to mirror invoice)
-    product_total = st.session_state.product_table["Line Total (AED)"].sum() if not st.session_state.product_table.empty else 0.0
+    line_items = st.session_state.product_table.to_dict("records")
     installation_cost_val = st.session_state.get("install_cost_quo_value", 0.0)
     discount_value_val = st.session_state.get("disc_value_quo_value", 0.0)
     discount_percent_val = st.session_state.get("disc_percent_quo_value", 0.0)
-    percent_value = (product_total + installation_cost_val) * (discount_percent_val / 100)
-    total_discount = percent_value + discount_value_val
-    grand_total = (product_total + installation_cost_val) - total_discount
-
-    qty_sum = (
-        st.session_state.product_table["Qty"].sum()
-        if not st.session_state.product_table.empty
-        else 0
+    grand_total = document_totals(
+        line_items, installation_cost_val, discount_value_val, discount_percent_val
+    )["grand_total"]
+
+    def fields_for(number):
+        return quotation_fields(
+            number, client_name, client_phone, client_location, prepared_by, approved_by,
+            line_items, installation_cost_val, discount_value_val, discount_percent_val,
+        )
+
+    # An automatic number is only taken from the counter when the quotation is downloaded
+    held = st.session_state["quo_reserved"]
+    take_number = (lambda: claim(held)) if quote_no == auto_quote else (lambda: quote_no)
+
+    # قراءة أبعاد الصور من الإعدادات (سم)
+    _s = load_settings()
+    # Line items with their product images, so they can be hashed for the export cache
+    export_items = attach_product_images(
+        line_items, catalog,
+        float(_s.get("quote_product_image_width_cm", 3.49)),
+        float(_s.get("quote_product_image_height_cm", 1.5)),
     )
 
-    data_to_fill = {
-        "{{client_name}}": client_name,
-        "{{quote_no}}": quote_no,
-        "{{client_location}}": client_location,
-        "{{prepared_by}}": prepared_by,
-        "{{client_phone}}": client_phone or "N/A",
-        "{{approved_by}}": approved_by,
-        "{{client_email}}": "N/A",
-        # Quotation template keys
-        "{{total1}}": f"{product_total:,.2f}",
-        "{{installation_cost}}": f"{installation_cost_val:,.2f}",
-        "{{Price}}": f"{product_total:,.2f}",
-        "{{Total}}": f"{grand_total:,.2f}",
-        "{{QTY}}": qty_sum,
-        # Extra keys (no-op if not present in template)
-        "{{discount_value}}": f"{discount_value_val:,.2f}",
-        "{{discount_percent}}": f"{discount_percent_val:,.0f}",
-        "{{total_discount}}": f"{total_discount:,.2f}",
-        "{{grand_total}}": f"{grand_total:,.2f}",
-    }
+    quotation_template = QUOTATION_TEMPLATE
 
     # زرّان بجانب بعض: تحميل Word وPDF في نفس الصف
     try:
-        word_ready = generate_word_file(data_to_fill)
+        # The document is only rendered when the button is clicked (and cached by content)
+        word_ready = numbered_export(take_number, lambda n: lazy_export(
+            quotation_template, fields_for(n), export_items, render_quotation_docx))
+        # reportlab, or the soffice pool when pdf_engine is "office" (Settings)
+        pdf_file = numbered_export(take_number, lambda n: lazy_pdf_export(
+            quotation_template, fields_for(n), export_items, render_quotation_docx, render_quotation_pdf))
         export_cols = st.columns([1,1])
-        pdf_ready = st.session_state.get("pdf_ready_quo")
+        pdf_ready = st.session_state.get("pdf_ready_quo") == quote_no
         clicked_word = None
         with export_cols[0]:
             clicked_word = st.download_button(
                 label="Download Word",
-                data=word_ready.getvalue(),
+                data=word_ready,
                 file_name=f"Quotation_{client_name}_{quote_no}.docx",
                 mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                key=f"dl_word_{quote_no}"
+                # Stable key: the number (and file name) can change on the click's rerun
+                key="dl_word_quo",
+                on_click=take_number,
             )
         if clicked_word:
-            # حفظ السجل وتحديث العملاء
-            today_id = datetime.today().strftime('%Y%m%d')
-            existing = load_records()
-            if not existing.empty and "base_id" in existing.columns:
-                same_day = existing[existing.get("base_id", "").astype(str).str.contains(today_id, na=False)]
-                seq = len(same_day) + 1
-            else:
-                seq = 1
-            base_id = f"{today_id}-{str(seq).zfill(3)}"
-            save_record({
-                "base_id": base_id,
-                "date": datetime.today().strftime('%Y-%m-%d'),
-                "type": "q",
-                "number": quote_no,
-                "amount": grand_total,
-                "client_name": client_name,
-                "phone": phone_raw,
-                "location": client_location,
-                "note": ""
-            })
-            upsert_customer_from_quotation(client_name, phone_raw, client_location)
+            quote_no = take_number()
+            taken = superseded(held)
+            if taken:
+                st.warning(f"⚠️ {taken} was taken by another user meanwhile, so this quotation is "
+                           f"{quote_no}. Download it again for a file named after it.")
+            # حفظ السجل وتحديث العملاء في الخلفية حتى لا تتجمد الصفحة
             user = st.session_state.get("user", {})
-            log_event(user.get("name", "Unknown"), "Quotation", "quotation_created", 
-                     f"Client: {client_name}, Amount: {grand_total}")
-            st.success(f"✅ Saved quotation to records with base {base_id}")
-            # توليد PDF بعد نجاح تحميل Word وتخزينه في session_state
-            pdf_ready = convert_to_pdf(word_ready)
-            st.session_state["pdf_ready_quo"] = pdf_ready
+            user_name = user.get("name", "Unknown")
+
+            def persist_quotation(quote_no, grand_total, client_name, phone_raw, client_location, user_name):
+                report_progress(0.1, "Saving record")
+                # Record, project id, customer and log entry are saved together;
+                # saving the same quotation again keeps its project id
+                base_id = save_document(
+                    {
+                        "date": datetime.today().strftime('%Y-%m-%d'),
+                        "type": "q",
+                        "number": quote_no,
+                        "amount": grand_total,
+                        "client_name": client_name,
+                        "phone": phone_raw,
+                        "location": client_location,
+                        "note": ""
+                    },
+                    customer=customer_from_quotation(client_name, phone_raw, client_location),
+                    logs=[(user_name, "Quotation", "quotation_created",
+                           f"Client: {client_name}, Amount: {grand_total}")],
+                    base_from=[("q", quote_no)],
+                )
+                # تجهيز ملف PDF مسبقاً ليكون التحميل فورياً
+                report_progress(0.6, "Preparing PDF")
+                pdf_file()
+                if not base_id:
+                    return "✅ Saved quotation to records (project id assigned when written)"
+                return f"✅ Saved quotation to records with base {base_id}"
+
+            job_id = submit_job(
+                f"Quotation {quote_no}", persist_quotation,
+                quote_no, grand_total, client_name, phone_raw, client_location, user_name,
+                owner=user_name,
+            )
+            st.session_state.setdefault("quo_jobs", []).append(job_id)
+            mark_saved(st.session_state, "quo_reserved", quo_sig)
+            # إظهار زر PDF بعد تحميل Word
+            pdf_ready = True
+            st.session_state["pdf_ready_quo"] = quote_no
         with export_cols[1]:
             if pdf_ready:
                 st.download_button(
                     label="Download PDF",
-                    data=pdf_ready,
+                    data=pdf_file,
                     file_name=f"Quotation_{client_name}_{quote_no}.pdf",
                     mime="application/pdf",
-                    key=f"dl_pdf_after_word_{quote_no}"
+                    key="dl_pdf_after_word_quo"
                 )
     except Exception as e:
         st.error(f"❌ Unable to prepare Word/PDF file: {e}")
 
+    # =========================
+    # BACKGROUND JOBS (save + PDF)
+    # =========================
+    job_ids = st.session_state.get("quo_jobs", [])
+    polling = any_active(job_ids)
+
+    def show_jobs():
+        for job_id in job_ids[-3:]:
+            job = get_job(job_id)
+            if job is None:
+                continue
+            if job.active:
+                st.progress(job.progress, text=f"⏳ {job.name}: {job.message or 'queued'}")
+            elif job.error:
+                st.error(f"❌ {job.name} failed: {job.error}")
+            else:
+                st.success(job.result)
+        # Stop polling once everything has finished
+        if polling and not any_active(job_ids):
+            st.rerun()
+
+    if job_ids:
+        st.fragment(show_jobs, run_every=1 if polling else None)()
+
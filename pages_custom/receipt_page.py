@@ -1,87 +1,17 @@
 import streamlit as st
-import pandas as pd
 from datetime import datetime
-from docx import Document
-from io import BytesIO
 
+from utils.documents import RECEIPT_TEMPLATE, receipt_fields, receipt_signature, render_receipt_docx
+from utils.exports import lazy_export, lazy_pdf_export, numbered_export
+from utils.jobs import submit as submit_job, get_job, any_active
+from utils.normalize import format_phone_input, phone_label_mask, proper_case
+from utils.pdf_renderer import render_receipt_pdf
+from utils.record_index import get_record_index
+from utils.sequences import claim, mark_saved, next_receipt_no, reserve, superseded
+from utils.write_behind import save_document
 
-def receipt_app():
-
-    # ===== Helpers shared with Invoice/Quotation =====
-    def proper_case(text):
-        if not text:
-            return ""
-        try:
-            return str(text).title().strip()
-        except Exception:
-            return text
-
-    def format_phone_input(raw_input):
-        if not raw_input:
-            return None
-        digits = ''.join(filter(str.isdigit, str(raw_input)))
-        if digits.startswith("0"):
-            digits = digits[1:]
-        if digits.startswith("5") and len(digits) == 9:
-            return f"+971 {digits[:2]} {digits[2:5]} {digits[5:]}"
-        return None
-    def phone_flat10(raw_input):
-        if raw_input is None:
-            return ""
-        digits = ''.join(filter(str.isdigit, str(raw_input)))
-        if not digits:
-            return ""
-        if digits.startswith('971') and len(digits) >= 12 and digits[3] == '5':
-            return '0' + digits[3:12]
-        if len(digits) == 9 and digits.startswith('5'):
-            return '0' + digits
-        if len(digits) == 10 and digits.startswith('05'):
-            return digits
-        return digits[-10:]
-    def phone_label_mask(raw_input):
-        flat = phone_flat10(raw_input)
-        return f"{flat} xxxxxxxxxx" if flat else "xxxxxxxxxx"
-
-    # =====================================
-    # HELPERS
-    # =====================================
-    def load_records():
-        try:
-            df = pd.read_excel("data/records.xlsx")
-            df.columns = [c.strip().lower() for c in df.columns]
-            return df
-        except:
-            return pd.DataFrame(columns=[
-                "base_id", "date", "type", "number", "amount",
-                "client_name", "phone", "location", "note"
-            ])
-
-    def save_record(rec):
-        df = load_records()
-        if not df.empty and {"type", "number"}.issubset(df.columns):
-            df = df[~((df["type"] == rec.get("type")) & (df["number"] == rec.get("number")))]
-        df = pd.concat([df, pd.DataFrame([rec])], ignore_index=True)
-        if {"type", "number"}.issubset(df.columns):
-            df = df.drop_duplicates(subset=["type", "number"], keep="last")
-        df.to_excel("data/records.xlsx", index=False)
-
-    # =====================================
-    # WORD TEMPLATE ONLY (pdfkit removed)
-    # =====================================
-    def generate_word(template, data_dict):
-        doc = Document(template)
-
-        for table in doc.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    for k, v in data_dict.items():
-                        if k in cell.text:
-                            cell.text = cell.text.replace(k, "" if v is None else str(v))
 
-        buf = BytesIO()
-        doc.save(buf)
-        buf.seek(0)
-        return buf
+def receipt_app():
 
     # =====================================
     # THEME
@@ -91,8 +21,8 @@ def receipt_app():
     # =====================================
     # LOAD DATABASE
     # =====================================
-    records = load_records()
-    invoices_df = records[records["type"] == "i"].copy()
+    rindex = get_record_index()
+    invoices_df = rindex.of_type("i")
     invoice_list = invoices_df["number"].astype(str).tolist()
 
     # =====================================
@@ -123,17 +53,18 @@ def receipt_app():
         today = datetime.today().strftime('%Y%m%d')
         st.text_input("Receipt Date", value=datetime.today().strftime('%Y-%m-%d'), disabled=True)
 
+    pending = rindex.by_number(selected_invoice, "i") if selected_invoice else None
+    if pending is not None and not pending["base_id"]:
+        # Queued with write-behind on: its project id is assigned when it is written
+        st.info("⏳ This invoice is still being saved; receipts can be added in a moment.")
+        selected_invoice = None
+
     if selected_invoice:
 
-        inv = records[records["number"] == selected_invoice].iloc[0]
+        inv = rindex.by_number(selected_invoice, "i")
 
         base_id = inv["base_id"]
 
-        # Count previous receipts for same base ID
-        previous_r = len(records[(records["base_id"] == base_id) & (records["type"] == "r")]) + 1
-
-        receipt_no = f"R-{today}-{base_id}-{previous_r}"
-
         st.markdown("---")
         st.markdown("<div class='section-title'>Client Information</div>", unsafe_allow_html=True)
 
@@ -146,7 +77,7 @@ def receipt_app():
         st.markdown("---")
 
         # Previous payments and summary
-        prev_receipts = records[(records["base_id"] == base_id) & (records["type"] == "r")]
+        prev_receipts = rindex.for_base(base_id, "r")
         previous_paid_total = prev_receipts["amount"].sum() if not prev_receipts.empty else 0.0
 
         st.markdown("---")
@@ -210,28 +141,67 @@ def receipt_app():
 
         st.markdown("---")
 
+        # Per project: provisional until the first download takes it (so browsing
+        # invoices uses up no numbers); kept after saving until the payment, the
+        # invoice or the project's saved receipts change (the saved receipt itself
+        # is one, so the next payment gets a new number)
+        rcpt_sig = receipt_signature(selected_invoice, payment, prev_receipts)
+        rcpt_slot = f"rcpt_reserved:{base_id}"
+        receipt_no = reserve(st.session_state, rcpt_slot, f"receipt:{base_id}:{today}",
+                             lambda: next_receipt_no(base_id), rcpt_sig,
+                             lambda: next_receipt_no(base_id, peek=True))
+        held = st.session_state[rcpt_slot]
+        take_number = lambda: claim(held)
+
         # Prepare data for Word and one-click download
-        data = {
-            "{{client_name}}": inv.get("client_name",""),
-            "{{invoice_no}}": selected_invoice,
-            "{{receipt_no}}": receipt_no,
-            "{{client_phone}}": (format_phone_input(inv.get("phone","")) or inv.get("phone","")),
-            "{{client_location}}": inv.get("location",""),
-            "{{amount}}": f"{payment:,.2f}",
-            "{{balance}}": f"{remaining:,.2f}",
-        }
-
-        word_file = generate_word("data/receipt_template.docx", data)
-
-        clicked = st.download_button(
-            label="Download Receipt (Word)",
-            data=word_file,
-            file_name=f"Receipt_{receipt_no}.docx"
-        )
-
-        if clicked:
-            try:
-                save_record({
+        def fields_for(number):
+            return receipt_fields(
+                number, selected_invoice, inv.get("client_name",""),
+                (format_phone_input(inv.get("phone","")) or inv.get("phone","")),
+                inv.get("location",""), payment, remaining,
+            )
+
+        # Rendered on click only, cached by content (Word from the template, PDF by utils/pdf_renderer.py)
+        word_file = numbered_export(take_number, lambda n: lazy_export(
+            RECEIPT_TEMPLATE, fields_for(n), None, render_receipt_docx))
+        pdf_file = numbered_export(take_number, lambda n: lazy_pdf_export(
+            RECEIPT_TEMPLATE, fields_for(n), None, render_receipt_docx, render_receipt_pdf))
+
+        export_cols = st.columns([1, 1])
+        with export_cols[0]:
+            clicked = st.download_button(
+                label="Download Receipt (Word)",
+                data=word_file,
+                file_name=f"Receipt_{receipt_no}.docx",
+                # Stable key: the number (and file name) can change on the click's rerun
+                key="rcpt_dl_word",
+                on_click=take_number,
+            )
+        with export_cols[1]:
+            clicked_pdf = st.download_button(
+                label="Download Receipt (PDF)",
+                data=pdf_file,
+                file_name=f"Receipt_{receipt_no}.pdf",
+                mime="application/pdf",
+                key="rcpt_dl_pdf",
+                on_click=take_number,
+            )
+
+        if clicked or clicked_pdf:
+            receipt_no = take_number()
+            taken = superseded(held)
+            if taken:
+                st.warning(f"⚠️ {taken} was taken by another user meanwhile, so this receipt is "
+                           f"{receipt_no}. Download it again for a file named after it.")
+
+            def persist_receipt(rec):
+                save_document(rec)
+                return f"✅ Saved receipt {rec['number']}"
+
+            # Saved in the background so the page stays responsive
+            job_id = submit_job(
+                f"Receipt {receipt_no}", persist_receipt,
+                {
                     "base_id": base_id,
                     "date": datetime.today().strftime('%Y-%m-%d'),
                     "type": "r",
@@ -241,8 +211,33 @@ def receipt_app():
                     "phone": inv.get("phone",""),
                     "location": inv.get("location",""),
                     "note": ""
-                })
-                st.success(f"✅ Saved receipt {receipt_no}")
-            except Exception as e:
-                st.warning(f"⚠️ Downloaded, but failed to save record: {e}")
+                },
+                owner=st.session_state.get("user", {}).get("name", ""),
+            )
+            st.session_state.setdefault("rcpt_jobs", []).append(job_id)
+            mark_saved(st.session_state, rcpt_slot, rcpt_sig)
+
+    # =====================================
+    # BACKGROUND JOBS
+    # =====================================
+    job_ids = st.session_state.get("rcpt_jobs", [])
+    polling = any_active(job_ids)
+
+    def show_jobs():
+        for job_id in job_ids[-3:]:
+            job = get_job(job_id)
+            if job is None:
+                continue
+            if job.active:
+                st.progress(job.progress, text=f"⏳ {job.name}: {job.message or 'queued'}")
+            elif job.error:
+                st.warning(f"⚠️ Downloaded, but failed to save record: {job.error}")
+            else:
+                st.success(job.result)
+        # Stop polling once everything has finished
+        if polling and not any_active(job_ids):
+            st.rerun()
+
+    if job_ids:
+        st.fragment(show_jobs, run_every=1 if polling else None)()
 
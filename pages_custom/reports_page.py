@@ -1,60 +1,31 @@
 import os
-from io import BytesIO
-from datetime import datetime, date
-from typing import Tuple
-
+import uuid
+from datetime import datetime, date, timedelta
 import pandas as pd
 import streamlit as st
 import altair as alt
 
+from utils import analytics, charts, exports, finance, storage
+from utils.batch_export import export_zip, records_to_batch
+from utils.jobs import submit as submit_job, report_progress, get_job, any_active
+
+# Largest bulk-export ZIP offered as a browser download (Streamlit serves it from memory)
+MAX_ZIP_DOWNLOAD = 200_000_000  # bytes
+
 # ==========================================
 # File Ensurers
 # ==========================================
 
 def ensure_report_files():
-    os.makedirs("data", exist_ok=True)
-
-    cust_path = "data/customers.xlsx"
-    rec_path = "data/records.xlsx"
-
-    if not os.path.exists(cust_path):
-        pd.DataFrame(columns=[
-            "client_name","phone","location","email","status",
-            "notes","tags","next_follow_up","assigned_to","last_activity"
-        ]).to_excel(cust_path, index=False)
-
-    if not os.path.exists(rec_path):
-        pd.DataFrame(columns=[
-            "base_id","date","type","number","amount","client_name","phone","location","note"
-        ]).to_excel(rec_path, index=False)
+    storage.init_storage()
 
 # ==========================================
 # Loaders with normalization
 # ==========================================
 
-def _load_records() -> pd.DataFrame:
-    ensure_report_files()
-    try:
-        df = pd.read_excel("data/records.xlsx")
-        df.columns = [c.strip().lower() for c in df.columns]
-        # Normalize types and dates
-        if "date" in df.columns:
-            df["date"] = pd.to_datetime(df["date"], errors="coerce")
-        if "type" in df.columns:
-            df["type"] = df["type"].astype(str).str.lower()
-        if "amount" in df.columns:
-            df["amount"] = pd.to_numeric(df["amount"], errors="coerce").fillna(0.0)
-        return df
-    except Exception:
-        return pd.DataFrame(columns=[
-            "base_id","date","type","number","amount","client_name","phone","location","note"
-        ])
-
-
 def _load_customers() -> pd.DataFrame:
     try:
-        df = pd.read_excel("data/customers.xlsx")
-        df.columns = [c.strip().lower() for c in df.columns]
+        df = storage.load_customers()
         if "next_follow_up" in df.columns:
             df["next_follow_up"] = pd.to_datetime(df["next_follow_up"], errors="coerce")
         return df
@@ -65,10 +36,18 @@ def _load_customers() -> pd.DataFrame:
         ])
 
 
-def _load_products() -> pd.DataFrame:
+def _load_projects() -> pd.DataFrame:
     try:
-        df = pd.read_excel("data/products.xlsx")
+        df = storage.load_projects()
+        df["last_update"] = pd.to_datetime(df["last_update"], errors="coerce")
         return df
+    except Exception:
+        return pd.DataFrame(columns=storage.PROJECT_COLUMNS + ["balance"])
+
+
+def _load_products() -> pd.DataFrame:
+    try:
+        return storage.load_products()
     except Exception:
         return pd.DataFrame()
 
@@ -115,12 +94,12 @@ UAE_LOCATIONS = [
 ]
 
 
-def _apply_filters(records: pd.DataFrame) -> Tuple[pd.DataFrame, dict]:
+def _apply_filters() -> analytics.ReportFilter:
     st.markdown("<div class='section-title'>Filters</div>", unsafe_allow_html=True)
 
-    # Default date range: this year
+    # Default date range: all documents (first month in the cube) up to today
     today = date.today()
-    start_default = date(today.year, 1, 1)
+    start_default = analytics.first_day() or date(today.year, 1, 1)
     end_default = today
 
     f1, f2, f3 = st.columns([1.2, 1, 1])
@@ -138,28 +117,12 @@ def _apply_filters(records: pd.DataFrame) -> Tuple[pd.DataFrame, dict]:
         with max_amt:
             amt_max = st.number_input("Max Amount", min_value=0.0, value=0.0, step=100.0)
 
-    # Build mask
-    m = pd.Series([True] * len(records))
-    if not records.empty:
-        if "date" in records.columns:
-            m &= (records["date"].dt.date >= start_date) & (records["date"].dt.date <= end_date)
-        if doc_type != "All" and "type" in records.columns:
-            map_type = {"Quotation": "q", "Invoice": "i", "Receipt": "r"}
-            m &= records["type"].isin([map_type.get(doc_type, "")])
-        if name_kw:
-            m &= records.get("client_name", pd.Series([""]*len(records))).astype(str).str.contains(name_kw, case=False, na=False)
-        if location != "All":
-            m &= records.get("location", pd.Series([""]*len(records))).astype(str) == location
-        if amt_min > 0:
-            m &= records.get("amount", pd.Series([0]*len(records))).astype(float) >= amt_min
-        if amt_max > 0:
-            m &= records.get("amount", pd.Series([0]*len(records))).astype(float) <= amt_max
-
-    filtered = records[m].copy() if not records.empty else records.copy()
-    return filtered, {
-        "start": start_date, "end": end_date, "doc_type": doc_type,
-        "name_kw": name_kw, "location": location, "amt_min": amt_min, "amt_max": amt_max,
-    }
+    return analytics.ReportFilter(
+        start=start_date, end=end_date,
+        types=(analytics.TYPE_CODES[doc_type],) if doc_type != "All" else (),
+        location="" if location == "All" else location,
+        name_kw=name_kw.strip(), amt_min=amt_min, amt_max=amt_max,
+    )
 
 # ==========================================
 # Metrics
@@ -184,19 +147,20 @@ def _metric_card(label: str, value: str):
 
 def reports_app():
     ensure_report_files()
-    records = _load_records()
     customers = _load_customers()
     products = _load_products()
 
+    # Filters slice the report cube (utils/analytics.py) instead of the records
+    flt = _apply_filters()
+    cells = analytics.report_cells(flt)
+    totals = analytics.type_totals(cells)
+
     # 1) ملخصات المستندات
     st.markdown("<div class='section-title'>ملخص المستندات</div>", unsafe_allow_html=True)
-    q_count = records[records["type"] == "q"].shape[0]
-    i_count = records[records["type"] == "i"].shape[0]
-    r_count = records[records["type"] == "r"].shape[0]
-    inv_sum = records[records["type"] == "i"]["amount"].sum()
-    rec_sum = records[records["type"] == "r"]["amount"].sum()
+    q_count, i_count, r_count = (int(totals.at[t, "count"]) for t in ("q", "i", "r"))
+    inv_sum = float(totals.at["i", "amount"])
+    rec_sum = float(totals.at["r", "amount"])
     outstanding = inv_sum - rec_sum
-    projects = records["base_id"].nunique() if "base_id" in records.columns else 0
 
     c1, c2, c3, c4 = st.columns(4)
     with c1: _metric_card("العروض (Quotation)", f"{q_count}")
@@ -206,38 +170,25 @@ def reports_app():
 
     st.markdown("---")
     st.markdown("<div class='section-title'>متابعة دورة حياة المشاريع</div>", unsafe_allow_html=True)
-    # 2) جدول متابعة المشاريع
-    if not records.empty:
-        # بناء جدول لكل base_id
-        lifecycle = []
-        for base_id, group in records.groupby("base_id"):
-            client = group["client_name"].iloc[0] if "client_name" in group.columns else "—"
-            phone = group["phone"].iloc[0] if "phone" in group.columns else "—"
-            location = group["location"].iloc[0] if "location" in group.columns else "—"
-            q_row = group[group["type"] == "q"]
-            i_row = group[group["type"] == "i"]
-            r_row = group[group["type"] == "r"]
-            status_q = "✅" if not q_row.empty else "❌"
-            status_i = "✅" if not i_row.empty else "❌"
-            status_r = "✅" if not r_row.empty else "❌"
-            amt = i_row["amount"].sum() if not i_row.empty else 0.0
-            paid = r_row["amount"].sum() if not r_row.empty else 0.0
-            remain = amt - paid
-            last_update = group["date"].max() if "date" in group.columns else "—"
-            lifecycle.append({
-                "base_id": base_id,
-                "client": client,
-                "phone": phone,
-                "location": location,
-                "عرض سعر": status_q,
-                "فاتورة": status_i,
-                "إيصال": status_r,
-                "المبلغ": amt,
-                "المدفوع": paid,
-                "الرصيد": remain,
-                "آخر تحديث": last_update,
-            })
-        df_life = pd.DataFrame(lifecycle)
+    # 2) جدول متابعة المشاريع (من جدول المشاريع المحدّث مع كل حفظ)
+    life = _load_projects()
+    if not life.empty:
+        def status(counts):
+            return counts.gt(0).map({True: "✅", False: "❌"})
+
+        df_life = pd.DataFrame({
+            "base_id": life["base_id"],
+            "client": life["client_name"],
+            "phone": life["phone"],
+            "location": life["location"],
+            "عرض سعر": status(life["q_count"]),
+            "فاتورة": status(life["i_count"]),
+            "إيصال": status(life["r_count"]),
+            "المبلغ": life["invoiced"],
+            "المدفوع": life["paid"],
+            "الرصيد": life["balance"],
+            "آخر تحديث": life["last_update"],
+        })
         st.dataframe(df_life, use_container_width=True, hide_index=True)
     else:
         st.info("لا توجد مشاريع بعد.")
@@ -259,8 +210,11 @@ def reports_app():
     # 3) جدول المستندات الكامل
     st.markdown("---")
     st.markdown("<div class='section-title'>Documents</div>", unsafe_allow_html=True)
-    if not records.empty:
-        view = records.copy()
+    view = analytics.filtered_records(flt)
+    # Projects with a document in the filtered slice (for the summary export)
+    project_ids = view["base_id"].dropna().astype(str).str.strip()
+    project_count = int(project_ids[project_ids != ""].nunique())
+    if not view.empty:
         cols = [
             "date","type","number","client_name","phone","location","amount","base_id","note"
         ]
@@ -268,35 +222,36 @@ def reports_app():
         view = view[cols].sort_values(by=["date"], ascending=False)
         st.dataframe(view, use_container_width=True, hide_index=True)
 
-        buf_xlsx = BytesIO()
-        view.to_excel(buf_xlsx, index=False)
-        buf_xlsx.seek(0)
-        st.download_button("Export Excel", buf_xlsx, file_name="documents_report.xlsx")
-
-        buf_csv = BytesIO(view.to_csv(index=False).encode("utf-8"))
-        st.download_button("Export CSV", buf_csv, file_name="documents_report.csv")
+        # Exports are built only when a button is clicked (utils/exports.py)
+        view_key = ("documents_report", flt, storage.table_version("records"))
+        st.download_button(
+            "Export Excel",
+            exports.lazy_data_export((*view_key, "xlsx"), lambda: exports.xlsx_bytes(cols, exports.frame_rows(view))),
+            file_name="documents_report.xlsx",
+        )
+        st.download_button(
+            "Export CSV",
+            exports.lazy_data_export((*view_key, "csv"), lambda: view.to_csv(index=False).encode("utf-8")),
+            file_name="documents_report.csv",
+        )
     else:
         st.info("No documents found.")
 
     # 4) Financial analytics
     st.markdown("---")
     st.markdown("<div class='section-title'>Financial Analytics</div>", unsafe_allow_html=True)
-    if not records.empty and "date" in records.columns:
-        df_i = records[records["type"] == "i"][['date','amount']].copy()
-        df_r = records[records["type"] == "r"][['date','amount']].copy()
-        if not df_i.empty:
-            df_i['month'] = df_i['date'].dt.to_period('M').dt.to_timestamp()
-            inv_month = df_i.groupby('month')['amount'].sum().reset_index()
-            chart_i = alt.Chart(inv_month).mark_bar(color="#0a84ff").encode(x='month:T', y='amount:Q').properties(height=220)
-            st.altair_chart(chart_i, use_container_width=True)
+    if not cells.empty:
+        # Binned server-side to at most charts.MAX_MARKS periods; specs cached per filter
+        if totals.at["i", "count"]:
+            st.vega_lite_chart(charts.series_spec(cells, "i", flt), use_container_width=True)
         else:
             st.info("No invoices in range for Monthly Revenue chart.")
 
-        if not df_r.empty:
-            df_r['month'] = df_r['date'].dt.to_period('M').dt.to_timestamp()
-            rec_month = df_r.groupby('month')['amount'].sum().reset_index()
-            chart_r = alt.Chart(rec_month).mark_area(color="#34c759", opacity=0.5).encode(x='month:T', y='amount:Q').properties(height=220)
-            st.altair_chart(chart_r, use_container_width=True)
+        if totals.at["r", "count"]:
+            st.vega_lite_chart(
+                charts.series_spec(cells, "r", flt, mark="area", color="#34c759", opacity=0.5),
+                use_container_width=True,
+            )
         else:
             st.info("No receipts in range for Monthly Collection chart.")
 
@@ -318,25 +273,49 @@ def reports_app():
     # 5) Top customers
     st.markdown("---")
     st.markdown("<div class='section-title'>Top Customers</div>", unsafe_allow_html=True)
-    if not records.empty:
-        inv = records[records['type'] == 'i']
-        rec = records[records['type'] == 'r']
-        inv_by = inv.groupby('client_name', dropna=False)['amount'].sum().rename('Total Invoiced')
-        rec_by = rec.groupby('client_name', dropna=False)['amount'].sum().rename('Total Paid')
-        top = pd.concat([inv_by, rec_by], axis=1).fillna(0.0)
-        top['Balance'] = top['Total Invoiced'] - top['Total Paid']
-        top = top.sort_values('Total Invoiced', ascending=False).reset_index().rename(columns={'client_name':'Customer Name'})
-        st.dataframe(top, use_container_width=True, hide_index=True)
-
-        # Optional horizontal bar chart by invoiced
-        if not top.empty:
-            chart_top = alt.Chart(top).mark_bar(color="#0a84ff").encode(
-                x='Total Invoiced:Q', y=alt.Y('Customer Name:N', sort='-x')
-            ).properties(height=300)
-            st.altair_chart(chart_top, use_container_width=True)
+    if not cells.empty:
+        by_client = analytics.by_client(cells)
+        st.dataframe(by_client.rename(columns={'client_name':'Customer Name'}), use_container_width=True, hide_index=True)
+
+        # Horizontal bar chart by invoiced (largest clients plus "Others")
+        if not by_client.empty:
+            st.vega_lite_chart(charts.clients_spec(by_client, flt), use_container_width=True)
     else:
         st.info("No invoice/receipt data available yet.")
 
+    # 5b) Receivables aging (invoices less project receipts, oldest paid first)
+    st.markdown("---")
+    st.markdown("<div class='section-title'>Receivables Aging</div>", unsafe_allow_html=True)
+    as_of = st.date_input("As of", date.today(), key="aging_as_of")
+    aging_inv, aging_cust = finance.load_aging(as_of)
+    if not aging_cust.empty:
+        bucket_totals = aging_cust[finance.BUCKET_LABELS].sum()
+        cols_b = st.columns(len(finance.BUCKET_LABELS))
+        for col, label in zip(cols_b, finance.BUCKET_LABELS):
+            with col: _metric_card(f"{label} days", f"{bucket_totals[label]:,.2f} AED")
+
+        st.dataframe(
+            aging_cust.rename(columns={"client_name": "Customer Name", "phone": "Phone", "total": "Total Outstanding"}),
+            use_container_width=True, hide_index=True,
+        )
+        open_inv = aging_inv[aging_inv["outstanding"] > 0]
+        with st.expander(f"Open invoices ({len(open_inv)})"):
+            st.dataframe(open_inv.sort_values("days", ascending=False), use_container_width=True, hide_index=True)
+
+        st.download_button(
+            "Download Aging Report (Excel)",
+            exports.lazy_data_export(
+                ("aging_report", as_of, storage.table_version("records")),
+                lambda: exports.xlsx_sheets({
+                    "By Customer": (list(aging_cust.columns), exports.frame_rows(aging_cust)),
+                    "By Invoice": (list(aging_inv.columns), exports.frame_rows(aging_inv)),
+                }),
+            ),
+            file_name=f"aging_report_{as_of:%Y%m%d}.xlsx",
+        )
+    else:
+        st.info("No outstanding invoices.")
+
     # 6) Top products (placeholder)
     st.markdown("---")
     st.markdown("<div class='section-title'>Top Products (coming soon)</div>", unsafe_allow_html=True)
@@ -364,21 +343,109 @@ def reports_app():
     st.markdown("---")
     st.markdown("<div class='section-title'>Exporting</div>", unsafe_allow_html=True)
 
-    # Full report = جميع المستندات
-    full_buf = BytesIO()
-    records.to_excel(full_buf, index=False)
-    full_buf.seek(0)
-    st.download_button("Download Full Report (Excel)", full_buf, file_name="full_report.xlsx")
+    # Full report = جميع المستندات (streamed from the database on click)
+    full_cols = [c for c in storage.RECORD_COLUMNS if c not in storage.DERIVED_COLUMNS]
+    st.download_button(
+        "Download Full Report (Excel)",
+        exports.lazy_data_export(
+            ("full_report", storage.table_version("records")),
+            lambda: exports.xlsx_bytes(full_cols, storage.iter_rows("records", full_cols)),
+        ),
+        file_name="full_report.xlsx",
+    )
 
     # Summary only
-    summary_df = pd.DataFrame([
-        {"Metric":"Total Quotations","Value": q_count},
-        {"Metric":"Total Invoice Amount","Value": inv_sum},
-        {"Metric":"Total Received Amount","Value": rec_sum},
-        {"Metric":"Outstanding Balance","Value": outstanding},
-        {"Metric":"Total Projects","Value": projects},
-    ])
-    sum_buf = BytesIO()
-    summary_df.to_excel(sum_buf, index=False)
-    sum_buf.seek(0)
-    st.download_button("Download Summary Only (Excel)", sum_buf, file_name="summary_report.xlsx")
\ No newline at end of file
+    summary = [
+        ("Total Quotations", q_count),
+        ("Total Invoice Amount", inv_sum),
+        ("Total Received Amount", rec_sum),
+        ("Outstanding Balance", outstanding),
+        ("Total Projects", project_count),
+    ]
+    st.download_button(
+        "Download Summary Only (Excel)",
+        exports.lazy_data_export(
+            ("summary_report", summary), lambda: exports.xlsx_bytes(["Metric", "Value"], summary)
+        ),
+        file_name="summary_report.xlsx",
+    )
+
+    # 9) Bulk document export (rebuilt from records, streamed into a ZIP on disk)
+    st.markdown("---")
+    st.markdown("<div class='section-title'>Bulk Document Export</div>", unsafe_allow_html=True)
+    today = date.today()
+    b1, b2, b3 = st.columns([1, 1, 1.2])
+    with b1:
+        zip_start = st.date_input("From", date(today.year, 1, 1), key="zip_start")
+        zip_end = st.date_input("To", today, key="zip_end")
+    with b2:
+        type_map = {"Quotation": "q", "Invoice": "i", "Receipt": "r"}
+        zip_types = st.multiselect("Documents", list(type_map), default=list(type_map), key="zip_types")
+        zip_formats = st.multiselect("Formats", ["docx", "pdf"], default=["docx"], key="zip_formats")
+
+    zip_codes = [type_map[t] for t in zip_types]
+    # Counted by SQLite; the documents themselves are only rebuilt by the export job
+    zip_count = storage.count_rows(
+        "records",
+        f"date >= ? AND date < ? AND lower(type) IN ({','.join('?' * len(zip_codes))})",
+        (zip_start.isoformat(), (zip_end + timedelta(days=1)).isoformat(), *zip_codes),
+    ) if zip_codes else 0
+    job_id = st.session_state.get("reports_zip_job")
+    polling = any_active([job_id]) if job_id else False
+
+    with b3:
+        st.caption(f"{zip_count} documents in range")
+        if st.button("Build ZIP", disabled=polling or not zip_count or not zip_formats, key="zip_build"):
+            # Unique per build, so sessions exporting the same range never share a file
+            zip_path = os.path.join(
+                "data", "exports", f"documents_{zip_start:%Y%m%d}_{zip_end:%Y%m%d}_{uuid.uuid4().hex[:8]}.zip"
+            )
+
+            def build_zip(start, end, types, path, formats):
+                # records_to_batch needs every record (receipt balances), in insertion order
+                docs = records_to_batch(storage.load_records(), start, end, types)
+                stats = export_zip(
+                    docs, path, formats,
+                    progress=lambda done, total: report_progress(done / max(total, 1), f"{done}/{total} documents"),
+                )
+                return path, stats
+
+            st.session_state["reports_zip_job"] = submit_job(
+                f"Export {zip_count} documents", build_zip, zip_start, zip_end, zip_codes, zip_path, zip_formats,
+                owner=st.session_state.get("user", {}).get("name", ""),
+            )
+            st.rerun()
+
+    def show_zip_job():
+        job = get_job(job_id)
+        if job is None:
+            return
+        if job.active:
+            st.progress(job.progress, text=f"⏳ {job.name}: {job.message or 'starting workers'}")
+        elif job.error:
+            st.error(f"❌ {job.name} failed: {job.error}")
+        else:
+            path, stats = job.result
+            note = f", {stats['failed']} failed (see errors.txt)" if stats["failed"] else ""
+            st.success(f"✅ {stats['ok']} documents ({stats['files']} files){note}")
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            if size > MAX_ZIP_DOWNLOAD:
+                # Browser downloads are served from memory; larger archives stay on the server
+                st.warning(
+                    f"The ZIP is {size / 1e6:,.0f} MB, above the {MAX_ZIP_DOWNLOAD / 1e6:,.0f} MB download limit. "
+                    f"It was saved on the server as {path}; choose a shorter date range to download it here."
+                )
+            elif size:
+                def read_zip():
+                    with open(path, "rb") as f:
+                        return f.read()
+
+                st.download_button(
+                    "Download ZIP", data=read_zip,
+                    file_name=os.path.basename(path), mime="application/zip", key="zip_download",
+                )
+        if polling and not job.active:
+            st.rerun()
+
+    if job_id:
+        st.fragment(show_zip_job, run_every=1 if polling else None)()
@@ -19,8 +19,12 @@ from datetime import datetime
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 from utils.auth import load_users, save_users, is_admin
-from utils.logger import log_event, load_logs
+from utils.logger import log_event, load_logs, flush_logs, reset_log_migration, ensure_logs_file, LOG_DIR
 from utils.settings import load_settings, save_settings
+from utils.office_pool import office_available
+from utils import storage
+from utils.fileio import atomic_write
+from utils.write_behind import FAILED_PATH, failed_writes
 
 
 def _apply_settings_theme():
@@ -657,6 +661,36 @@ def system_config_section(user, user_name):
         
         st.markdown('<div class="spacing-md"></div>', unsafe_allow_html=True)
         
+        st.markdown('<div class="crm-subsection">PDF Export</div>', unsafe_allow_html=True)
+        p1, p2 = st.columns(2)
+        engines = ["reportlab", "office"]
+        with p1:
+            pdf_engine = st.selectbox(
+                "PDF Engine", engines,
+                index=engines.index(settings.get("pdf_engine", "reportlab")) if settings.get("pdf_engine") in engines else 0,
+                format_func=lambda e: "Built-in (fast)" if e == "reportlab" else "LibreOffice (matches Word template)",
+            )
+            if pdf_engine == "office" and not office_available():
+                st.caption("⚠️ LibreOffice not found; the built-in renderer will be used")
+        with p2:
+            office_workers = st.number_input("LibreOffice Workers", min_value=1, max_value=8, value=int(settings.get("office_workers", 2)))
+            st.caption("Parallel conversions for the LibreOffice engine")
+        
+        st.markdown('<div class="spacing-md"></div>', unsafe_allow_html=True)
+        
+        st.markdown('<div class="crm-subsection">Saving</div>', unsafe_allow_html=True)
+        write_behind = st.checkbox(
+            "Write-behind saves",
+            value=bool(settings.get("write_behind", False)),
+            help="Documents are saved to a journal instantly and written to the database in batches",
+        )
+        failed = failed_writes()
+        if failed:
+            st.caption(f"⚠️ {len(failed)} saved document(s) could not be written to the database; "
+                       f"they are kept in {FAILED_PATH}")
+        
+        st.markdown('<div class="spacing-md"></div>', unsafe_allow_html=True)
+        
         if st.form_submit_button("Save Configuration", type="primary"):
             settings.update({
                 "company_name": company_name,
@@ -668,7 +702,10 @@ def system_config_section(user, user_name):
                 "ui_product_image_width_px": int(ui_w),
                 "ui_product_image_height_px": int(ui_h),
                 "quote_product_image_width_cm": float(q_w),
-                "quote_product_image_height_cm": float(q_h)
+                "quote_product_image_height_cm": float(q_h),
+                "pdf_engine": pdf_engine,
+                "office_workers": int(office_workers),
+                "write_behind": bool(write_behind)
             })
             save_settings(settings)
             log_event(user_name, "Settings", "config_updated", "System configuration saved")
@@ -714,8 +751,7 @@ def template_manager_section(user, user_name):
             if upload and st.button(f"Replace Template", key=f"btn_{name}", type="primary"):
                 try:
                     os.makedirs("data", exist_ok=True)
-                    with open(path, "wb") as f:
-                        f.write(upload.read())
+                    atomic_write(path, upload.read())
                     log_event(user_name, "Settings", "template_uploaded", f"{name} template: {filename}")
                     st.success(f"✓ {name} template updated successfully")
                     st.rerun()
@@ -739,15 +775,23 @@ def backup_restore_section(user, user_name):
     
     if st.button("Download Full Backup", type="primary"):
         try:
+            # Snapshot the storage engine into the .xlsx workbooks first
+            storage.export_to_excel(["products", "customers", "records", "users"])
+            flush_logs()
             buf = BytesIO()
             with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
                 files_included = []
                 for fname in ["products.xlsx", "customers.xlsx", "records.xlsx", 
-                             "users.xlsx", "logs.xlsx", "settings.json"]:
+                             "users.xlsx", "settings.json"]:
                     path = f"data/{fname}"
                     if os.path.exists(path):
                         zf.write(path, fname)
                         files_included.append(fname)
+                # Activity log segments (data/logs/*.jsonl)
+                if os.path.isdir(LOG_DIR):
+                    for fname in sorted(f for f in os.listdir(LOG_DIR) if f.endswith(".jsonl")):
+                        zf.write(os.path.join(LOG_DIR, fname), f"logs/{fname}")
+                        files_included.append(f"logs/{fname}")
             buf.seek(0)
             ts = datetime.now().strftime("%Y%m%d_%H%M%S")
             log_event(user_name, "Settings", "backup_created", f"Full backup: {len(files_included)} files")
@@ -776,8 +820,21 @@ def backup_restore_section(user, user_name):
             try:
                 with zipfile.ZipFile(restore, "r") as zf:
                     os.makedirs("data", exist_ok=True)
-                    file_list = zf.namelist()
-                    zf.extractall("data")
+                    file_list = [n for n in zf.namelist() if not n.endswith("/")]
+                    root = os.path.abspath("data")
+                    for name in file_list:
+                        target = os.path.abspath(os.path.join(root, name))
+                        if not target.startswith(root + os.sep):
+                            continue  # entries outside data/ are ignored
+                        os.makedirs(os.path.dirname(target), exist_ok=True)
+                        atomic_write(target, zf.read(name))
+                for table in storage.TABLES:
+                    if f"{table}.xlsx" in file_list:
+                        storage.import_from_excel(table)
+                if "logs.xlsx" in file_list:
+                    # An old backup's logs land in the legacy table: move them to segments
+                    reset_log_migration()
+                    ensure_logs_file()
                 log_event(user_name, "Settings", "restore_completed", f"Restored {len(file_list)} files")
                 st.success(f"✓ Data restored successfully ({len(file_list)} files). Please refresh the page.")
             except Exception as e:
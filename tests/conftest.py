@@ -0,0 +1,12 @@
+import pytest
+
+from utils import storage
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """A fresh data/newton.db in a temporary working directory."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(storage, "_initialized", False)
+    storage.init_storage()
+    return storage
@@ -0,0 +1,25 @@
+from utils.documents import receipt_signature
+from utils.sequences import claim, mark_saved, next_receipt_no, reserve
+
+
+def _pay(store, state, amount):
+    """One receipt page run plus a download of the receipt, as receipt_page does it."""
+    prev = store.load_table("records", "type = 'r' AND base_id = ?", ("20250101-001",))
+    sig = receipt_signature("INV-20250101-001", amount, prev)
+    slot = "rcpt_reserved:20250101-001"
+    reserve(state, slot, "receipt:20250101-001:20250101",
+            lambda: next_receipt_no("20250101-001", "20250101"), sig,
+            lambda: next_receipt_no("20250101-001", "20250101", peek=True))
+    number = claim(state[slot])
+    store.save_record({"base_id": "20250101-001", "date": "2025-01-01", "type": "r",
+                       "number": number, "amount": amount, "client_name": "Client"})
+    mark_saved(state, slot, sig)
+    return number
+
+
+def test_two_identical_payments_make_two_receipts(store):
+    state = {}
+    first = _pay(store, state, 500.0)
+    second = _pay(store, state, 500.0)
+    assert first != second
+    assert store.count_rows("records", "type = 'r' AND base_id = ?", ("20250101-001",)) == 2
@@ -0,0 +1,17 @@
+from utils import exports
+
+
+def test_cache_is_bounded_by_bytes(monkeypatch):
+    monkeypatch.setattr(exports, "MAX_BYTES", 250)
+    monkeypatch.setattr(exports, "MAX_ENTRY_BYTES", 150)
+    exports.clear_exports()
+
+    for key in "abc":
+        exports._cached(key, lambda: b"x" * 100)
+    assert list(exports._entries) == ["b", "c"]  # oldest dropped to stay under MAX_BYTES
+    assert exports._total_bytes == 200
+
+    big = exports._cached("big", lambda: b"y" * 200)
+    assert len(big) == 200 and "big" not in exports._entries  # returned, not kept
+    exports.clear_exports()
+    assert exports._total_bytes == 0
@@ -0,0 +1,34 @@
+import os
+from datetime import datetime, timedelta
+
+from utils import logger
+
+
+def _legacy(store, *days_ago):
+    store.insert_rows("logs", [
+        {"timestamp": (datetime.now() - timedelta(days=d)).strftime("%Y-%m-%d %H:%M:%S"),
+         "user": "u", "page": "p", "action": "a", "details": ""}
+        for d in days_ago
+    ])
+
+
+def test_pruning_migrates_legacy_rows_first(store, monkeypatch):
+    monkeypatch.setattr(logger, "_migrated", False)
+    _legacy(store, 400, 1)
+
+    logger.clear_old_logs(90)
+
+    assert store.load_logs().empty
+    assert len(logger.load_logs()) == 1  # the 400-day-old row was pruned with its segment
+    assert len(os.listdir(logger.LOG_DIR)) >= 1
+
+
+def test_restored_logs_are_migrated_again(store, monkeypatch):
+    monkeypatch.setattr(logger, "_migrated", False)
+    logger.ensure_logs_file()
+    _legacy(store, 2)  # what restoring an old backup's logs.xlsx does
+
+    logger.reset_log_migration()
+
+    assert len(logger.load_logs()) == 1
+    assert store.load_logs().empty
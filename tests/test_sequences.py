@@ -0,0 +1,44 @@
+import threading
+
+from utils.sequences import claim, next_quote_no, reserve, signature, superseded
+
+
+def _render(state, sig="q"):
+    """What the quotation page does on each run: show the reserved or provisional number."""
+    return reserve(state, "quo_reserved", "quotation:20250101",
+                   lambda: next_quote_no("20250101"), signature(sig),
+                   lambda: next_quote_no("20250101", peek=True))
+
+
+def test_provisional_number_is_not_taken(store):
+    state = {}
+    assert _render(state) == _render(state) == "QUO-20250101-001"
+    assert next_quote_no("20250101", peek=True) == "QUO-20250101-001"
+
+
+def test_racing_holders_get_distinct_numbers_and_the_loser_is_told(store):
+    a, b = {}, {}
+    shown = _render(a)
+    assert _render(b) == shown  # both pages name their download files after it
+
+    held = [a["quo_reserved"], b["quo_reserved"]]
+    start = threading.Barrier(2)
+    taken = [None, None]
+
+    def download(i):
+        start.wait()
+        taken[i] = claim(held[i])
+
+    threads = [threading.Thread(target=download, args=(i,)) for i in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert sorted(taken) == ["QUO-20250101-001", "QUO-20250101-002"]
+    loser = taken.index("QUO-20250101-002")
+    assert superseded(held[loser]) == shown
+    assert superseded(held[loser]) is None  # reported once
+    assert superseded(held[1 - loser]) is None
+    # The click's rerun names the files after the number the document holds
+    assert _render([a, b][loser]) == "QUO-20250101-002"
@@ -0,0 +1,54 @@
+import json
+
+from utils import write_behind
+
+
+def _entry(entry_id, number, logs=()):
+    record = {"base_id": "20250101-001", "date": "2025-01-01", "type": "q",
+              "number": number, "amount": 100.0, "client_name": "Client"}
+    return {"id": entry_id, "record": record, "customer": None, "logs": [list(l) for l in logs]}
+
+
+def test_replay_sets_aside_a_failing_entry_and_goes_on(store, monkeypatch):
+    logged = []
+    monkeypatch.setattr(write_behind, "_replayed", False)
+    monkeypatch.setattr(write_behind, "log_event", lambda *args: logged.append(args))
+    entries = [
+        _entry("bad", "QUO-20250101-001", logs=[("too", "few")]),  # uow.log() rejects it
+        _entry("good", "QUO-20250101-002"),
+    ]
+    with open(write_behind.JOURNAL_PATH, "w", encoding="utf-8") as f:
+        f.writelines(json.dumps(e) + "\n" for e in entries)
+
+    assert write_behind.replay_journal() == 2
+
+    assert store.record_base_id("q", "QUO-20250101-002") == "20250101-001"
+    assert store.record_base_id("q", "QUO-20250101-001") is None
+    assert [e["id"] for e in write_behind.failed_writes()] == ["bad"]
+    assert logged and logged[0][2] == "save_failed"
+    assert write_behind._read_journal() == []
+    assert store.meta_keys("journal:") == []
+
+
+def test_flush_retries_then_sets_aside(store, monkeypatch):
+    monkeypatch.setattr(write_behind, "enabled", lambda: True)
+    monkeypatch.setattr(write_behind, "_replayed", True)
+    monkeypatch.setattr(write_behind, "_ensure_flusher", lambda: None)
+    monkeypatch.setattr(write_behind, "_retry", [])
+    monkeypatch.setattr(write_behind, "_attempts", {})
+    monkeypatch.setattr(write_behind, "MAX_ATTEMPTS", 2)
+    monkeypatch.setattr(write_behind, "log_event", lambda *args: None)
+
+    write_behind.save_document(_entry("", "QUO-20250101-001")["record"], logs=[("too", "few")])
+    write_behind.save_document(_entry("", "QUO-20250101-002")["record"])
+    batch = [write_behind._queue.get_nowait(), write_behind._queue.get_nowait()]
+
+    write_behind._flush(batch)  # the first fails; the second waits behind it
+    assert store.record_base_id("q", "QUO-20250101-002") is None
+    assert len(write_behind._retry) == 2
+
+    write_behind._flush([])  # second attempt: set aside, the rest is written
+    assert write_behind._retry == []
+    assert store.record_base_id("q", "QUO-20250101-002")
+    assert [e["record"]["number"] for e in write_behind.failed_writes()] == ["QUO-20250101-001"]
+    assert write_behind._read_journal() == []
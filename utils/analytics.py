@@ -0,0 +1,177 @@
+"""
+Report Analytics for Newton Smart Home Application
+Answers the Reports page filters from the pre-aggregated report cube (record
+count and amount per month x type x location x client, kept current by every
+records write in utils/storage.py) instead of rescanning the records. Only the
+partial months at the ends of a date range, or an amount filter (which applies
+to single documents), read records, through the date index.
+"""
+
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import List, Optional, Tuple
+
+import pandas as pd
+
+from utils import storage
+
+
+CELL_KEYS = ["month", "type", "location", "client_name"]
+TYPE_CODES = {"Quotation": "q", "Invoice": "i", "Receipt": "r"}
+
+
+@dataclass(frozen=True)
+class ReportFilter:
+    start: date
+    end: date
+    types: Tuple[str, ...] = ()  # record types ("q", "i", "r"); empty = all
+    location: str = ""  # exact location; empty = all
+    name_kw: str = ""  # case-insensitive part of the client name
+    amt_min: float = 0.0  # per document; 0 = no bound
+    amt_max: float = 0.0
+
+    @property
+    def by_amount(self) -> bool:
+        return self.amt_min > 0 or self.amt_max > 0
+
+
+def _month_end(d: date) -> date:
+    return (d.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+
+
+def _records_between(start: date, end: date) -> pd.DataFrame:
+    """Records dated start..end (inclusive), read through the date index, plus queued ones."""
+    lo, hi = start.isoformat(), (end + timedelta(days=1)).isoformat()
+
+    def in_range(rows: pd.DataFrame) -> pd.Series:
+        dates = rows["date"].fillna("").astype(str)
+        return (dates >= lo) & (dates < hi)
+
+    return storage.load_table("records", "date >= ? AND date < ?", (lo, hi), match=in_range)
+
+
+def _aggregate(rows: pd.DataFrame) -> pd.DataFrame:
+    """Rows -> cube cells (same shape as storage.load_cube)."""
+    if rows.empty:
+        return pd.DataFrame(columns=storage.CUBE_COLUMNS)
+    cells = pd.DataFrame({
+        "month": rows["date"].fillna("").astype(str).str[:7],
+        "type": rows["type"].fillna("").astype(str),
+        "location": rows["location"].fillna("").astype(str),
+        "client_name": rows["client_name"].fillna("").astype(str),
+        "amount": pd.to_numeric(rows["amount"], errors="coerce").fillna(0.0),
+    })
+    return (
+        cells.groupby(CELL_KEYS, sort=False)["amount"]
+        .agg(count="size", amount="sum")
+        .reset_index()
+    )
+
+
+def _partial_ranges(start: date, end: date) -> Tuple[str, str, List[Tuple[date, date]]]:
+    """(first full month, last full month, partial day ranges at either end)."""
+    first = start if start.day == 1 else _month_end(start) + timedelta(days=1)
+    last = end if end == _month_end(end) else end.replace(day=1) - timedelta(days=1)
+    if first > last:
+        return "", "", [(start, end)]
+    partial = []
+    if start < first:
+        partial.append((start, first - timedelta(days=1)))
+    if end > last:
+        partial.append((last + timedelta(days=1), end))
+    return f"{first:%Y-%m}", f"{last:%Y-%m}", partial
+
+
+def first_day() -> Optional[date]:
+    """First day of the earliest month with documents (None if there are none)."""
+    months = storage.load_cube()["month"]
+    months = months[months.str.match(r"^\d{4}-\d{2}$")]
+    if months.empty:
+        return None
+    return date.fromisoformat(months.min() + "-01")
+
+
+def report_cells(f: ReportFilter) -> pd.DataFrame:
+    """
+    Cube cells (month, type, location, client_name, count, amount) for the
+    documents matching the filter.
+    """
+    if f.start > f.end:
+        return pd.DataFrame(columns=storage.CUBE_COLUMNS)
+    if f.by_amount:
+        rows = _records_between(f.start, f.end)
+        amounts = pd.to_numeric(rows["amount"], errors="coerce").fillna(0.0)
+        keep = pd.Series(True, index=rows.index)
+        if f.amt_min > 0:
+            keep &= amounts >= f.amt_min
+        if f.amt_max > 0:
+            keep &= amounts <= f.amt_max
+        cells = _aggregate(rows[keep])
+    else:
+        first, last, partial = _partial_ranges(f.start, f.end)
+        parts = []
+        if first:
+            cube = storage.load_cube()
+            parts.append(cube[(cube["month"] >= first) & (cube["month"] <= last)])
+        parts.extend(_aggregate(_records_between(s, e)) for s, e in partial)
+        parts = [p for p in parts if not p.empty]
+        cells = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=storage.CUBE_COLUMNS)
+
+    if f.types:
+        cells = cells[cells["type"].isin(f.types)]
+    if f.location:
+        cells = cells[cells["location"] == f.location]
+    if f.name_kw:
+        # Match each distinct client once, not every cell
+        names = pd.Series(cells["client_name"].unique())
+        hits = set(names[names.str.contains(f.name_kw, case=False, regex=False, na=False)])
+        cells = cells[cells["client_name"].isin(hits)]
+    return cells.reset_index(drop=True)
+
+
+def filtered_records(f: ReportFilter) -> pd.DataFrame:
+    """The documents themselves (for listing and export)."""
+    rows = _records_between(f.start, f.end)
+    keep = pd.Series(True, index=rows.index)
+    if f.types:
+        keep &= rows["type"].isin(f.types)
+    if f.location:
+        keep &= rows["location"].astype(str) == f.location
+    if f.name_kw:
+        keep &= rows["client_name"].astype(str).str.contains(f.name_kw, case=False, regex=False, na=False)
+    amounts = pd.to_numeric(rows["amount"], errors="coerce").fillna(0.0)
+    if f.amt_min > 0:
+        keep &= amounts >= f.amt_min
+    if f.amt_max > 0:
+        keep &= amounts <= f.amt_max
+    return rows[keep]
+
+
+# ==========================================
+# Views of a slice
+# ==========================================
+
+def type_totals(cells: pd.DataFrame) -> pd.DataFrame:
+    """count and amount per record type ("q", "i", "r"; 0 when absent)."""
+    totals = cells.groupby("type")[["count", "amount"]].sum()
+    return totals.reindex(["q", "i", "r"], fill_value=0)
+
+
+def monthly(cells: pd.DataFrame, rtype: str) -> pd.DataFrame:
+    """month (first day, as a Timestamp) and amount for one record type."""
+    sel = cells[(cells["type"] == rtype) & (cells["month"] != "")]
+    out = sel.groupby("month", as_index=False)["amount"].sum()
+    out["month"] = pd.to_datetime(out["month"] + "-01", errors="coerce")
+    return out
+
+
+def by_client(cells: pd.DataFrame) -> pd.DataFrame:
+    """Total Invoiced, Total Paid and Balance per client, largest invoiced first."""
+    sel = cells[cells["type"].isin(["i", "r"])]
+    pivot = sel.pivot_table(index="client_name", columns="type", values="amount", aggfunc="sum", fill_value=0.0)
+    top = pd.DataFrame({
+        "Total Invoiced": pivot["i"] if "i" in pivot.columns else 0.0,
+        "Total Paid": pivot["r"] if "r" in pivot.columns else 0.0,
+    }, index=pivot.index)
+    top["Balance"] = top["Total Invoiced"] - top["Total Paid"]
+    return top.sort_values("Total Invoiced", ascending=False).reset_index()
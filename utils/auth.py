@@ -3,16 +3,15 @@ Authentication and User Management Utilities
 Handles PIN-based login, user data, and permissions.
 """
 
-import os
 import pandas as pd
 from typing import Optional, Dict
 
+from utils import storage
+
 
 def ensure_users_file():
-    """Create users.xlsx if it doesn't exist with default admin user."""
-    os.makedirs("data", exist_ok=True)
-    path = "data/users.xlsx"
-    if not os.path.exists(path):
+    """Seed the users table with default accounts if it is empty."""
+    if storage.load_users().empty:
         default_users = pd.DataFrame([
             {
                 "name": "Admin",
@@ -33,22 +32,17 @@ def ensure_users_file():
                 "allowed_pages": "dashboard,reports"
             }
         ])
-        default_users.to_excel(path, index=False)
+        storage.save_users(default_users)
 
 
 def load_users() -> pd.DataFrame:
     """
-    Load users from data/users.xlsx.
+    Load users from the storage engine.
     Returns DataFrame with columns: name, pin, role, allowed_pages
     """
     ensure_users_file()
     try:
-        df = pd.read_excel("data/users.xlsx")
-        df.columns = [c.strip().lower() for c in df.columns]
-        for col in ["name", "pin", "role", "allowed_pages"]:
-            if col not in df.columns:
-                df[col] = ""
-        return df
+        return storage.load_users()
     except Exception as e:
         print(f"Error loading users: {e}")
         return pd.DataFrame(columns=["name", "pin", "role", "allowed_pages"])
@@ -56,11 +50,10 @@ def load_users() -> pd.DataFrame:
 
 def save_users(df: pd.DataFrame):
     """
-    Save users DataFrame to data/users.xlsx.
+    Save users DataFrame to the storage engine.
     """
     try:
-        os.makedirs("data", exist_ok=True)
-        df.to_excel("data/users.xlsx", index=False)
+        storage.save_users(df)
     except Exception as e:
         print(f"Error saving users: {e}")
 
@@ -0,0 +1,487 @@
+"""
+Batch Document Export for Newton Smart Home Application
+Renders many quotations, invoices and receipts from a JSON or CSV file into a
+directory, in parallel across a process pool, without a browser session.
+
+Usage (from the project root):
+    python -m utils.batch_export batch.json --out data/exports/batch --format docx,pdf --workers 4
+    python -m utils.batch_export --records --start 2025-01-01 --end 2025-12-31 --zip data/exports/2025.zip
+
+--records rebuilds the documents behind stored records (totals only, no line items).
+--zip streams everything into one archive on disk instead of loose files.
+
+JSON: a list of documents (or {"documents": [...]}), for example
+    {"type": "invoice", "number": "INV-20250101-001", "client_name": "Ali",
+     "client_phone": "0501234567", "client_location": "Dubai",
+     "installation_cost": 500, "discount_percent": 5,
+     "items": [{"product": "Light Switch", "qty": 4}]}
+    {"type": "receipt", "number": "R-...", "invoice_no": "INV-...", "client_name": "Ali",
+     "amount": 1500, "balance": 0}
+
+CSV: one row per line item with the same column names (product, description,
+qty, unit_price, warranty for items); rows sharing type + number form one document.
+Missing item description/price/warranty are filled in from the product catalog.
+"""
+
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import re
+import sys
+import tempfile
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+from typing import Callable, Dict, List, Optional
+
+import pandas as pd
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from utils.documents import (  # noqa: E402
+    INVOICE_TEMPLATE, QUOTATION_TEMPLATE, RECEIPT_TEMPLATE,
+    attach_product_images, invoice_fields, quotation_fields, receipt_fields,
+    render_invoice_docx, render_quotation_docx, render_receipt_docx,
+)
+from utils.fileio import atomic_write  # noqa: E402
+
+
+TYPE_ALIASES = {"q": "quotation", "quote": "quotation", "i": "invoice", "r": "receipt"}
+ITEM_FIELDS = {
+    "Product / Device": ("product", "device", "Product / Device"),
+    "Description": ("description", "Description"),
+    "Qty": ("qty", "quantity", "Qty"),
+    "Unit Price (AED)": ("unit_price", "price", "Unit Price (AED)"),
+    "Line Total (AED)": ("line_total", "Line Total (AED)"),
+    "Warranty (Years)": ("warranty", "Warranty (Years)"),
+}
+
+# Per-process state, set up by _init_worker
+_catalog: Optional[pd.DataFrame] = None
+_settings: Dict = {}
+
+
+# ==========================================
+# Input parsing
+# ==========================================
+
+def _blank(value) -> bool:
+    return value is None or (isinstance(value, float) and pd.isna(value)) or str(value).strip() == ""
+
+
+def _pick(raw: Dict, names) -> object:
+    for name in names:
+        if name in raw and not _blank(raw[name]):
+            return raw[name]
+    return None
+
+
+def _num(value, default=0.0) -> float:
+    try:
+        return default if _blank(value) else float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def load_batch(path: str) -> List[Dict]:
+    """
+    Read a JSON or CSV batch file.
+
+    Returns:
+        List of document dicts (CSV rows grouped into documents with an "items" list)
+    """
+    if path.lower().endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        docs = data.get("documents", []) if isinstance(data, dict) else data
+        return [dict(d) for d in docs]
+
+    docs: Dict[tuple, Dict] = {}
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        for row in csv.DictReader(f):
+            row = {k.strip(): (v.strip() if isinstance(v, str) else v) for k, v in row.items() if k}
+            key = (row.get("type", ""), row.get("number", ""))
+            doc = docs.get(key)
+            if doc is None:
+                doc = {k: v for k, v in row.items() if v != ""}
+                doc["items"] = []
+                docs[key] = doc
+            if _pick(row, ITEM_FIELDS["Product / Device"]) is not None:
+                doc["items"].append(row)
+    return list(docs.values())
+
+
+def normalize_items(raw_items: List[Dict], catalog: Optional[pd.DataFrame]) -> List[Dict]:
+    """Line items in the page column layout, completed from the catalog."""
+    items = []
+    for idx, raw in enumerate(raw_items or []):
+        item = {col: _pick(raw, names) for col, names in ITEM_FIELDS.items()}
+        name = str(item["Product / Device"] or "")
+        if catalog is not None and not catalog.empty and name:
+            match = catalog[catalog["Device"].astype(str) == name]
+            if not match.empty:
+                row = match.iloc[0]
+                if _blank(item["Description"]):
+                    item["Description"] = row.get("Description", "")
+                if _blank(item["Unit Price (AED)"]):
+                    item["Unit Price (AED)"] = row.get("UnitPrice", 0)
+                if _blank(item["Warranty (Years)"]):
+                    item["Warranty (Years)"] = row.get("Warranty", "")
+        qty = _num(item["Qty"], 1.0)
+        price = _num(item["Unit Price (AED)"])
+        item["Item No"] = idx + 1
+        item["Product / Device"] = name
+        item["Description"] = "" if _blank(item["Description"]) else str(item["Description"])
+        item["Qty"] = int(qty) if qty.is_integer() else qty
+        item["Unit Price (AED)"] = price
+        item["Line Total (AED)"] = _num(item["Line Total (AED)"], qty * price)
+        w = _num(item["Warranty (Years)"], 0)
+        item["Warranty (Years)"] = int(w) if float(w).is_integer() else w
+        items.append(item)
+    return items
+
+
+def _safe_name(text: str) -> str:
+    return re.sub(r"[^\w\-.]+", "_", str(text)).strip("_") or "document"
+
+
+# ==========================================
+# Rendering (runs in worker processes)
+# ==========================================
+
+def _init_worker(root: str):
+    global _catalog, _settings
+    os.chdir(root)
+    from utils.settings import load_settings
+    from utils.storage import load_products
+    _settings = load_settings()
+    try:
+        _catalog = load_products()
+    except Exception as e:
+        print(f"Error loading product catalog: {e}")
+        _catalog = pd.DataFrame(columns=["Device"])
+
+
+def _apply_stored_total(doc_type: str, data: Dict, amount: float):
+    """Documents rebuilt from records have no line items: show the stored amount as the total."""
+    total = f"{_num(amount):,.2f}"
+    if doc_type == "quotation":
+        data.update({"{{total1}}": total, "{{Price}}": total, "{{Total}}": total,
+                     "{{grand_total}}": total, "{{QTY}}": ""})
+    elif doc_type == "invoice":
+        data.update({"{{total_products}}": total, "{{grand_total}}": total})
+
+
+def build_document(doc: Dict, formats: List[str]):
+    """
+    Render one batch entry in memory.
+
+    Returns:
+        (folder, [(file name, content bytes)]) where folder is quotations/invoices/receipts
+    """
+    from utils.pdf_renderer import render_invoice_pdf, render_quotation_pdf, render_receipt_pdf
+
+    doc_type = str(doc.get("type", "")).strip().lower()
+    doc_type = TYPE_ALIASES.get(doc_type, doc_type)
+    number = str(doc.get("number", "")).strip()
+    if not number:
+        raise ValueError("missing number")
+    name = str(doc.get("client_name", "") or "")
+    phone = str(_pick(doc, ("client_phone", "phone")) or "")
+    location = str(_pick(doc, ("client_location", "location")) or "")
+    items = normalize_items(doc.get("items", []), _catalog)
+
+    if doc_type == "quotation":
+        items = attach_product_images(
+            items, _catalog if _catalog is not None else pd.DataFrame(columns=["Device"]),
+            float(_settings.get("quote_product_image_width_cm", 3.49)),
+            float(_settings.get("quote_product_image_height_cm", 1.5)),
+        )
+        data = quotation_fields(
+            number, name, phone, location,
+            str(doc.get("prepared_by") or _settings.get("default_prepared_by", "")),
+            str(doc.get("approved_by") or _settings.get("default_approved_by", "")),
+            items, _num(doc.get("installation_cost")), _num(doc.get("discount_value")),
+            _num(doc.get("discount_percent")),
+        )
+        base = f"Quotation_{_safe_name(name)}_{_safe_name(number)}"
+        template, render_docx, render_pdf = QUOTATION_TEMPLATE, render_quotation_docx, render_quotation_pdf
+    elif doc_type == "invoice":
+        data = invoice_fields(
+            number, name, phone, location, items, _num(doc.get("installation_cost")),
+            _num(doc.get("discount_value")), _num(doc.get("discount_percent")),
+        )
+        base = f"Invoice_{_safe_name(number)}"
+        template, render_docx, render_pdf = INVOICE_TEMPLATE, render_invoice_docx, render_invoice_pdf
+    elif doc_type == "receipt":
+        data = receipt_fields(
+            number, str(doc.get("invoice_no", "")), name, phone, location,
+            _num(doc.get("amount")), _num(doc.get("balance")),
+        )
+        base = f"Receipt_{_safe_name(number)}"
+        template, render_docx, render_pdf = RECEIPT_TEMPLATE, render_receipt_docx, render_receipt_pdf
+    else:
+        raise ValueError(f"unknown type '{doc.get('type', '')}'")
+
+    if not items and doc_type != "receipt" and not _blank(doc.get("amount")):
+        _apply_stored_total(doc_type, data, doc.get("amount"))
+
+    files = []
+    for fmt in formats:
+        if fmt == "docx":
+            content = render_docx(template, data, items)
+        elif fmt == "pdf":
+            content = render_pdf(data, items)
+        else:
+            raise ValueError(f"unknown format '{fmt}'")
+        files.append((f"{base}.{fmt}", content))
+    return f"{doc_type}s", files
+
+
+def render_document(doc: Dict, out_dir: str, formats: List[str]) -> List[str]:
+    """
+    Render one batch entry to out_dir.
+
+    Returns:
+        Paths of the written files
+    """
+    _, files = build_document(doc, formats)
+    written = []
+    for name, content in files:
+        path = os.path.join(out_dir, name)
+        atomic_write(path, content, lock=False)
+        written.append(path)
+    return written
+
+
+def _render_job(doc: Dict, out_dir: str, formats: List[str]):
+    try:
+        return True, render_document(doc, out_dir, formats)
+    except Exception as e:
+        return False, str(e)
+
+
+def _build_job(doc: Dict, formats: List[str]):
+    try:
+        return True, build_document(doc, formats)
+    except Exception as e:
+        return False, str(e)
+
+
+def _process_pool(workers: int) -> ProcessPoolExecutor:
+    # spawn: forking a threaded server process (Streamlit) is unsafe
+    return ProcessPoolExecutor(
+        max_workers=workers or os.cpu_count() or 1,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker, initargs=(ROOT,),
+    )
+
+
+def run_batch(docs: List[Dict], out_dir: str, formats: List[str], workers: int = 0) -> Dict[str, int]:
+    """
+    Render all documents across a process pool.
+
+    Args:
+        docs: Entries from load_batch()
+        out_dir: Output directory (created if missing)
+        formats: Any of "docx", "pdf"
+        workers: Process count (0 = one per CPU)
+
+    Returns:
+        {"ok": n, "failed": n, "files": n}
+    """
+    out_dir = os.path.abspath(out_dir)
+    os.makedirs(out_dir, exist_ok=True)
+    stats = {"ok": 0, "failed": 0, "files": 0}
+    with _process_pool(workers) as pool:
+        futures = {pool.submit(_render_job, doc, out_dir, formats): doc for doc in docs}
+        for future in as_completed(futures):
+            doc = futures[future]
+            ok, result = future.result()
+            if ok:
+                stats["ok"] += 1
+                stats["files"] += len(result)
+                for path in result:
+                    print(f"✓ {path}")
+            else:
+                stats["failed"] += 1
+                print(f"✗ {doc.get('type', '?')} {doc.get('number', '?')}: {result}")
+    return stats
+
+
+# ==========================================
+# Historical documents (records) -> ZIP
+# ==========================================
+
+def records_to_batch(records: pd.DataFrame, start=None, end=None,
+                     types: Optional[List[str]] = None) -> List[Dict]:
+    """
+    Batch entries that rebuild the documents behind stored records.
+    Records keep totals only, so quotations/invoices show the stored amount.
+    A receipt refers to the latest invoice of its project saved before it, and
+    its balance is that invoice minus all of the project's receipts so far
+    (as on the Receipt page).
+
+    Args:
+        records: All rows in insertion order (as returned by storage.load_records);
+            earlier rows are needed for receipt balances even outside the range
+        start, end: Optional inclusive date range of the documents to emit
+        types: Optional record types to emit ("q", "i", "r")
+    """
+    if records.empty:
+        return []
+    records = records.copy()
+    records["type"] = records["type"].astype(str).str.lower()
+    records["amount"] = pd.to_numeric(records["amount"], errors="coerce").fillna(0.0)
+    dates = pd.to_datetime(records["date"], errors="coerce")
+    emit = pd.Series(True, index=records.index)
+    if start is not None:
+        emit &= dates >= pd.Timestamp(start)
+    if end is not None:
+        emit &= dates < pd.Timestamp(end) + pd.Timedelta(days=1)
+    if types:
+        emit &= records["type"].isin(types)
+
+    last_invoice: Dict[str, pd.Series] = {}
+    paid: Dict[str, float] = {}
+    docs = []
+    for idx, rec in records.iterrows():
+        doc_type = TYPE_ALIASES.get(rec["type"])
+        if doc_type is None:
+            continue
+        doc = {
+            "type": doc_type,
+            "number": rec.get("number", ""),
+            "client_name": "" if _blank(rec.get("client_name")) else rec.get("client_name"),
+            "client_phone": "" if _blank(rec.get("phone")) else rec.get("phone"),
+            "client_location": "" if _blank(rec.get("location")) else rec.get("location"),
+            "amount": float(rec["amount"]),
+        }
+        base_id = str(rec.get("base_id", ""))
+        if doc_type == "invoice":
+            last_invoice[base_id] = rec
+        elif doc_type == "receipt":
+            inv = last_invoice.get(base_id)
+            paid[base_id] = paid.get(base_id, 0.0) + float(rec["amount"])
+            doc["invoice_no"] = "" if inv is None else inv.get("number", "")
+            doc["balance"] = (0.0 if inv is None else float(inv["amount"])) - paid[base_id]
+        if emit[idx]:
+            docs.append(doc)
+    return docs
+
+
+def export_zip(docs: List[Dict], zip_path: str, formats: List[str], workers: int = 0,
+               progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, int]:
+    """
+    Render documents in worker processes and stream them into a ZIP on disk.
+    Only a bounded window of rendered documents is held in memory at a time;
+    the archive is written to a temporary file of its own (so concurrent exports
+    never share one) and moved into place at the end.
+
+    Args:
+        docs: Batch entries (see load_batch / records_to_batch)
+        zip_path: Destination .zip
+        formats: Any of "docx", "pdf"
+        workers: Process count (0 = one per CPU)
+        progress: Optional callback(done, total)
+
+    Returns:
+        {"ok": n, "failed": n, "files": n}
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(zip_path)), exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    fd, tmp_path = tempfile.mkstemp(
+        prefix=f".{os.path.basename(zip_path)}.", suffix=".part", dir=os.path.dirname(os.path.abspath(zip_path)),
+    )
+    os.close(fd)
+    stats = {"ok": 0, "failed": 0, "files": 0}
+    errors = []
+    total = len(docs)
+    pending = iter(docs)
+
+    try:
+        with _process_pool(workers) as pool, \
+                zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+            window = 2 * workers
+            in_flight = {}
+
+            def fill():
+                while len(in_flight) < window:
+                    doc = next(pending, None)
+                    if doc is None:
+                        return
+                    in_flight[pool.submit(_build_job, doc, formats)] = doc
+
+            fill()
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    doc = in_flight.pop(future)
+                    ok, result = future.result()
+                    if ok:
+                        folder, files = result
+                        for name, content in files:
+                            zf.writestr(f"{folder}/{name}", content)
+                        stats["ok"] += 1
+                        stats["files"] += len(files)
+                    else:
+                        stats["failed"] += 1
+                        errors.append(f"{doc.get('type', '?')} {doc.get('number', '?')}: {result}")
+                fill()
+                if progress is not None:
+                    progress(stats["ok"] + stats["failed"], total)
+            if errors:
+                zf.writestr("errors.txt", "\n".join(errors) + "\n")
+        os.replace(tmp_path, zip_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    return stats
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Render quotations, invoices and receipts in bulk.")
+    parser.add_argument("batch", nargs="?", help="JSON or CSV batch file")
+    parser.add_argument("--records", action="store_true", help="Rebuild documents from stored records instead")
+    parser.add_argument("--start", help="With --records: first date (YYYY-MM-DD)")
+    parser.add_argument("--end", help="With --records: last date (YYYY-MM-DD)")
+    parser.add_argument("--out", default="data/exports/batch", help="Output directory")
+    parser.add_argument("--zip", help="Write a single ZIP here instead of files in --out")
+    parser.add_argument("--format", default="docx", help="Comma-separated: docx, pdf")
+    parser.add_argument("--workers", type=int, default=0, help="Worker processes (default: CPU count)")
+    args = parser.parse_args(argv)
+    if not args.batch and not args.records:
+        parser.error("give a batch file or --records")
+
+    batch_path = os.path.abspath(args.batch) if args.batch else None
+    out_dir = os.path.abspath(args.out)
+    zip_path = os.path.abspath(args.zip) if args.zip else None
+    formats = [f.strip().lower() for f in args.format.split(",") if f.strip()]
+    os.chdir(ROOT)  # templates and data/ are relative to the project root
+
+    if args.records:
+        from utils.storage import load_records
+        docs = records_to_batch(load_records(), args.start, args.end)
+    else:
+        docs = load_batch(batch_path)
+    start = time.time()
+    if zip_path:
+        stats = export_zip(docs, zip_path, formats, args.workers)
+        print(f"✓ {zip_path}")
+    else:
+        stats = run_batch(docs, out_dir, formats, args.workers)
+    print(f"{stats['ok']} documents ({stats['files']} files) in {time.time() - start:.1f}s, "
+          f"{stats['failed']} failed")
+    return 1 if stats["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,81 @@
+"""
+Shared Data Cache for Newton Smart Home Application
+Process-wide, thread-safe cache of loaded DataFrames shared by all Streamlit
+sessions. An entry is reused until its write version is bumped (by the
+storage save helpers) or the signature (mtime/size) of its backing files changes.
+"""
+
+import os
+import threading
+from typing import Callable, Dict, Optional, Tuple
+
+import pandas as pd
+
+
+_lock = threading.Lock()
+_versions: Dict[str, int] = {}
+_entries: Dict[str, Tuple[tuple, pd.DataFrame]] = {}
+
+
+def file_signature(*paths: str) -> tuple:
+    """(mtime_ns, size) for each path, None for missing files."""
+    sig = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            sig.append((st.st_mtime_ns, st.st_size))
+        except OSError:
+            sig.append(None)
+    return tuple(sig)
+
+
+def get_version(key: str) -> int:
+    """Current write version of a cache key."""
+    with _lock:
+        return _versions.get(key, 0)
+
+
+def bump_version(key: str) -> int:
+    """Mark a key as written; the next read reloads it."""
+    with _lock:
+        _versions[key] = _versions.get(key, 0) + 1
+        _entries.pop(key, None)
+        return _versions[key]
+
+
+def invalidate(key: Optional[str] = None):
+    """Drop one cached entry, or all of them."""
+    with _lock:
+        if key is None:
+            _entries.clear()
+        else:
+            _entries.pop(key, None)
+
+
+def cached_frame(key: str, loader: Callable[[], pd.DataFrame], paths: tuple = ()) -> pd.DataFrame:
+    """
+    Return a snapshot of the DataFrame produced by loader, loading it at most
+    once per (write version, file signature).
+
+    Args:
+        key: Cache key (e.g. "table:records")
+        loader: Function that loads the DataFrame on a miss
+        paths: Backing files whose mtime/size invalidate the entry
+
+    Returns:
+        A private copy, so callers may modify it without affecting other sessions
+    """
+    with _lock:
+        version = _versions.get(key, 0)
+        sig = (version, file_signature(*paths))
+        hit = _entries.get(key)
+        if hit is not None and hit[0] == sig:
+            return hit[1].copy()
+
+    df = loader()
+
+    with _lock:
+        # A write that landed while loading makes this result stale; don't keep it
+        if _versions.get(key, 0) == version:
+            _entries[key] = (sig, df)
+    return df.copy()
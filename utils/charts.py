@@ -0,0 +1,110 @@
+"""
+Report Charts for Newton Smart Home Application
+Builds the Reports page charts from report cube cells (utils/analytics.py),
+aggregated on the server to what the chart can show: time series are binned
+to months, quarters or years so they never exceed MAX_MARKS bars, and the
+client chart keeps the TOP_CLIENTS largest clients plus one "Others" bar.
+The Vega-Lite specs are cached per chart, filter and data version, so reruns
+with the same filters send the same small spec without rebuilding it.
+"""
+
+import json
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable
+
+import altair as alt
+import pandas as pd
+
+from utils import analytics, storage
+
+
+MAX_MARKS = 48  # bars per time series chart
+TOP_CLIENTS = 15  # client bars, besides "Others"
+SPEC_CACHE_SIZE = 128
+
+# Coarser bins are used until the series fits in MAX_MARKS
+RESOLUTIONS = [("M", "yearmonth", "Month"), ("Q", "yearquarter", "Quarter"), ("Y", "year", "Year")]
+
+_lock = threading.Lock()
+_specs: "OrderedDict[tuple, str]" = OrderedDict()
+
+
+def _cached_spec(key: Hashable, build: Callable[[], alt.Chart]) -> Dict:
+    """
+    Vega-Lite spec of the chart build() returns, built once per key and data version.
+    A fresh dict is returned each time (st.vega_lite_chart modifies the spec it is given).
+    """
+    # Partial months are read from records, queued ones included
+    key = (key, storage.table_version("report_cube"), storage.table_version("records"))
+    with _lock:
+        spec = _specs.get(key)
+        if spec is not None:
+            _specs.move_to_end(key)
+    if spec is None:
+        spec = json.dumps(build().to_dict())
+        with _lock:
+            _specs[key] = spec
+            while len(_specs) > SPEC_CACHE_SIZE:
+                _specs.popitem(last=False)
+    return json.loads(spec)
+
+
+def binned_series(cells: pd.DataFrame, rtype: str, max_marks: int = MAX_MARKS):
+    """
+    Amount per period for one record type, at the finest resolution that fits
+    in max_marks periods.
+
+    Returns:
+        (DataFrame with "period" (Timestamp) and "amount", Vega-Lite timeUnit, axis title)
+    """
+    monthly = analytics.monthly(cells, rtype).dropna(subset=["month"])
+    for freq, time_unit, title in RESOLUTIONS:
+        periods = monthly["month"].dt.to_period(freq).dt.start_time
+        series = monthly.groupby(periods)["amount"].sum().rename_axis("period").reset_index()
+        if len(series) <= max_marks:
+            break
+    return series, time_unit, title
+
+
+def top_with_others(top: pd.DataFrame, n: int = TOP_CLIENTS) -> pd.DataFrame:
+    """The first n rows of a by_client() frame plus one row summing the rest."""
+    if len(top) <= n:
+        return top
+    rest = top.iloc[n:]
+    others = pd.DataFrame([{
+        "client_name": f"Others ({len(rest)})",
+        **{c: rest[c].sum() for c in ("Total Invoiced", "Total Paid", "Balance")},
+    }])
+    return pd.concat([top.iloc[:n], others], ignore_index=True)
+
+
+# ==========================================
+# Chart specs
+# ==========================================
+
+def series_spec(cells: pd.DataFrame, rtype: str, flt: analytics.ReportFilter,
+                mark: str = "bar", color: str = "#0a84ff", opacity: float = 1.0) -> Dict:
+    """Amount over time for one record type ("i" revenue, "r" collections)."""
+
+    def build():
+        series, time_unit, title = binned_series(cells, rtype)
+        chart = getattr(alt.Chart(series), f"mark_{mark}")(color=color, opacity=opacity)
+        return chart.encode(
+            x=alt.X("period:T", timeUnit=time_unit, title=title),
+            y=alt.Y("amount:Q", title="Amount"),
+        ).properties(height=220)
+
+    return _cached_spec(("series", rtype, mark, flt), build)
+
+
+def clients_spec(top: pd.DataFrame, flt: analytics.ReportFilter) -> Dict:
+    """Horizontal bars of invoiced amount for the largest clients."""
+
+    def build():
+        data = top_with_others(top)[["client_name", "Total Invoiced"]].rename(columns={"client_name": "Customer Name"})
+        return alt.Chart(data).mark_bar(color="#0a84ff").encode(
+            x="Total Invoiced:Q", y=alt.Y("Customer Name:N", sort="-x")
+        ).properties(height=300)
+
+    return _cached_spec(("clients", flt), build)
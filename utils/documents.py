@@ -0,0 +1,283 @@
+"""
+Document Generators for Newton Smart Home Application
+Pure functions that build quotation, invoice and receipt documents from plain
+data (placeholder dict + line items). They never touch Streamlit session state,
+so the pages, background jobs and the batch CLI (utils/batch_export.py) share them.
+"""
+
+import base64
+import os
+from io import BytesIO
+from typing import Dict, List, Optional
+
+import pandas as pd
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+from docx.shared import Cm, Pt
+
+from utils.sequences import signature
+from utils.templates import fill_placeholders, new_document
+
+
+QUOTATION_TEMPLATE = "data/quotation_template.docx"
+INVOICE_TEMPLATE = "data/invoice_template.docx"
+RECEIPT_TEMPLATE = "data/receipt_template.docx"
+
+ITEM_COLUMNS = [
+    "Item No", "Product / Device", "Description",
+    "Qty", "Unit Price (AED)", "Line Total (AED)", "Warranty (Years)"
+]
+
+
+# ==========================================
+# Totals and placeholder data
+# ==========================================
+
+def _num(value, default: float = 0.0) -> float:
+    try:
+        if value is None or pd.isna(value):
+            return default
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def document_totals(items: List[Dict], installation_cost: float = 0.0,
+                    discount_value: float = 0.0, discount_percent: float = 0.0) -> Dict[str, float]:
+    """
+    Totals shared by quotations and invoices.
+
+    Returns:
+        Dict with product_total, qty_sum, percent_value, total_discount, grand_total
+    """
+    product_total = sum(_num(i.get("Line Total (AED)")) for i in items)
+    qty_sum = sum(_num(i.get("Qty")) for i in items)
+    installation_cost = _num(installation_cost)
+    percent_value = (product_total + installation_cost) * (_num(discount_percent) / 100)
+    total_discount = percent_value + _num(discount_value)
+    return {
+        "product_total": product_total,
+        "qty_sum": int(qty_sum) if float(qty_sum).is_integer() else qty_sum,
+        "percent_value": percent_value,
+        "total_discount": total_discount,
+        "grand_total": (product_total + installation_cost) - total_discount,
+    }
+
+
+def quotation_fields(quote_no: str, client_name: str, client_phone: str, client_location: str,
+                     prepared_by: str, approved_by: str, items: List[Dict],
+                     installation_cost: float = 0.0, discount_value: float = 0.0,
+                     discount_percent: float = 0.0) -> Dict[str, object]:
+    """Placeholder dict for data/quotation_template.docx."""
+    t = document_totals(items, installation_cost, discount_value, discount_percent)
+    return {
+        "{{client_name}}": client_name,
+        "{{quote_no}}": quote_no,
+        "{{client_location}}": client_location,
+        "{{prepared_by}}": prepared_by,
+        "{{client_phone}}": client_phone or "N/A",
+        "{{approved_by}}": approved_by,
+        "{{client_email}}": "N/A",
+        # Quotation template keys
+        "{{total1}}": f"{t['product_total']:,.2f}",
+        "{{installation_cost}}": f"{_num(installation_cost):,.2f}",
+        "{{Price}}": f"{t['product_total']:,.2f}",
+        "{{Total}}": f"{t['grand_total']:,.2f}",
+        "{{QTY}}": t["qty_sum"],
+        # Extra keys (no-op if not present in template)
+        "{{discount_value}}": f"{_num(discount_value):,.2f}",
+        "{{discount_percent}}": f"{_num(discount_percent):,.0f}",
+        "{{total_discount}}": f"{t['total_discount']:,.2f}",
+        "{{grand_total}}": f"{t['grand_total']:,.2f}",
+    }
+
+
+def invoice_fields(invoice_no: str, client_name: str, client_phone: str, client_location: str,
+                   items: List[Dict], installation_cost: float = 0.0, discount_value: float = 0.0,
+                   discount_percent: float = 0.0) -> Dict[str, object]:
+    """Placeholder dict for data/invoice_template.docx."""
+    t = document_totals(items, installation_cost, discount_value, discount_percent)
+    return {
+        "{{client_name}}": client_name,
+        "{{invoice_no}}": invoice_no,
+        "{{client_location}}": client_location,
+        "{{client_phone}}": client_phone,
+        "{{total_products}}": f"{t['product_total']:,.2f}",
+        "{{installation}}": f"{_num(installation_cost):,.2f}",
+        "{{discount_value}}": f"{_num(discount_value):,.2f}",
+        "{{discount_percent}}": f"{_num(discount_percent):,.0f}",
+        "{{grand_total}}": f"{t['grand_total']:,.2f}",
+    }
+
+
+def receipt_fields(receipt_no: str, invoice_no: str, client_name: str, client_phone: str,
+                   client_location: str, amount: float, balance: float) -> Dict[str, object]:
+    """Placeholder dict for data/receipt_template.docx."""
+    return {
+        "{{client_name}}": client_name,
+        "{{invoice_no}}": invoice_no,
+        "{{receipt_no}}": receipt_no,
+        "{{client_phone}}": client_phone,
+        "{{client_location}}": client_location,
+        "{{amount}}": f"{_num(amount):,.2f}",
+        "{{balance}}": f"{_num(balance):,.2f}",
+    }
+
+
+def receipt_signature(invoice_no: str, payment: float, prev_receipts: pd.DataFrame) -> str:
+    """
+    Reservation signature of a receipt: its invoice and payment plus the receipts
+    already saved for the project, so once a receipt is saved the next payment
+    (even of the same amount) gets a new receipt number.
+    """
+    paid = pd.to_numeric(prev_receipts["amount"], errors="coerce").fillna(0.0).sum() if len(prev_receipts) else 0.0
+    return signature(invoice_no, _num(payment), len(prev_receipts), round(float(paid), 2))
+
+
+def attach_product_images(items: List[Dict], catalog: pd.DataFrame,
+                          width_cm: float, height_cm: float) -> List[Dict]:
+    """
+    Copy of the line items with each product's catalog image and the image size,
+    so the renderers (and the export cache key) need nothing else.
+    """
+    image_map = {}
+    image_path_map = {}
+    try:
+        if 'ImageBase64' in catalog.columns:
+            image_map = dict(zip(catalog['Device'].astype(str), catalog['ImageBase64']))
+        if 'ImagePath' in catalog.columns:
+            image_path_map = dict(zip(catalog['Device'].astype(str), catalog['ImagePath']))
+    except Exception:
+        image_map = {}
+        image_path_map = {}
+
+    out = []
+    for item in items:
+        item = dict(item)
+        prod_name = str(item.get("Product / Device", ""))
+        b64_img = image_map.get(prod_name)
+        img_path = image_path_map.get(prod_name)
+        item["ImageBase64"] = None if b64_img is None or pd.isna(b64_img) else b64_img
+        item["ImagePath"] = None if img_path is None or pd.isna(img_path) else img_path
+        item["ImageWidthCm"] = float(width_cm)
+        item["ImageHeightCm"] = float(height_cm)
+        out.append(item)
+    return out
+
+
+# ==========================================
+# Word rendering
+# ==========================================
+
+def _insert_image_in_cell(cell, b64_str: str, width_cm: float, height_cm: float, img_path: str = None):
+    try:
+        bio = None
+        if img_path and os.path.exists(img_path):
+            with open(img_path, "rb") as f:
+                bio = BytesIO(f.read())
+        elif b64_str and not pd.isna(b64_str):
+            img_bytes = base64.b64decode(b64_str)
+            bio = BytesIO(img_bytes)
+        if bio is None:
+            return False
+        # تفريغ محتوى الخلية ثم إدراج الصورة في فقرة محاذاة للوسط
+        cell.text = ""
+        p = cell.paragraphs[0] if cell.paragraphs else cell.add_paragraph("")
+        p.alignment = WD_ALIGN_PARAGRAPH.CENTER
+        run = p.add_run()
+        run.add_picture(bio, width=Cm(width_cm), height=Cm(height_cm))
+        return True
+    except Exception:
+        return False
+
+
+def _format_cell(cell, font_name, font_size, align):
+    for paragraph in cell.paragraphs:
+        paragraph.alignment = align
+        for run in paragraph.runs:
+            run.font.name = font_name
+            run.font.size = Pt(font_size)
+
+
+def _to_bytes(doc) -> bytes:
+    buffer = BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+def render_quotation_docx(template: str, data: Dict, items: Optional[List[Dict]]) -> bytes:
+    """
+    Quotation Word document.
+
+    Args:
+        template: Path of the quotation template
+        data: Placeholder dict (see quotation_fields)
+        items: Line items, optionally with images (see attach_product_images)
+
+    Returns:
+        .docx bytes
+    """
+    doc, compiled = new_document(template)
+    products = items or []
+
+    def format_replaced(cell, old, new):
+        # إذا كانت الخلية تحتوي على قيمة QTY بعد الاستبدال، اجعل المحاذاة Center
+        if "{{QTY}}" in old or (str(data.get("{{QTY}}")) in new and "QTY" in old):
+            _format_cell(cell, "Times New Roman (Headings CS)", 10, WD_ALIGN_PARAGRAPH.CENTER)
+        else:
+            _format_cell(cell, "Times New Roman (Headings CS)", 10, WD_ALIGN_PARAGRAPH.LEFT)
+
+    fill_placeholders(doc, compiled, data, format_replaced)
+
+    if compiled.item_table is None:
+        raise Exception("❌ Product table not found")
+    target_table = doc.tables[compiled.item_table]
+
+    start_row = 1
+    last_index = compiled.last_row
+    if last_index is None:
+        raise Exception("❌ 'last' row missing in Word template")
+
+    for i, product in enumerate(products):
+        row_index = start_row + i
+        if row_index >= last_index:
+            break
+        row = target_table.rows[row_index]
+        row.cells[0].text = str(product.get("Item No", i + 1))
+        # إدراج الصورة في عمود المنتج إن وُجدت، وإلا نكتب الاسم نصياً
+        prod_name = str(product.get("Product / Device", ""))
+        placed = _insert_image_in_cell(
+            row.cells[1], product.get("ImageBase64"),
+            product.get("ImageWidthCm", 3.49), product.get("ImageHeightCm", 1.5),
+            product.get("ImagePath"),
+        )
+        if not placed:
+            row.cells[1].text = prod_name
+        row.cells[2].text = str(product.get("Description", ""))
+        row.cells[3].text = str(product.get("Qty", ""))
+        row.cells[4].text = f"{float(product.get('Unit Price (AED)', 0)):,.2f}"
+        row.cells[5].text = f"{float(product.get('Line Total (AED)', 0)):,.2f}"
+        row.cells[6].text = str(product.get("Warranty (Years)", ""))
+        for cell in row.cells:
+            _format_cell(cell, "Arial MT", 9, WD_ALIGN_PARAGRAPH.CENTER)
+
+    # حذف الصفوف الفارغة بعد المنتجات وأيضاً صف 'last' نفسه
+    delete_start = start_row + len(products)
+    for j in range(last_index, delete_start - 1, -1):
+        row = target_table.rows[j]
+        target_table._tbl.remove(row._tr)
+
+    return _to_bytes(doc)
+
+
+def render_invoice_docx(template: str, data: Dict, items: Optional[List[Dict]] = None) -> bytes:
+    """Invoice Word document (the template has placeholders only)."""
+    doc, compiled = new_document(template)
+    fill_placeholders(doc, compiled, data)
+    return _to_bytes(doc)
+
+
+def render_receipt_docx(template: str, data: Dict, items: Optional[List[Dict]] = None) -> bytes:
+    """Receipt Word document (the template has placeholders only)."""
+    doc, compiled = new_document(template)
+    fill_placeholders(doc, compiled, data)
+    return _to_bytes(doc)
@@ -0,0 +1,219 @@
+"""
+Document Export Cache for Newton Smart Home Application
+Word and PDF exports are rendered only when a download is requested and kept
+in an LRU cache (bounded by entries and total bytes) keyed by a hash of the
+output kind, the fill data, the line items and the template version, so
+downloading an unchanged document again costs nothing. Files larger than
+MAX_ENTRY_BYTES (bulk spreadsheets, documents with many images) are returned
+without being kept.
+
+Spreadsheet exports (reports, product lists) work the same way, keyed by the
+data version they were built from; workbooks are streamed row by row through
+openpyxl's write-only mode instead of being built in memory by DataFrame.to_excel.
+"""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from typing import Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import pandas as pd
+from openpyxl import Workbook
+
+from utils.office_pool import convert_docx_to_pdf, office_available
+from utils.settings import load_settings
+from utils.templates import template_version
+
+
+MAX_ENTRIES = 32
+MAX_BYTES = 64 * 1024 * 1024  # all cached exports together
+MAX_ENTRY_BYTES = 8 * 1024 * 1024  # larger exports are not cached
+
+_lock = threading.Lock()
+_entries: "OrderedDict[str, bytes]" = OrderedDict()
+_total_bytes = 0
+
+
+def export_key(template: str, data: Dict, items: Optional[List[Dict]] = None,
+               kind: str = "docx") -> str:
+    """
+    Content hash identifying one rendered document.
+
+    Args:
+        template: Path of the .docx template
+        data: Placeholder values ({"{{key}}": value})
+        items: Line items written into the product table (if any)
+        kind: Output format ("docx" or "pdf")
+
+    Returns:
+        Hex digest of kind + template version + data + items
+    """
+    payload = json.dumps(
+        [kind, template, template_version(template), data, items or []],
+        sort_keys=True, default=str, ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def render_export(template: str, data: Dict, items: Optional[List[Dict]],
+                  render: Callable, kind: str = "docx") -> bytes:
+    """
+    Return the document bytes, rendering only on a cache miss.
+
+    Args:
+        template: Path of the .docx template
+        data: Placeholder values
+        items: Line items (or None)
+        render: Function(template, data, items) returning bytes or a BytesIO
+        kind: Output format, part of the cache key
+
+    Returns:
+        Document contents
+    """
+    key = export_key(template, data, items, kind)
+    return _cached(key, lambda: render(template, data, items))
+
+
+def _cached(key: str, build: Callable) -> bytes:
+    global _total_bytes
+    with _lock:
+        hit = _entries.get(key)
+        if hit is not None:
+            _entries.move_to_end(key)
+            return hit
+
+    out = build()
+    if isinstance(out, BytesIO):
+        out = out.getvalue()
+
+    if len(out) > MAX_ENTRY_BYTES:
+        return out
+    with _lock:
+        old = _entries.pop(key, None)
+        if old is not None:
+            _total_bytes -= len(old)
+        _entries[key] = out
+        _total_bytes += len(out)
+        while len(_entries) > MAX_ENTRIES or _total_bytes > MAX_BYTES:
+            _total_bytes -= len(_entries.popitem(last=False)[1])
+    return out
+
+
+def lazy_export(template: str, data: Dict, items: Optional[List[Dict]],
+                render: Callable, kind: str = "docx") -> Callable[[], bytes]:
+    """
+    Deferred export for st.download_button(data=...): nothing is rendered
+    until the button is clicked.
+    """
+    data = dict(data)
+    items = [dict(i) for i in items] if items is not None else None
+    return lambda: render_export(template, data, items, render, kind)
+
+
+def lazy_pdf_export(template: str, data: Dict, items: Optional[List[Dict]],
+                    render_docx: Callable, render_pdf: Callable) -> Callable[[], bytes]:
+    """
+    Deferred PDF export. With pdf_engine = "office" (and LibreOffice installed)
+    the Word document is converted on the soffice pool for an exact match;
+    otherwise, or if that fails, the reportlab renderer is used.
+
+    Args:
+        render_docx: Word renderer, Function(template, data, items)
+        render_pdf: Native renderer, Function(data, items)
+    """
+    settings = load_settings()
+    if settings.get("pdf_engine") != "office" or not office_available():
+        return lazy_export(template, data, items, lambda _t, d, i: render_pdf(d, i), kind="pdf")
+
+    workers = int(settings.get("office_workers", 2) or 2)
+
+    def render_office(t, d, i):
+        try:
+            return convert_docx_to_pdf(render_export(t, d, i, render_docx), workers=workers)
+        except Exception as e:
+            print(f"Office PDF conversion failed, using built-in renderer: {e}")
+            return render_pdf(d, i)
+
+    return lazy_export(template, data, items, render_office, kind="pdf:office")
+
+
+def numbered_export(number: Callable[[], str],
+                    export_for: Callable[[str], Callable[[], bytes]]) -> Callable[[], bytes]:
+    """
+    Deferred export of a document whose number is only fixed when it is
+    downloaded (e.g. number=lambda: sequences.claim(held)).
+
+    Args:
+        number: Returns the document number
+        export_for: Deferred export (lazy_export / lazy_pdf_export) for a number
+    """
+    return lambda: export_for(number())()
+
+
+# ==========================================
+# Spreadsheet exports
+# ==========================================
+
+def _cell(value):
+    if value is None or (not isinstance(value, (str, bytes)) and pd.isna(value)):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    if hasattr(value, "item"):  # numpy scalar
+        return value.item()
+    return value
+
+
+def frame_rows(df: pd.DataFrame) -> Iterator[tuple]:
+    """Rows of a DataFrame as plain tuples (without materializing them all)."""
+    return df.itertuples(index=False, name=None)
+
+
+def xlsx_bytes(columns: Sequence[str], rows: Iterable[Sequence], sheet: str = "Sheet1") -> bytes:
+    """
+    Write a header and rows to an .xlsx with a write-only workbook, which
+    streams each row to disk instead of keeping cell objects for the sheet.
+
+    Args:
+        columns: Header row
+        rows: Row values (tuples), e.g. frame_rows(df) or storage.iter_rows(...)
+        sheet: Worksheet name
+    """
+    return xlsx_sheets({sheet: (columns, rows)})
+
+
+def xlsx_sheets(sheets: Dict[str, Tuple[Sequence[str], Iterable[Sequence]]]) -> bytes:
+    """Like xlsx_bytes, with one worksheet per {name: (columns, rows)} entry."""
+    wb = Workbook(write_only=True)
+    for name, (columns, rows) in sheets.items():
+        ws = wb.create_sheet(name)
+        ws.append(list(columns))
+        for row in rows:
+            ws.append([_cell(v) for v in row])
+    buf = BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
+
+
+def lazy_data_export(key: Hashable, build: Callable[[], bytes]) -> Callable[[], bytes]:
+    """
+    Deferred data export for st.download_button(data=...): build() runs when
+    the button is clicked, and its result is reused while key is unchanged.
+
+    Args:
+        key: Identifies the export and the data it is built from (include the
+            storage.table_version of the tables read, and any filters)
+        build: Function returning the file contents
+    """
+    digest = hashlib.sha256(json.dumps(["data", key], default=str).encode("utf-8")).hexdigest()
+    return lambda: _cached(digest, build)
+
+
+def clear_exports():
+    """Drop all cached documents."""
+    global _total_bytes
+    with _lock:
+        _entries.clear()
+        _total_bytes = 0
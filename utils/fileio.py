@@ -0,0 +1,158 @@
+"""
+Safe File Writes for Newton Smart Home Application
+Shared write layer for every data file outside the SQLite store (settings.json,
+exported workbooks, templates, log segments, generated documents). Writers take
+an advisory lock on a hidden ".<file>.lock" beside the file, so several server
+processes can share one data directory; whole-file writes go to a temp file in the same folder, are
+fsynced and then atomically renamed, so readers never see a half-written file.
+"""
+
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Union
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+LOCK_TIMEOUT = 30  # seconds
+
+_registry_lock = threading.Lock()
+_thread_locks: Dict[str, threading.RLock] = {}
+_held = threading.local()
+
+
+def _thread_lock(path: str) -> threading.RLock:
+    with _registry_lock:
+        return _thread_locks.setdefault(path, threading.RLock())
+
+
+def _os_lock(fd: int, deadline: float):
+    while True:
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise TimeoutError("Timed out waiting for a file lock")
+            time.sleep(0.02)
+
+
+def _os_unlock(fd: int):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+def lock_path(path: str) -> str:
+    directory, name = os.path.split(os.path.abspath(path))
+    return os.path.join(directory, f".{name}.lock")
+
+
+@contextmanager
+def file_lock(path: str, timeout: float = LOCK_TIMEOUT):
+    """
+    Exclusive lock for a data file, across threads and processes.
+    Re-entrant within a thread, so read-modify-write helpers can nest writes.
+    """
+    key = os.path.abspath(path)
+    depth = getattr(_held, "depth", None)
+    if depth is None:
+        depth = _held.depth = {}
+    tlock = _thread_lock(key)
+    if not tlock.acquire(timeout=timeout):
+        raise TimeoutError(f"Timed out waiting for {path}")
+    try:
+        if depth.get(key):
+            depth[key] += 1
+            try:
+                yield
+            finally:
+                depth[key] -= 1
+            return
+        os.makedirs(os.path.dirname(key), exist_ok=True)
+        fd = os.open(lock_path(key), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            _os_lock(fd, time.monotonic() + timeout)
+            depth[key] = 1
+            try:
+                yield
+            finally:
+                depth[key] = 0
+                _os_unlock(fd)
+        finally:
+            os.close(fd)
+    finally:
+        tlock.release()
+
+
+def _fsync_dir(directory: str):
+    if fcntl is None:
+        return  # directories cannot be opened for fsync on Windows
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def atomic_writer(path: str, mode: str = "wb", encoding: str = None, lock: bool = True):
+    """
+    File object for replacing path in one step; the new content only becomes
+    visible (atomically) if the block finishes without an exception.
+    Pass lock=False for files no other writer shares (unique output names).
+
+    Example:
+        with atomic_writer("data/settings.json", "w", encoding="utf-8") as f:
+            json.dump(settings, f)
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    with (file_lock(path) if lock else nullcontext()):
+        fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", suffix=os.path.basename(path), dir=directory)
+        try:
+            with os.fdopen(fd, mode, encoding=encoding) as f:
+                yield f
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+            _fsync_dir(directory)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+
+def atomic_write(path: str, data: Union[bytes, str], encoding: str = "utf-8", lock: bool = True):
+    """Replace path with data (bytes, or text in the given encoding)."""
+    if isinstance(data, str):
+        data = data.encode(encoding)
+    with atomic_writer(path, "wb", lock=lock) as f:
+        f.write(data)
+
+
+def locked_append(path: str, text: str, encoding: str = "utf-8"):
+    """Append text to path under the file lock and fsync it (for append-only logs)."""
+    with file_lock(path):
+        with open(path, "a", encoding=encoding) as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
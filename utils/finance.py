@@ -0,0 +1,191 @@
+"""
+Customer Finances for Newton Smart Home Application
+Quotation, invoice, paid and outstanding totals for every customer in one pass:
+records are joined to customers by their stored phone key or by name, and the
+totals come from a single groupby.
+
+Receivables aging splits what is still owed per invoice and per customer into
+0-30 / 31-60 / 61-90 / 90+ day buckets, computed with vectorized grouping and
+cached per records version.
+"""
+
+import threading
+from datetime import date
+from typing import Dict, Optional, Tuple
+
+import pandas as pd
+
+from utils import storage
+from utils.normalize import name_key_series, phone_flat10_series
+
+
+FINANCE_COLUMNS = ["total_q", "total_i", "total_r", "outstanding"]
+
+
+def _phone_keys(df: pd.DataFrame) -> pd.Series:
+    """Stored canonical phone keys, normalizing only rows written without one."""
+    if "phone" not in df.columns:
+        return pd.Series("", index=df.index)
+    keys = df["phone_key"] if "phone_key" in df.columns else pd.Series(None, index=df.index, dtype=object)
+    missing = keys.isna()
+    if missing.any():
+        keys = keys.astype(object).copy()
+        keys[missing] = phone_flat10_series(df.loc[missing, "phone"])
+    return keys.astype(str)
+
+
+def customer_finances(customers: pd.DataFrame, records: pd.DataFrame) -> pd.DataFrame:
+    """
+    Totals per customer.
+
+    A record belongs to a customer when its phone matches the customer's
+    (non-empty) phone or its client name matches the customer's name; a record
+    matching both ways is counted once.
+
+    Args:
+        customers: Customers table (client_name, phone)
+        records: Records table (type, amount, client_name, phone)
+
+    Returns:
+        DataFrame with the customers' index and FINANCE_COLUMNS (0.0 when no records)
+    """
+    result = pd.DataFrame(0.0, index=customers.index, columns=FINANCE_COLUMNS)
+    if customers.empty or records.empty:
+        return result
+
+    cust = pd.DataFrame({
+        "cust": customers.index,
+        "name": name_key_series(customers["client_name"]).to_numpy(),
+        "phone": _phone_keys(customers).to_numpy(),
+    })
+    rec = pd.DataFrame({
+        "rec": range(len(records)),
+        "name": name_key_series(records["client_name"]).to_numpy(),
+        "phone": _phone_keys(records).to_numpy(),
+        "type": records["type"].astype(str).to_numpy(),
+        "amount": pd.to_numeric(records["amount"], errors="coerce").fillna(0.0).to_numpy(),
+    })
+
+    by_phone = cust[cust["phone"] != ""].merge(rec[rec["phone"] != ""], on="phone")[["cust", "rec"]]
+    by_name = cust.merge(rec, on="name")[["cust", "rec"]]
+    pairs = pd.concat([by_phone, by_name], ignore_index=True).drop_duplicates()
+    if pairs.empty:
+        return result
+
+    matched = pairs.merge(rec[["rec", "type", "amount"]], on="rec")
+    totals = matched.pivot_table(index="cust", columns="type", values="amount", aggfunc="sum", fill_value=0.0)
+    for col, t in (("total_q", "q"), ("total_i", "i"), ("total_r", "r")):
+        if t in totals.columns:
+            result[col] = totals[t].reindex(result.index, fill_value=0.0).astype(float)
+    result["outstanding"] = result["total_i"] - result["total_r"]
+    return result
+
+
+# ==========================================
+# Receivables aging
+# ==========================================
+
+# (label, first day, last day) of invoice age; None = open-ended
+AGING_BUCKETS = [("0-30", 0, 30), ("31-60", 31, 60), ("61-90", 61, 90), ("90+", 91, None)]
+BUCKET_LABELS = [label for label, _, _ in AGING_BUCKETS]
+INVOICE_AGING_COLUMNS = [
+    "base_id", "number", "date", "client_name", "phone", "location",
+    "amount", "paid", "outstanding", "days", "bucket",
+]
+
+_aging_lock = threading.Lock()
+_aging_cache: Dict[tuple, Tuple[pd.DataFrame, pd.DataFrame]] = {}
+
+
+def invoice_aging(records: pd.DataFrame, as_of: Optional[date] = None) -> pd.DataFrame:
+    """
+    Outstanding amount and age of every invoice on the as_of date.
+
+    A project's receipts (joined by base_id) pay off its invoices oldest first,
+    so each invoice's outstanding part is what the running invoice total
+    exceeds the receipts by, capped at the invoice amount. Documents dated
+    after as_of are ignored; invoices without a date count as oldest (90+).
+
+    Args:
+        records: Records table
+        as_of: Reference date (default today)
+
+    Returns:
+        One row per invoice with INVOICE_AGING_COLUMNS, oldest first
+    """
+    as_of = pd.Timestamp(as_of or date.today())
+    if records.empty:
+        return pd.DataFrame(columns=INVOICE_AGING_COLUMNS)
+
+    rec = records.reset_index(drop=True)
+    types = rec["type"].astype(str).str.lower()
+    dates = pd.to_datetime(rec["date"], errors="coerce")
+    amounts = pd.to_numeric(rec["amount"], errors="coerce").fillna(0.0)
+    in_range = dates.isna() | (dates <= as_of)
+    base = rec["base_id"].fillna("").astype(str)
+
+    is_rcpt = (types == "r") & in_range & (base != "")
+    paid_by_project = amounts[is_rcpt].groupby(base[is_rcpt]).sum()
+
+    is_inv = (types == "i") & in_range
+    inv = rec.loc[is_inv, ["base_id", "number", "client_name", "phone", "location"]].copy()
+    inv["date"] = dates[is_inv]
+    inv["amount"] = amounts[is_inv]
+    # Invoices without a project are settled on their own
+    inv["project"] = base[is_inv].where(base[is_inv] != "", "#" + inv["number"].astype(str))
+    inv = inv.sort_values("date", kind="stable", na_position="first")
+
+    running = inv.groupby("project", sort=False)["amount"].cumsum()
+    received = inv["project"].map(paid_by_project).fillna(0.0)
+    inv["outstanding"] = (running - received).clip(lower=0.0).clip(upper=inv["amount"])
+    inv["paid"] = inv["amount"] - inv["outstanding"]
+    inv["days"] = (as_of - inv["date"]).dt.days
+
+    bins = [-float("inf")] + [last for _, _, last in AGING_BUCKETS[:-1]] + [float("inf")]
+    inv["bucket"] = pd.cut(inv["days"].fillna(float("inf")), bins=bins, labels=BUCKET_LABELS).astype(str)
+    return inv[INVOICE_AGING_COLUMNS].reset_index(drop=True)
+
+
+def customer_aging(invoices: pd.DataFrame) -> pd.DataFrame:
+    """
+    Outstanding amounts per customer (client name on the invoice) and age bucket.
+
+    Args:
+        invoices: Result of invoice_aging()
+
+    Returns:
+        client_name, phone, one column per bucket and "total", largest total first
+        (customers with nothing outstanding are left out)
+    """
+    open_inv = invoices[invoices["outstanding"] > 0]
+    columns = ["client_name", "phone", *BUCKET_LABELS, "total"]
+    if open_inv.empty:
+        return pd.DataFrame(columns=columns)
+    names = open_inv["client_name"].fillna("").astype(str)
+    table = open_inv.pivot_table(
+        index=names, columns="bucket", values="outstanding", aggfunc="sum", fill_value=0.0,
+    ).reindex(columns=BUCKET_LABELS, fill_value=0.0).rename_axis(columns=None)
+    table["total"] = table.sum(axis=1)
+    table.insert(0, "phone", open_inv.groupby(names)["phone"].last())
+    table = table.rename_axis("client_name").reset_index()
+    return table.sort_values("total", ascending=False).reset_index(drop=True)[columns]
+
+
+def load_aging(as_of: Optional[date] = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    (invoice_aging, customer_aging) for all records, queued ones included,
+    computed once per as_of date and records version (which counts the queue).
+    """
+    as_of = as_of or date.today()
+    key = (as_of, storage.table_version("records"))
+    with _aging_lock:
+        hit = _aging_cache.get(key)
+    if hit is None:
+        invoices = invoice_aging(storage.load_records(), as_of)
+        hit = (invoices, customer_aging(invoices))
+        with _aging_lock:
+            # Only the current records version is worth keeping
+            for old in [k for k in _aging_cache if k[1] != key[1]]:
+                del _aging_cache[old]
+            _aging_cache[key] = hit
+    return hit[0].copy(), hit[1].copy()
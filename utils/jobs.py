@@ -0,0 +1,147 @@
+"""
+Background Jobs for Newton Smart Home Application
+Runs slow work (saving records, customer updates, PDF conversion) on a shared
+thread pool so the page script returns immediately. Every job gets an id whose
+status can be polled; finished jobs are kept in a bounded store.
+"""
+
+import copy
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+
+MAX_WORKERS = 4
+MAX_FINISHED = 200  # finished jobs kept for status polling
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+@dataclass
+class Job:
+    id: str
+    name: str
+    owner: str = ""
+    state: str = QUEUED
+    progress: float = 0.0
+    message: str = ""
+    result: Any = None
+    error: str = ""
+    submitted: float = 0.0
+    started: Optional[float] = None
+    finished: Optional[float] = None
+
+    @property
+    def active(self) -> bool:
+        return self.state in (QUEUED, RUNNING)
+
+
+_lock = threading.Lock()
+_jobs: "OrderedDict[str, Job]" = OrderedDict()
+_executor: Optional[ThreadPoolExecutor] = None
+_current = threading.local()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="job")
+        return _executor
+
+
+def _prune():
+    """Drop the oldest finished jobs beyond MAX_FINISHED (caller holds _lock)."""
+    finished = [jid for jid, job in _jobs.items() if not job.active]
+    for jid in finished[:max(0, len(finished) - MAX_FINISHED)]:
+        del _jobs[jid]
+
+
+def _run(job_id: str, fn: Callable, args: tuple, kwargs: dict):
+    with _lock:
+        job = _jobs[job_id]
+        job.state = RUNNING
+        job.started = time.time()
+    _current.job_id = job_id
+    try:
+        result = fn(*args, **kwargs)
+        with _lock:
+            job.result = result
+            job.state = DONE
+            job.progress = 1.0
+    except Exception as e:
+        print(f"Job {job.name} failed: {e}")
+        with _lock:
+            job.error = str(e)
+            job.state = FAILED
+    finally:
+        _current.job_id = None
+        with _lock:
+            job.finished = time.time()
+            _prune()
+
+
+def submit(name: str, fn: Callable, *args, owner: str = "", **kwargs) -> str:
+    """
+    Run fn(*args, **kwargs) in the background.
+
+    Args:
+        name: Short label shown while polling (e.g. "Save quotation Q-1001")
+        fn: Work to run; it must not call Streamlit
+        owner: User name, for listing a user's jobs
+
+    Returns:
+        Job id
+    """
+    job = Job(id=uuid.uuid4().hex[:12], name=name, owner=owner, submitted=time.time())
+    with _lock:
+        _jobs[job.id] = job
+    _get_executor().submit(_run, job.id, fn, args, kwargs)
+    return job.id
+
+
+def report_progress(fraction: float, message: str = ""):
+    """Update the progress of the job running in this thread (no-op elsewhere)."""
+    job_id = getattr(_current, "job_id", None)
+    if not job_id:
+        return
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is not None:
+            job.progress = max(0.0, min(1.0, float(fraction)))
+            job.message = message
+
+
+def get_job(job_id: str) -> Optional[Job]:
+    """Snapshot of a job, or None if unknown (or pruned)."""
+    with _lock:
+        job = _jobs.get(job_id)
+        return copy.copy(job) if job is not None else None
+
+
+def list_jobs(owner: Optional[str] = None) -> List[Job]:
+    """Snapshots of all known jobs (optionally for one owner), oldest first."""
+    with _lock:
+        return [copy.copy(j) for j in _jobs.values() if owner is None or j.owner == owner]
+
+
+def any_active(job_ids: List[str]) -> bool:
+    """True while any of the given jobs is queued or running."""
+    with _lock:
+        return any(_jobs[j].active for j in job_ids if j in _jobs)
+
+
+def job_counts() -> Dict[str, int]:
+    """Number of jobs per state."""
+    with _lock:
+        counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+        for job in _jobs.values():
+            counts[job.state] += 1
+        return counts
@@ -1,27 +1,145 @@
 """
 Logger System for Newton Smart Home Application
-Logs all important events to data/logs.xlsx
+Logs all important events to append-only daily JSONL segments in data/logs/.
+Events are queued and written in batches by a background flusher thread; each
+batch is one locked append, so several server processes can share the segments.
 """
 
+import atexit
+import json
 import os
+import queue
+import threading
+import time
 import pandas as pd
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
+
+from utils import storage
+from utils.fileio import file_lock, lock_path, locked_append
+
+
+LOG_DIR = "data/logs"
+LOG_COLUMNS = ["timestamp", "user", "page", "action", "details"]
+FLUSH_INTERVAL = 1.0  # seconds between batched writes
+
+_queue: "queue.Queue[dict]" = queue.Queue()
+_queued = threading.Event()  # set by log_event, wakes the flusher
+_flush_lock = threading.Lock()  # held from taking a batch off the queue until it is written
+_write_lock = threading.Lock()
+_start_lock = threading.Lock()
+_flusher: Optional[threading.Thread] = None
+_migrated = False
+
+
+def _segment_path(day: str) -> str:
+    """Segment file for a day given as 'YYYY-MM-DD'."""
+    return os.path.join(LOG_DIR, f"logs-{day.replace('-', '')}.jsonl")
+
+
+def _segment_files() -> List[str]:
+    if not os.path.isdir(LOG_DIR):
+        return []
+    return sorted(
+        os.path.join(LOG_DIR, f) for f in os.listdir(LOG_DIR)
+        if f.startswith("logs-") and f.endswith(".jsonl")
+    )
+
+
+def _write_batch(batch: List[dict]):
+    """Append a batch of events to their daily segments."""
+    by_day = {}
+    for entry in batch:
+        by_day.setdefault(str(entry.get("timestamp", ""))[:10], []).append(entry)
+    with _write_lock:
+        os.makedirs(LOG_DIR, exist_ok=True)
+        for day, entries in by_day.items():
+            lines = "".join(json.dumps(e, ensure_ascii=False) + "\n" for e in entries)
+            # One locked, fsynced append per segment, so processes never interleave lines
+            locked_append(_segment_path(day), lines)
+
+
+def _drain_into(batch: List[dict]):
+    while True:
+        try:
+            batch.append(_queue.get_nowait())
+        except queue.Empty:
+            return
+
+
+def _flush_loop():
+    while True:
+        _queued.wait()
+        _queued.clear()
+        try:
+            flush_logs()
+        except Exception as e:
+            print(f"Error writing logs: {e}")
+        time.sleep(FLUSH_INTERVAL)
+
+
+def _ensure_flusher():
+    global _flusher
+    if _flusher is not None and _flusher.is_alive():
+        return
+    with _start_lock:
+        if _flusher is None or not _flusher.is_alive():
+            _flusher = threading.Thread(target=_flush_loop, name="log-flusher", daemon=True)
+            _flusher.start()
+
+
+def _migrate_legacy_logs():
+    """Move rows from the old logs table (imported from logs.xlsx) into segments (once per process)."""
+    global _migrated
+    if _migrated:
+        return
+    with _start_lock:
+        if _migrated:
+            return
+        legacy = storage.load_logs()
+        if not legacy.empty:
+            legacy = legacy.where(legacy.notna(), "")
+            _write_batch(legacy[LOG_COLUMNS].astype(str).to_dict("records"))
+            storage.delete_logs_before("9999")
+        _migrated = True
+
+
+def reset_log_migration():
+    """Migrate the logs table again on next use (after a restore imported logs.xlsx into it)."""
+    global _migrated
+    with _start_lock:
+        _migrated = False
+
+
+def flush_logs():
+    """
+    Write all queued events now (used before reading and at exit). Returns
+    only once every event queued so far is on disk, including a batch the
+    background flusher is writing.
+    """
+    with _flush_lock:
+        batch: List[dict] = []
+        _drain_into(batch)
+        if batch:
+            _write_batch(batch)
+
+
+atexit.register(flush_logs)
 
 
 def ensure_logs_file():
-    """Create logs.xlsx if it doesn't exist."""
-    os.makedirs("data", exist_ok=True)
-    path = "data/logs.xlsx"
-    if not os.path.exists(path):
-        df = pd.DataFrame(columns=["timestamp", "user", "page", "action", "details"])
-        df.to_excel(path, index=False)
+    """Create the segment directory and migrate any legacy log rows."""
+    os.makedirs(LOG_DIR, exist_ok=True)
+    try:
+        _migrate_legacy_logs()
+    except Exception as e:
+        print(f"Error migrating legacy logs: {e}")
 
 
 def log_event(user: str, page: str, action: str, details: str = ""):
     """
-    Log an event to data/logs.xlsx.
-    
+    Queue an event for the background flusher (O(1), never blocks on disk).
+
     Args:
         user: Username or "System"
         page: Page name (dashboard, quotation, etc.)
@@ -29,27 +147,16 @@ def log_event(user: str, page: str, action: str, details: str = ""):
         details: Additional details about the event
     """
     try:
-        ensure_logs_file()
-        
-        # Load existing logs
-        try:
-            logs = pd.read_excel("data/logs.xlsx")
-        except:
-            logs = pd.DataFrame(columns=["timestamp", "user", "page", "action", "details"])
-        
-        # Create new log entry
-        new_log = pd.DataFrame([{
+        _queue.put({
             "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
             "user": str(user),
             "page": str(page),
             "action": str(action),
             "details": str(details)
-        }])
-        
-        # Append and save
-        logs = pd.concat([logs, new_log], ignore_index=True)
-        logs.to_excel("data/logs.xlsx", index=False)
-        
+        })
+        _queued.set()
+        _ensure_flusher()
+
     except Exception as e:
         print(f"Error logging event: {e}")
 
@@ -57,18 +164,26 @@ def log_event(user: str, page: str, action: str, details: str = ""):
 def load_logs(filters: Optional[dict] = None) -> pd.DataFrame:
     """
     Load logs with optional filters.
-    
+
     Args:
         filters: Dict with keys: user, page, action, date_from, date_to
-    
+
     Returns:
         Filtered DataFrame
     """
     ensure_logs_file()
     try:
-        logs = pd.read_excel("data/logs.xlsx")
-        logs.columns = [c.strip().lower() for c in logs.columns]
-        
+        flush_logs()
+        rows = []
+        for path in _segment_files():
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rows.append(json.loads(line))
+                    except ValueError:
+                        continue  # partially written line
+        logs = pd.DataFrame(rows, columns=LOG_COLUMNS)
+
         if filters:
             if filters.get("user"):
                 logs = logs[logs["user"].str.contains(filters["user"], case=False, na=False)]
@@ -77,21 +192,30 @@ def load_logs(filters: Optional[dict] = None) -> pd.DataFrame:
             if filters.get("action"):
                 logs = logs[logs["action"].str.contains(filters["action"], case=False, na=False)]
             # Add date filtering if needed
-        
+
         return logs.sort_values("timestamp", ascending=False) if "timestamp" in logs.columns else logs
-        
+
     except Exception as e:
         print(f"Error loading logs: {e}")
-        return pd.DataFrame(columns=["timestamp", "user", "page", "action", "details"])
+        return pd.DataFrame(columns=LOG_COLUMNS)
 
 
 def clear_old_logs(days: int = 90):
-    """Delete logs older than specified days."""
+    """Delete daily segments older than specified days."""
     try:
-        logs = pd.read_excel("data/logs.xlsx")
-        logs["timestamp"] = pd.to_datetime(logs["timestamp"])
-        cutoff = datetime.now() - pd.Timedelta(days=days)
-        logs = logs[logs["timestamp"] >= cutoff]
-        logs.to_excel("data/logs.xlsx", index=False)
+        # Legacy rows become segments first, so old ones are pruned with the rest
+        ensure_logs_file()
+        flush_logs()
+        cutoff = (datetime.now() - pd.Timedelta(days=days)).strftime("%Y%m%d")
+        with _write_lock:
+            for path in _segment_files():
+                day = os.path.basename(path)[len("logs-"):-len(".jsonl")]
+                if day < cutoff:
+                    with file_lock(path):
+                        os.remove(path)
+                    try:
+                        os.remove(lock_path(path))
+                    except OSError:
+                        pass
     except Exception as e:
         print(f"Error clearing old logs: {e}")
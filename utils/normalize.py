@@ -0,0 +1,127 @@
+"""
+Text Normalization for Newton Smart Home Application
+One implementation of the phone, name and location clean-up used by every page.
+Each rule has a memoized scalar form (for form inputs) and a vectorized pandas
+form (for whole columns); both give the same result for the same value.
+"""
+
+from functools import lru_cache
+
+import pandas as pd
+
+
+CACHE_SIZE = 4096
+
+
+def _is_missing(value) -> bool:
+    if value is None:
+        return True
+    try:
+        return bool(pd.isna(value))
+    except (TypeError, ValueError):
+        return False
+
+
+def _text_series(values: pd.Series) -> pd.Series:
+    """Values as str, with None/NaN as ""."""
+    return values.astype(object).where(values.notna(), "").astype(str)
+
+
+# ==========================================
+# Names and locations
+# ==========================================
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _proper_case(text: str) -> str:
+    return text.strip().title()
+
+
+def proper_case(text) -> str:
+    """'ahmed  omer ' -> 'Ahmed  Omer'; None/NaN -> ''."""
+    if _is_missing(text):
+        return ""
+    return _proper_case(str(text))
+
+
+def proper_case_series(values: pd.Series) -> pd.Series:
+    return _text_series(values).str.strip().str.title()
+
+
+def name_key(text) -> str:
+    """Case- and whitespace-insensitive key for matching client names."""
+    if _is_missing(text):
+        return ""
+    return str(text).strip().lower()
+
+
+def name_key_series(values: pd.Series) -> pd.Series:
+    return _text_series(values).str.strip().str.lower()
+
+
+# ==========================================
+# Phones
+# ==========================================
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _phone_flat10(text: str) -> str:
+    digits = ''.join(filter(str.isdigit, text))
+    if not digits:
+        return ""
+    if digits.startswith('971') and len(digits) >= 12 and digits[3] == '5':
+        return '0' + digits[3:12]
+    if len(digits) == 9 and digits.startswith('5'):
+        return '0' + digits
+    if len(digits) == 10 and digits.startswith('05'):
+        return digits
+    return digits[-10:]
+
+
+def phone_flat10(raw_input) -> str:
+    """
+    Canonical phone key: UAE mobiles as 05XXXXXXXX (from +971 50..., 50..., 050...),
+    other numbers as their last 10 digits, and "" when there are no digits.
+    """
+    if _is_missing(raw_input):
+        return ""
+    return _phone_flat10(str(raw_input))
+
+
+def phone_flat10_series(values: pd.Series) -> pd.Series:
+    digits = _text_series(values).str.replace(r"\D", "", regex=True)
+    n = digits.str.len()
+    out = digits.str[-10:]
+    out = out.mask((n == 10) & digits.str.startswith("05"), digits)
+    out = out.mask((n == 9) & digits.str.startswith("5"), "0" + digits)
+    out = out.mask(digits.str.startswith("9715") & (n >= 12), "0" + digits.str[3:12])
+    return out
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _format_phone(text: str):
+    digits = ''.join(filter(str.isdigit, text))
+    if digits.startswith("0"):
+        digits = digits[1:]
+    if digits.startswith("5") and len(digits) == 9:
+        return f"+971 {digits[:2]} {digits[2:5]} {digits[5:]}"
+    return None
+
+
+def format_phone_input(raw_input):
+    """UAE mobile as '+971 50 123 4567', or None if it is not one."""
+    if _is_missing(raw_input) or not str(raw_input):
+        return None
+    return _format_phone(str(raw_input))
+
+
+def format_phone_series(values: pd.Series) -> pd.Series:
+    """Formatted UAE mobiles; other values are kept as they are."""
+    digits = _text_series(values).str.replace(r"\D", "", regex=True)
+    digits = digits.str.replace(r"^0", "", regex=True)
+    mobile = (digits.str.len() == 9) & digits.str.startswith("5")
+    pretty = "+971 " + digits.str[:2] + " " + digits.str[2:5] + " " + digits.str[5:]
+    return values.where(~mobile, pretty)
+
+
+def phone_label_mask(raw_input) -> str:
+    flat = phone_flat10(raw_input)
+    return f"{flat} xxxxxxxxxx" if flat else "xxxxxxxxxx"
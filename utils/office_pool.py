@@ -0,0 +1,267 @@
+"""
+Office Conversion Pool for Newton Smart Home Application
+Converts DOCX to PDF with headless LibreOffice (soffice) when the PDF must match
+the Word template exactly. A pool of warm workers, each with its own soffice
+profile, takes jobs from a shared queue; jobs time out, and a worker whose
+soffice crashed or hung is restarted before its next job.
+
+With the LibreOffice Python bindings (uno) available, each worker keeps a
+soffice process listening on a local port and converts over UNO. Without them,
+each job runs soffice --convert-to against the worker's pre-warmed profile.
+"""
+
+import atexit
+import os
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Optional
+
+try:
+    import uno
+    from com.sun.star.beans import PropertyValue
+except ImportError:
+    uno = None
+
+
+SOFFICE_CANDIDATES = [
+    "soffice",
+    "libreoffice",
+    "/usr/lib/libreoffice/program/soffice",
+    "/Applications/LibreOffice.app/Contents/MacOS/soffice",
+    r"C:\Program Files\LibreOffice\program\soffice.exe",
+]
+POOL_DIR = os.path.join(tempfile.gettempdir(), "newton-office")
+BASE_PORT = 2202
+DEFAULT_WORKERS = 2
+DEFAULT_TIMEOUT = 60  # seconds, queue wait included
+START_TIMEOUT = 30
+
+_pool_lock = threading.Lock()
+_pool: Optional["OfficePool"] = None
+
+
+def find_soffice() -> Optional[str]:
+    """Path of the soffice binary, or None if LibreOffice is not installed."""
+    for candidate in SOFFICE_CANDIDATES:
+        found = shutil.which(candidate)
+        if found:
+            return found
+    return None
+
+
+def office_available() -> bool:
+    return find_soffice() is not None
+
+
+def _prop(name, value):
+    p = PropertyValue()
+    p.Name = name
+    p.Value = value
+    return p
+
+
+class _Worker:
+    """One soffice instance with a private profile (and UNO port)."""
+
+    def __init__(self, index: int, binary: str):
+        self.index = index
+        self.binary = binary
+        self.port = BASE_PORT + index
+        self.profile = os.path.join(POOL_DIR, f"worker-{index}")
+        self.proc: Optional[subprocess.Popen] = None
+        self.desktop = None
+
+    def _profile_arg(self) -> str:
+        return "-env:UserInstallation=file:///" + os.path.abspath(self.profile).replace("\\", "/").lstrip("/")
+
+    def alive(self) -> bool:
+        if uno is None:
+            return os.path.isdir(self.profile)
+        return self.proc is not None and self.proc.poll() is None and self.desktop is not None
+
+    def start(self):
+        os.makedirs(self.profile, exist_ok=True)
+        if uno is None:
+            # Create the profile once; later conversions skip first-start setup
+            subprocess.run(
+                [self.binary, self._profile_arg(), "--headless", "--norestore", "--terminate_after_init"],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=START_TIMEOUT,
+            )
+            return
+        self.proc = subprocess.Popen(
+            [self.binary, self._profile_arg(), "--headless", "--invisible", "--nologo",
+             "--norestore", "--nodefault",
+             f"--accept=socket,host=127.0.0.1,port={self.port};urp;StarOffice.ComponentContext"],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        local = uno.getComponentContext()
+        resolver = local.ServiceManager.createInstanceWithContext("com.sun.star.bridge.UnoUrlResolver", local)
+        deadline = time.monotonic() + START_TIMEOUT
+        while True:
+            try:
+                ctx = resolver.resolve(
+                    f"uno:socket,host=127.0.0.1,port={self.port};urp;StarOffice.ComponentContext"
+                )
+                self.desktop = ctx.ServiceManager.createInstanceWithContext("com.sun.star.frame.Desktop", ctx)
+                return
+            except Exception:
+                if self.proc.poll() is not None or time.monotonic() > deadline:
+                    self.stop()
+                    raise RuntimeError(f"soffice worker {self.index} failed to start")
+                time.sleep(0.25)
+
+    def stop(self):
+        self.desktop = None
+        if self.proc is not None:
+            try:
+                self.proc.kill()
+                self.proc.wait(timeout=5)
+            except Exception:
+                pass
+            self.proc = None
+
+    def restart(self):
+        self.stop()
+        self.start()
+
+    def convert(self, docx_bytes: bytes, timeout: float) -> bytes:
+        with tempfile.TemporaryDirectory(dir=POOL_DIR) as tmpdir:
+            src = os.path.join(tmpdir, "document.docx")
+            dst = os.path.join(tmpdir, "document.pdf")
+            with open(src, "wb") as f:
+                f.write(docx_bytes)
+
+            if uno is None:
+                subprocess.run(
+                    [self.binary, self._profile_arg(), "--headless", "--norestore",
+                     "--convert-to", "pdf", "--outdir", tmpdir, src],
+                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=timeout, check=True,
+                )
+            else:
+                # A hung soffice is killed, which makes the UNO call below fail
+                watchdog = threading.Timer(timeout, self.stop)
+                watchdog.start()
+                try:
+                    doc = self.desktop.loadComponentFromURL(
+                        uno.systemPathToFileUrl(src), "_blank", 0, (_prop("Hidden", True),)
+                    )
+                    try:
+                        doc.storeToURL(uno.systemPathToFileUrl(dst), (_prop("FilterName", "writer_pdf_Export"),))
+                    finally:
+                        doc.close(True)
+                finally:
+                    watchdog.cancel()
+
+            if not os.path.exists(dst):
+                raise RuntimeError("soffice produced no PDF")
+            with open(dst, "rb") as f:
+                return f.read()
+
+
+class _Job:
+    def __init__(self, docx_bytes: bytes, timeout: float):
+        self.docx_bytes = docx_bytes
+        self.deadline = time.monotonic() + timeout
+        self.future: Future = Future()
+
+
+class OfficePool:
+    """
+    Fixed pool of soffice workers fed from one job queue, so concurrent
+    exports run in parallel (one per worker) instead of one at a time.
+    """
+
+    def __init__(self, size: int = DEFAULT_WORKERS, binary: Optional[str] = None):
+        self.binary = binary or find_soffice()
+        if not self.binary:
+            raise RuntimeError("LibreOffice (soffice) is not installed")
+        os.makedirs(POOL_DIR, exist_ok=True)
+        self._jobs: "queue.Queue[Optional[_Job]]" = queue.Queue()
+        self._threads: List[threading.Thread] = []
+        self._workers = [_Worker(i, self.binary) for i in range(max(1, int(size)))]
+        for worker in self._workers:
+            t = threading.Thread(target=self._run, args=(worker,), name=f"office-worker-{worker.index}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    @property
+    def size(self) -> int:
+        return len(self._workers)
+
+    def _run(self, worker: _Worker):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                worker.stop()
+                return
+            if not job.future.set_running_or_notify_cancel():
+                continue
+            remaining = job.deadline - time.monotonic()
+            if remaining <= 0:
+                job.future.set_exception(TimeoutError("PDF conversion timed out in queue"))
+                continue
+            try:
+                if not worker.alive():
+                    worker.restart()
+                job.future.set_result(worker.convert(job.docx_bytes, remaining))
+            except Exception as e:
+                job.future.set_exception(e)
+                # Crashed, hung or half-broken: start from a fresh process next time
+                try:
+                    worker.stop()
+                except Exception:
+                    pass
+
+    def submit(self, docx_bytes: bytes, timeout: float = DEFAULT_TIMEOUT) -> Future:
+        """Queue a conversion; the Future resolves to PDF bytes."""
+        job = _Job(docx_bytes, timeout)
+        self._jobs.put(job)
+        return job.future
+
+    def convert(self, docx_bytes: bytes, timeout: float = DEFAULT_TIMEOUT) -> bytes:
+        """Convert and wait for the result (raises on failure or timeout)."""
+        return self.submit(docx_bytes, timeout).result(timeout=timeout + 5)
+
+    def shutdown(self):
+        for _ in self._threads:
+            self._jobs.put(None)
+
+
+def get_pool(size: Optional[int] = None) -> OfficePool:
+    """Shared pool for this process (created on first use)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None or (size is not None and _pool.size != size):
+            if _pool is not None:
+                _pool.shutdown()
+            _pool = OfficePool(size or DEFAULT_WORKERS)
+        return _pool
+
+
+def convert_docx_to_pdf(docx_bytes: bytes, timeout: float = DEFAULT_TIMEOUT,
+                        workers: Optional[int] = None) -> bytes:
+    """
+    Convert a Word document to PDF on the shared soffice pool.
+
+    Args:
+        docx_bytes: Contents of the .docx file
+        timeout: Seconds to wait, queue time included
+        workers: Pool size (defaults to the current pool, or DEFAULT_WORKERS)
+
+    Returns:
+        PDF bytes
+    """
+    return get_pool(workers).convert(docx_bytes, timeout)
+
+
+def _shutdown_pool():
+    if _pool is not None:
+        _pool.shutdown()
+
+
+atexit.register(_shutdown_pool)
@@ -0,0 +1,316 @@
+"""
+PDF Renderer for Newton Smart Home Application
+Builds quotation, invoice and receipt PDFs locally with reportlab from the same
+placeholder dict and line-item table used for the Word templates.
+Product images are decoded and scaled once and kept in a small LRU cache.
+"""
+
+import base64
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from io import BytesIO
+from typing import Dict, List, Optional
+
+from PIL import Image as PILImage
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_RIGHT
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.units import cm
+from reportlab.platypus import Image, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+from utils.settings import load_settings
+
+
+IMAGE_DPI = 150
+IMAGE_CACHE_SIZE = 256
+
+ACCENT = colors.HexColor("#0a84ff")
+GRID = colors.HexColor("#d2d2d7")
+MUTED = colors.HexColor("#6e6e73")
+
+_image_lock = threading.Lock()
+_images: "OrderedDict[tuple, bytes]" = OrderedDict()
+
+_styles = getSampleStyleSheet()
+_normal = ParagraphStyle("newton_normal", parent=_styles["Normal"], fontName="Helvetica", fontSize=9, leading=11)
+_small = ParagraphStyle("newton_small", parent=_normal, fontSize=8, leading=10, textColor=MUTED)
+_title = ParagraphStyle("newton_title", parent=_normal, fontName="Helvetica-Bold", fontSize=18, leading=22,
+                        textColor=ACCENT, alignment=TA_RIGHT)
+_company = ParagraphStyle("newton_company", parent=_normal, fontName="Helvetica-Bold", fontSize=13, leading=16)
+
+
+# ==========================================
+# Product images
+# ==========================================
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _image_source(b64_str: Optional[str], img_path: Optional[str]):
+    """(cache id, loader) for a product image, or None if it has none."""
+    if img_path and os.path.exists(img_path):
+        st = os.stat(img_path)
+        return ("path", img_path, st.st_mtime_ns, st.st_size), lambda: _read_file(img_path)
+    if isinstance(b64_str, str) and b64_str:
+        digest = hashlib.sha1(b64_str.encode("ascii", "ignore")).hexdigest()
+        return ("b64", digest), lambda: base64.b64decode(b64_str)
+    return None
+
+
+def scaled_image(b64_str: Optional[str], img_path: Optional[str],
+                 width_cm: float, height_cm: float) -> Optional[bytes]:
+    """
+    PNG of a product image fitted into width_cm x height_cm (at IMAGE_DPI).
+    Decoding and scaling happen once per image and size.
+
+    Returns:
+        PNG bytes, or None if there is no usable image
+    """
+    source = _image_source(b64_str, img_path)
+    if source is None:
+        return None
+    source_id, read = source
+    key = (source_id, round(float(width_cm), 3), round(float(height_cm), 3))
+    with _image_lock:
+        hit = _images.get(key)
+        if hit is not None:
+            _images.move_to_end(key)
+            return hit
+
+    try:
+        img = PILImage.open(BytesIO(read()))
+        if img.mode in ("RGBA", "LA", "P"):
+            img = img.convert("RGBA")
+            base = PILImage.new("RGBA", img.size, (255, 255, 255, 255))
+            img = PILImage.alpha_composite(base, img)
+        img = img.convert("RGB")
+        box = (max(1, int(width_cm / 2.54 * IMAGE_DPI)), max(1, int(height_cm / 2.54 * IMAGE_DPI)))
+        img.thumbnail(box, PILImage.Resampling.LANCZOS)
+        out = BytesIO()
+        img.save(out, format="PNG", optimize=True)
+        png = out.getvalue()
+    except Exception as e:
+        print(f"Error preparing product image: {e}")
+        return None
+
+    with _image_lock:
+        _images[key] = png
+        while len(_images) > IMAGE_CACHE_SIZE:
+            _images.popitem(last=False)
+    return png
+
+
+def _image_flowable(item: Dict, width_cm: float, height_cm: float):
+    png = scaled_image(item.get("ImageBase64"), item.get("ImagePath"), width_cm, height_cm)
+    if png is None:
+        return None
+    with PILImage.open(BytesIO(png)) as img:
+        w_px, h_px = img.size
+    scale = min(width_cm * cm / w_px, height_cm * cm / h_px)
+    return Image(BytesIO(png), width=w_px * scale, height=h_px * scale)
+
+
+# ==========================================
+# Layout helpers
+# ==========================================
+
+def _plain(value) -> str:
+    return "" if value is None else str(value)
+
+
+def _text(value) -> str:
+    """Escape a value for use inside a Paragraph (which parses markup)."""
+    return _plain(value).replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def _money(value) -> str:
+    try:
+        return f"{float(value):,.2f}"
+    except (TypeError, ValueError):
+        return _plain(value)
+
+
+def _header(title: str, number: str, settings: Dict) -> Table:
+    left = [
+        Paragraph(_text(settings.get("company_name", "")), _company),
+        Paragraph(_text(settings.get("contact_phone", "")), _small),
+        Paragraph(_text(settings.get("contact_email", "")), _small),
+    ]
+    right = [
+        Paragraph(_text(title), _title),
+        Paragraph(f"No. {_text(number)}", ParagraphStyle("r", parent=_normal, alignment=TA_RIGHT)),
+        Paragraph(datetime.today().strftime("%Y-%m-%d"), ParagraphStyle("rs", parent=_small, alignment=TA_RIGHT)),
+    ]
+    table = Table([[left, right]], colWidths=[9.5 * cm, 8 * cm])
+    table.setStyle(TableStyle([
+        ("VALIGN", (0, 0), (-1, -1), "TOP"),
+        ("LINEBELOW", (0, 0), (-1, 0), 1.2, ACCENT),
+        ("BOTTOMPADDING", (0, 0), (-1, -1), 8),
+    ]))
+    return table
+
+
+def _pairs_table(rows: List[tuple], col_widths) -> Table:
+    data = [[Paragraph(f"<b>{_text(k)}</b>", _normal), Paragraph(_text(v), _normal)] for k, v in rows]
+    table = Table(data, colWidths=col_widths, hAlign="LEFT")
+    table.setStyle(TableStyle([
+        ("VALIGN", (0, 0), (-1, -1), "TOP"),
+        ("TOPPADDING", (0, 0), (-1, -1), 2),
+        ("BOTTOMPADDING", (0, 0), (-1, -1), 2),
+    ]))
+    return table
+
+
+def _client_block(data: Dict) -> Table:
+    return _pairs_table([
+        ("Client", data.get("{{client_name}}", "")),
+        ("Phone", data.get("{{client_phone}}", "")),
+        ("Location", data.get("{{client_location}}", "")),
+    ], [3 * cm, 14.5 * cm])
+
+
+def _items_table(items: List[Dict], with_images: bool) -> Table:
+    header = ["#", "Product / Device", "Description", "Qty", "Unit Price", "Line Total", "Warranty"]
+    widths = [0.8, 3.6, 5.6, 1.2, 2.2, 2.4, 1.7]
+    if with_images:
+        header.insert(1, "Image")
+        widths = [0.8, 3.0, 2.8, 4.0, 1.1, 2.0, 2.2, 1.6]
+
+    rows = [header]
+    for i, item in enumerate(items):
+        row = [
+            _plain(item.get("Item No", i + 1)),
+            Paragraph(_text(item.get("Product / Device", "")), _normal),
+            Paragraph(_text(item.get("Description", "")), _normal),
+            _plain(item.get("Qty", "")),
+            _money(item.get("Unit Price (AED)", 0)),
+            _money(item.get("Line Total (AED)", 0)),
+            _plain(item.get("Warranty (Years)", "")),
+        ]
+        if with_images:
+            w = float(item.get("ImageWidthCm", 3.49) or 3.49)
+            h = float(item.get("ImageHeightCm", 1.5) or 1.5)
+            # keep the image inside its column
+            factor = min(1.0, 2.8 / w)
+            row.insert(1, _image_flowable(item, w * factor, h * factor) or "")
+        rows.append(row)
+
+    table = Table(rows, colWidths=[w * cm for w in widths], repeatRows=1)
+    table.setStyle(TableStyle([
+        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+        ("FONTNAME", (0, 1), (-1, -1), "Helvetica"),
+        ("FONTSIZE", (0, 0), (-1, -1), 8.5),
+        ("TEXTCOLOR", (0, 0), (-1, 0), colors.white),
+        ("BACKGROUND", (0, 0), (-1, 0), ACCENT),
+        ("GRID", (0, 0), (-1, -1), 0.5, GRID),
+        ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+        ("ALIGN", (0, 0), (0, -1), "CENTER"),
+        ("ALIGN", (-4, 1), (-1, -1), "CENTER"),
+        ("ROWBACKGROUNDS", (0, 1), (-1, -1), [colors.white, colors.HexColor("#f5f5f7")]),
+    ]))
+    return table
+
+
+def _totals_table(rows: List[tuple]) -> Table:
+    data = [[_plain(label), f"{_plain(value)} AED"] for label, value in rows]
+    table = Table(data, colWidths=[5 * cm, 4 * cm], hAlign="RIGHT")
+    table.setStyle(TableStyle([
+        ("FONTNAME", (0, 0), (-1, -1), "Helvetica"),
+        ("FONTNAME", (0, -1), (-1, -1), "Helvetica-Bold"),
+        ("FONTSIZE", (0, 0), (-1, -1), 9),
+        ("ALIGN", (1, 0), (1, -1), "RIGHT"),
+        ("LINEABOVE", (0, -1), (-1, -1), 1, ACCENT),
+    ]))
+    return table
+
+
+def _build(story: List) -> bytes:
+    buf = BytesIO()
+    doc = SimpleDocTemplate(
+        buf, pagesize=A4,
+        leftMargin=1.5 * cm, rightMargin=1.5 * cm, topMargin=1.5 * cm, bottomMargin=1.5 * cm,
+    )
+    doc.build(story)
+    return buf.getvalue()
+
+
+# ==========================================
+# Documents
+# ==========================================
+
+def render_quotation_pdf(data: Dict, items: Optional[List[Dict]] = None) -> bytes:
+    """
+    Quotation PDF.
+
+    Args:
+        data: Same placeholder dict as the Word template ({"{{key}}": value})
+        items: Quotation line items (may carry ImageBase64/ImagePath and image size)
+
+    Returns:
+        PDF bytes
+    """
+    settings = load_settings()
+    story = [
+        _header("QUOTATION", data.get("{{quote_no}}", ""), settings),
+        Spacer(1, 10),
+        _client_block(data),
+        Spacer(1, 10),
+        _items_table(items or [], with_images=True),
+        Spacer(1, 10),
+        _totals_table([
+            ("Products Total", data.get("{{total1}}", "")),
+            ("Installation & Operation", data.get("{{installation_cost}}", "")),
+            ("Discount", data.get("{{total_discount}}", "")),
+            ("Grand Total", data.get("{{grand_total}}", data.get("{{Total}}", ""))),
+        ]),
+        Spacer(1, 24),
+        _pairs_table([
+            ("Prepared by", data.get("{{prepared_by}}", "")),
+            ("Approved by", data.get("{{approved_by}}", "")),
+        ], [3 * cm, 8 * cm]),
+    ]
+    return _build(story)
+
+
+def render_invoice_pdf(data: Dict, items: Optional[List[Dict]] = None) -> bytes:
+    """Invoice PDF from the invoice placeholder dict and line items."""
+    settings = load_settings()
+    story = [
+        _header("INVOICE", data.get("{{invoice_no}}", ""), settings),
+        Spacer(1, 10),
+        _client_block(data),
+        Spacer(1, 10),
+        _items_table(items or [], with_images=False),
+        Spacer(1, 10),
+        _totals_table([
+            ("Products Total", data.get("{{total_products}}", "")),
+            ("Installation & Operation", data.get("{{installation}}", "")),
+            (f"Discount ({data.get('{{discount_percent}}', '0')}%)", data.get("{{discount_value}}", "")),
+            ("Grand Total", data.get("{{grand_total}}", "")),
+        ]),
+    ]
+    return _build(story)
+
+
+def render_receipt_pdf(data: Dict, items: Optional[List[Dict]] = None) -> bytes:
+    """Receipt PDF from the receipt placeholder dict (receipts have no line items)."""
+    settings = load_settings()
+    story = [
+        _header("RECEIPT", data.get("{{receipt_no}}", ""), settings),
+        Spacer(1, 10),
+        _client_block(data),
+        Spacer(1, 10),
+        _pairs_table([("Invoice No.", data.get("{{invoice_no}}", ""))], [3 * cm, 14.5 * cm]),
+        Spacer(1, 14),
+        _totals_table([
+            ("Remaining Balance", data.get("{{balance}}", "")),
+            ("Amount Received", data.get("{{amount}}", "")),
+        ]),
+    ]
+    return _build(story)
@@ -0,0 +1,101 @@
+"""
+Records Index for Newton Smart Home Application
+Hash maps over one snapshot of the records table: number, base_id,
+(base_id, type), type and client name key -> row positions. Pages look
+documents up here instead of filtering the whole DataFrame on every rerun.
+The index is rebuilt lazily, on the first lookup after records change.
+"""
+
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from utils import storage
+from utils.normalize import name_key, name_key_series
+
+
+def _key(value) -> Optional[str]:
+    if value is None or pd.isna(value) or str(value) == "":
+        return None
+    return str(value)
+
+
+def _positions(keys) -> Dict[object, List[int]]:
+    """key -> row positions (in table order), skipping missing keys."""
+    out: Dict[object, List[int]] = {}
+    for pos, key in enumerate(keys):
+        if key:
+            out.setdefault(key, []).append(pos)
+    return out
+
+
+class RecordIndex:
+    """Read-only lookups over a records snapshot; results are copies."""
+
+    def __init__(self, records: pd.DataFrame):
+        self.records = records.reset_index(drop=True)
+        df = self.records
+        number = [_key(v) for v in df["number"].tolist()]
+        base = [_key(v) for v in df["base_id"].tolist()]
+        rtype = df["type"].astype(str).tolist()
+        self._by_number = _positions(number)
+        self._by_base = _positions(base)
+        self._by_type = _positions(rtype)
+        self._by_base_type: Dict[Tuple[str, str], List[int]] = _positions(
+            (b, t) if b else None for b, t in zip(base, rtype)
+        )
+        self._by_client = _positions(name_key_series(df["client_name"]).tolist())
+
+    def __len__(self):
+        return len(self.records)
+
+    def _rows(self, positions: Optional[List[int]]) -> pd.DataFrame:
+        if positions is None:
+            return self.records.iloc[0:0].copy()
+        return self.records.iloc[positions].copy()
+
+    def by_number(self, number, rtype: Optional[str] = None) -> Optional[pd.Series]:
+        """The record with this document number (of this type), or None."""
+        for pos in self._by_number.get(str(number), ()):
+            row = self.records.iloc[pos]
+            if rtype is None or row["type"] == rtype:
+                return row.copy()
+        return None
+
+    def for_base(self, base_id, rtype: Optional[str] = None) -> pd.DataFrame:
+        """All records of one project (base_id), optionally of one type."""
+        if rtype is None:
+            return self._rows(self._by_base.get(str(base_id)))
+        return self._rows(self._by_base_type.get((str(base_id), rtype)))
+
+    def of_type(self, rtype: str) -> pd.DataFrame:
+        """All quotations ("q"), invoices ("i") or receipts ("r")."""
+        return self._rows(self._by_type.get(rtype))
+
+    def count(self, rtype: str, base_id=None) -> int:
+        if base_id is None:
+            return len(self._by_type.get(rtype, ()))
+        return len(self._by_base_type.get((str(base_id), rtype), ()))
+
+    def for_client(self, client_name) -> pd.DataFrame:
+        """Records whose client name matches (case and surrounding spaces ignored)."""
+        return self._rows(self._by_client.get(name_key(client_name)))
+
+
+_lock = threading.Lock()
+_index: Optional[RecordIndex] = None
+_index_version = None
+
+
+def get_record_index() -> RecordIndex:
+    """Shared index for this process, rebuilt when the records table changed."""
+    global _index, _index_version
+    version = storage.table_version("records")
+    with _lock:
+        if _index is not None and _index_version == version:
+            return _index
+    index = RecordIndex(storage.load_records())
+    with _lock:
+        _index, _index_version = index, version
+    return index
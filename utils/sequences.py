@@ -0,0 +1,134 @@
+"""
+Document Numbers for Newton Smart Home Application
+Quotation, invoice and receipt numbers and project base_ids come from the
+persistent counters in utils/storage.py (one per day and document type), so
+each is allocated in O(1) and never handed out twice, even to concurrent
+sessions.
+
+A form shows the next free number as a provisional one and only takes it from
+its counter (claim) when the document is first downloaded, so browsing leaves
+no gaps. If another session took the provisional number first, the download
+gets the next free one (superseded() tells the page, which re-renders with it).
+The claimed number is kept while the document is being edited:
+re-downloading a saved document keeps it (the record is updated); once
+anything in a saved document changes, a new provisional number is shown.
+"""
+
+import hashlib
+import json
+import threading
+from datetime import datetime
+from typing import Callable, Dict, MutableMapping, Optional
+
+from utils.storage import max_suffix, next_sequence, peek_sequence
+
+
+def _today() -> str:
+    return datetime.today().strftime('%Y%m%d')
+
+
+def _sequence(name: str, floor: Callable, peek: bool) -> int:
+    return peek_sequence(name, floor) if peek else next_sequence(name, floor)
+
+
+def next_quote_no(day: Optional[str] = None, peek: bool = False) -> str:
+    """Take the next quotation number (peek=True: only read it)."""
+    day = day or _today()
+    prefix = f"QUO-{day}-"
+    n = _sequence(f"quotation:{day}", lambda conn: max_suffix(conn, "number", prefix, "q"), peek)
+    return f"{prefix}{n:03d}"
+
+
+def next_invoice_no(day: Optional[str] = None, peek: bool = False) -> str:
+    """Take the next invoice number (peek=True: only read it)."""
+    day = day or _today()
+    prefix = f"INV-{day}-"
+    n = _sequence(f"invoice:{day}", lambda conn: max_suffix(conn, "number", prefix, "i"), peek)
+    return f"{prefix}{n:03d}"
+
+
+def next_base_id(day: Optional[str] = None, conn=None) -> str:
+    """Project id shared by a quotation and its invoice and receipts (YYYYMMDD-NNN)."""
+    day = day or _today()
+    prefix = f"{day}-"
+    n = next_sequence(f"base:{day}", lambda c: max_suffix(c, "base_id", prefix), conn)
+    return f"{prefix}{n:03d}"
+
+
+def next_receipt_no(base_id: str, day: Optional[str] = None, peek: bool = False) -> str:
+    """R-<day>-<base_id>-<n>, n counting the project's receipts (peek=True: only read it)."""
+    day = day or _today()
+
+    def floor(conn):
+        return conn.execute(
+            "SELECT COUNT(*) FROM records WHERE type = 'r' AND base_id = ?", (str(base_id),)
+        ).fetchone()[0]
+
+    n = _sequence(f"receipt:{base_id}", floor, peek)
+    return f"R-{day}-{base_id}-{n}"
+
+
+# ==========================================
+# Per-session reservations
+# ==========================================
+
+def signature(*values) -> str:
+    """Stable fingerprint of a document's contents (everything but its number)."""
+    raw = json.dumps(values, sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+_claim_lock = threading.Lock()
+
+
+def reserve(state: MutableMapping, slot: str, kind: str, allocate, sig: str, provisional) -> str:
+    """
+    Number shown for the document being edited in this session.
+
+    Args:
+        state: Session state
+        slot: Session key for the reservation
+        kind: What the number is for (e.g. "invoice:20250101"); a new number is
+            used when it changes
+        allocate: Zero-argument function taking a fresh number (called by claim())
+        sig: signature() of the document as it is now
+        provisional: Zero-argument function reading the number allocate would take
+
+    Returns:
+        The claimed number, or the provisional one if none was claimed yet
+    """
+    held = state.get(slot)
+    if held is None or held["kind"] != kind or (held["saved"] is not None and held["saved"] != sig):
+        held = {"kind": kind, "number": None, "saved": None, "allocate": allocate}
+        state[slot] = held
+    # What the page shows (and names its download files after) until the next render
+    held["shown"] = held["number"] or provisional()
+    return held["shown"]
+
+
+def claim(held: Dict) -> str:
+    """
+    Take the reservation's number from its counter, once; later calls return it.
+    Safe from other threads (e.g. a deferred download), so pass state[slot].
+    """
+    with _claim_lock:
+        if held["number"] is None:
+            held["number"] = held["allocate"]()
+            if held.get("shown") not in (None, held["number"]):
+                held["superseded"] = held["shown"]
+        return held["number"]
+
+
+def superseded(held: Dict) -> Optional[str]:
+    """
+    The provisional number the last download was named after, when another
+    session took it first and the document got the next free number (once).
+    """
+    return held.pop("superseded", None)
+
+
+def mark_saved(state: MutableMapping, slot: str, sig: str):
+    """Record that the reserved number was used for a document with this signature."""
+    held = state.get(slot)
+    if held is not None:
+        held["saved"] = sig
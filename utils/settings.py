@@ -1,12 +1,17 @@
 """
 Settings Management for Newton Smart Home Application
 Handles system configuration stored in data/settings.json
+(written atomically under a file lock, see utils/fileio.py)
 """
 
 import os
 import json
 from typing import Dict, Any
 
+from utils.fileio import atomic_writer, file_lock
+
+SETTINGS_PATH = "data/settings.json"
+
 
 DEFAULT_SETTINGS = {
     "company_name": "Newton Smart Home",
@@ -18,17 +23,22 @@ DEFAULT_SETTINGS = {
     "ui_product_image_width_px": 350,
     "ui_product_image_height_px": 195,
     "quote_product_image_width_cm": 3.49,
-    "quote_product_image_height_cm": 1.5
+    "quote_product_image_height_cm": 1.5,
+    "pdf_engine": "reportlab",
+    "office_workers": 2,
+    "write_behind": False
 }
 
 
 def ensure_settings_file():
     """Create settings.json if it doesn't exist with default values."""
     os.makedirs("data", exist_ok=True)
-    path = "data/settings.json"
-    if not os.path.exists(path):
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(DEFAULT_SETTINGS, f, indent=2, ensure_ascii=False)
+    if os.path.exists(SETTINGS_PATH):
+        return
+    with file_lock(SETTINGS_PATH):
+        if not os.path.exists(SETTINGS_PATH):
+            with atomic_writer(SETTINGS_PATH, "w", encoding="utf-8") as f:
+                json.dump(DEFAULT_SETTINGS, f, indent=2, ensure_ascii=False)
 
 
 def load_settings() -> Dict[str, Any]:
@@ -38,7 +48,7 @@ def load_settings() -> Dict[str, Any]:
     """
     ensure_settings_file()
     try:
-        with open("data/settings.json", "r", encoding="utf-8") as f:
+        with open(SETTINGS_PATH, "r", encoding="utf-8") as f:
             settings = json.load(f)
         # Ensure all default keys exist
         for key, value in DEFAULT_SETTINGS.items():
@@ -56,7 +66,7 @@ def save_settings(settings: Dict[str, Any]):
     """
     try:
         os.makedirs("data", exist_ok=True)
-        with open("data/settings.json", "w", encoding="utf-8") as f:
+        with atomic_writer(SETTINGS_PATH, "w", encoding="utf-8") as f:
             json.dump(settings, f, indent=2, ensure_ascii=False)
     except Exception as e:
         print(f"Error saving settings: {e}")
@@ -69,7 +79,8 @@ def get_setting(key: str, default: Any = None) -> Any:
 
 
 def update_setting(key: str, value: Any):
-    """Update a single setting."""
-    settings = load_settings()
-    settings[key] = value
-    save_settings(settings)
+    """Update a single setting (read-modify-write under the settings lock)."""
+    with file_lock(SETTINGS_PATH):
+        settings = load_settings()
+        settings[key] = value
+        save_settings(settings)
@@ -0,0 +1,906 @@
+"""
+Storage Engine for Newton Smart Home Application
+SQLite-backed repository (data/newton.db, WAL mode) for records, customers,
+products, users and logs. Imports from and exports to the data/*.xlsx files.
+Full-table reads are served from the process-wide cache in utils/cache.py.
+
+A projects table (one row per base_id) and a report cube (month x type x
+location x client) are kept up to date by every records write, so project
+lifecycles and report totals are read directly instead of being recomputed.
+
+Customers and products carry a row version: edits are saved as deltas with
+the version they were loaded at, and a stale write is rejected with
+ConflictError instead of overwriting someone else's change.
+"""
+
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime
+from typing import Callable, Dict, Iterator, List, Optional
+
+import pandas as pd
+
+from utils import cache
+from utils.fileio import atomic_writer
+from utils.normalize import name_key, name_key_series, phone_flat10, phone_flat10_series
+
+
+DB_PATH = "data/newton.db"
+DB_FILES = (DB_PATH, DB_PATH + "-wal")
+
+RECORD_COLUMNS = [
+    "base_id", "date", "type", "number", "amount", "client_name", "phone", "location", "note",
+    "phone_key",
+]
+CUSTOMER_COLUMNS = [
+    "client_name", "phone", "location", "email", "status",
+    "notes", "tags", "next_follow_up", "assigned_to", "last_activity",
+    "phone_key", "name_key", "version", "updated_at",
+]
+PRODUCT_COLUMNS = [
+    "Device", "Description", "UnitPrice", "Warranty", "ImageBase64", "ImagePath",
+    "version", "updated_at",
+]
+USER_COLUMNS = ["name", "pin", "role", "allowed_pages"]
+LOG_COLUMNS = ["timestamp", "user", "page", "action", "details"]
+
+# table -> (columns, column types, legacy workbook)
+TABLES = {
+    "records": (RECORD_COLUMNS, {"amount": "REAL"}, "data/records.xlsx"),
+    "customers": (CUSTOMER_COLUMNS, {"version": "INTEGER"}, "data/customers.xlsx"),
+    "products": (PRODUCT_COLUMNS, {"UnitPrice": "REAL", "Warranty": "INTEGER", "version": "INTEGER"}, "data/products.xlsx"),
+    "users": (USER_COLUMNS, {}, "data/users.xlsx"),
+    "logs": (LOG_COLUMNS, {}, "data/logs.xlsx"),
+}
+
+# Columns computed on every write from another column (never imported or exported):
+# column -> (source column, vectorized function, per-value function)
+DERIVED_COLUMNS = {
+    "phone_key": ("phone", phone_flat10_series, phone_flat10),
+    "name_key": ("client_name", name_key_series, name_key),
+}
+SMALL_WRITE = 32  # rows; below this derived keys are computed per value (memoized)
+
+# Materialized per-project view of records, maintained by the records writers
+PROJECT_COLUMNS = [
+    "base_id", "client_name", "phone", "location",
+    "q_count", "i_count", "r_count", "invoiced", "paid", "last_update",
+]
+PROJECTS_DDL = """CREATE TABLE IF NOT EXISTS projects (
+    base_id TEXT PRIMARY KEY, client_name TEXT, phone TEXT, location TEXT,
+    q_count INTEGER NOT NULL DEFAULT 0, i_count INTEGER NOT NULL DEFAULT 0, r_count INTEGER NOT NULL DEFAULT 0,
+    invoiced REAL NOT NULL DEFAULT 0, paid REAL NOT NULL DEFAULT 0, last_update TEXT
+)"""
+
+# Records pre-aggregated for the Reports page (see utils/analytics.py)
+CUBE_COLUMNS = ["month", "type", "location", "client_name", "count", "amount"]
+CUBE_DDL = """CREATE TABLE IF NOT EXISTS report_cube (
+    month TEXT NOT NULL, type TEXT NOT NULL, location TEXT NOT NULL, client_name TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0, amount REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (month, type, location, client_name)
+)"""
+
+# Tables whose rows are loaded with their id (ROW_ID) and saved with save_changes()
+VERSIONED_TABLES = ("customers", "products")
+VERSION_COLUMNS = ["version", "updated_at"]
+ROW_ID = "row_id"
+
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS ix_records_type ON records(type)",
+    "CREATE INDEX IF NOT EXISTS ix_records_number ON records(number)",
+    "CREATE INDEX IF NOT EXISTS ix_records_base_id ON records(base_id)",
+    "CREATE INDEX IF NOT EXISTS ix_records_client_name ON records(client_name)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ux_records_type_number ON records(type, number)",
+    "CREATE INDEX IF NOT EXISTS ix_records_phone_key ON records(phone_key)",
+    "CREATE INDEX IF NOT EXISTS ix_records_date ON records(date)",
+    "CREATE INDEX IF NOT EXISTS ix_customers_client_name ON customers(client_name)",
+    "CREATE INDEX IF NOT EXISTS ix_customers_phone_key ON customers(phone_key)",
+    "CREATE INDEX IF NOT EXISTS ix_customers_name_key ON customers(name_key)",
+    "CREATE INDEX IF NOT EXISTS ix_users_pin ON users(pin)",
+    "CREATE INDEX IF NOT EXISTS ix_logs_timestamp ON logs(timestamp)",
+]
+
+_init_lock = threading.Lock()
+_initialized = False
+
+# table -> (key columns, function returning (version, rows queued but not yet written));
+# see utils/write_behind.py
+_overlays: Dict[str, tuple] = {}
+
+
+class ConflictError(Exception):
+    """A row was changed or deleted by someone else since it was loaded."""
+
+
+def _q(name: str) -> str:
+    return f'"{name}"'
+
+
+def _cache_key(table: str) -> str:
+    return f"table:{table}"
+
+
+def _touch(table: str):
+    """Bump the write version so cached snapshots of the table are reloaded."""
+    cache.bump_version(_cache_key(table))
+    if table == "records":
+        cache.bump_version(_cache_key("projects"))
+        cache.bump_version(_cache_key("report_cube"))
+
+
+def mark_changed(*tables: str):
+    """Invalidate cached snapshots after writing through transaction()."""
+    for table in tables:
+        _touch(table)
+
+
+def table_version(table: str) -> tuple:
+    """Token that changes whenever the table may have changed (this or another process)."""
+    overlay = _overlays[table][1]()[0] if table in _overlays else None
+    return (cache.get_version(_cache_key(table)), cache.file_signature(*DB_FILES), overlay)
+
+
+def register_overlay(table: str, key: List[str], pending: Callable):
+    """
+    Show rows queued for a table in its unfiltered loads before they are written.
+
+    Args:
+        table: Table name
+        key: Columns identifying a row; a queued row replaces a stored one with the same key
+        pending: Returns (version, list of row dicts); version changes whenever the list does
+    """
+    _overlays[table] = (key, pending)
+
+
+def _with_overlay(table: str, df: pd.DataFrame, match: Optional[Callable] = None) -> pd.DataFrame:
+    if table not in _overlays:
+        return df
+    key, pending = _overlays[table]
+    rows = pending()[1]
+    if not rows:
+        return df
+    queued = pd.DataFrame(_rows_for(table, pd.DataFrame(rows)), columns=TABLES[table][0])
+    merged = pd.concat([df, queued], ignore_index=True)
+    merged = merged.drop_duplicates(subset=key, keep="last")
+    if match is not None:
+        # A queued row replaces its stored row even when it no longer matches
+        merged = merged[match(merged)]
+    return merged.reset_index(drop=True)
+
+
+@contextmanager
+def _connect():
+    """Open a connection, commit on success and always close it."""
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    try:
+        conn.execute("PRAGMA synchronous=NORMAL")
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+@contextmanager
+def transaction():
+    """
+    One durable write transaction (synchronous=FULL) for several operations.
+    Pass the connection as conn= to the write functions below; they then skip
+    their own commit and cache invalidation, so call mark_changed() afterwards.
+    """
+    init_storage()
+    with _connect() as conn:
+        conn.execute("PRAGMA synchronous=FULL")
+        conn.execute("BEGIN IMMEDIATE")
+        yield conn
+
+
+@contextmanager
+def _writing(conn, table: str):
+    """The caller's transaction, or a new one that marks table changed after committing."""
+    if conn is not None:
+        yield conn
+        return
+    init_storage()
+    with _connect() as own:
+        own.execute("BEGIN IMMEDIATE")
+        yield own
+    _touch(table)
+
+
+def _to_db_value(value, col_type: str):
+    """Convert a pandas/Excel cell into a value SQLite can store."""
+    if value is None:
+        return None
+    try:
+        if pd.isna(value):
+            return None
+    except (TypeError, ValueError):
+        pass
+    if col_type == "REAL":
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return None
+    if col_type == "INTEGER":
+        try:
+            return int(float(value))
+        except (TypeError, ValueError):
+            return None
+    # TEXT: Excel turns phones and PINs into floats (502992932.0)
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, (pd.Timestamp, datetime)):
+        if value.hour == 0 and value.minute == 0 and value.second == 0:
+            return value.strftime("%Y-%m-%d")
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value)
+
+
+def _with_derived(table: str, df: pd.DataFrame) -> pd.DataFrame:
+    columns = TABLES[table][0]
+    df = df.reindex(columns=columns)
+    for col, (source, fn, scalar) in DERIVED_COLUMNS.items():
+        if col in columns:
+            # Derive from the stored text (Excel floats like 502992932.0 become "502992932")
+            text = df[source].map(lambda v: _to_db_value(v, "TEXT"))
+            df[col] = text.map(scalar) if len(df) < SMALL_WRITE else fn(text)
+    return df
+
+
+def _rows_for(table: str, df: pd.DataFrame) -> List[tuple]:
+    columns, types, _ = TABLES[table]
+    df = _with_derived(table, df)
+    rows = []
+    for values in df.itertuples(index=False, name=None):
+        rows.append(tuple(_to_db_value(v, types.get(c, "TEXT")) for c, v in zip(columns, values)))
+    return rows
+
+
+def _now() -> str:
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _stamp(table: str, df: pd.DataFrame, version: int) -> pd.DataFrame:
+    """Set the row version and updated_at on rows being written to a versioned table."""
+    if table not in VERSIONED_TABLES:
+        return df
+    return df.assign(version=version, updated_at=_now())
+
+
+def _next_version(conn, table: str) -> int:
+    """A version above any handed out, for bulk replaces (old snapshots become stale)."""
+    return int(conn.execute(f"SELECT COALESCE(MAX(version), 0) FROM {table}").fetchone()[0]) + 1
+
+
+def _insert_sql(table: str, verb: str = "INSERT") -> str:
+    columns = TABLES[table][0]
+    cols = ",".join(_q(c) for c in columns)
+    marks = ",".join("?" for _ in columns)
+    return f"{verb} INTO {table} ({cols}) VALUES ({marks})"
+
+
+def init_storage():
+    """
+    Create data/newton.db (WAL mode) with all tables and indexes.
+    On first run each table is imported once from its legacy workbook.
+    """
+    global _initialized
+    if _initialized:
+        return
+    with _init_lock:
+        if _initialized:
+            return
+        os.makedirs("data", exist_ok=True)
+        with _connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            for table, (columns, types, _) in TABLES.items():
+                col_defs = ",".join(f"{_q(c)} {types.get(c, 'TEXT')}" for c in columns)
+                conn.execute(f"CREATE TABLE IF NOT EXISTS {table} ({col_defs})")
+                _add_missing_columns(conn, table)
+            for stmt in INDEXES:
+                conn.execute(stmt)
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            conn.execute("CREATE TABLE IF NOT EXISTS sequences (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            existing = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            conn.execute(PROJECTS_DDL)
+            conn.execute(CUBE_DDL)
+            if not {"projects", "report_cube"} <= existing:
+                _rebuild_aggregates(conn)
+            imported = {k for (k,) in conn.execute("SELECT key FROM meta WHERE key LIKE 'imported:%'")}
+        for table in TABLES:
+            if f"imported:{table}" not in imported:
+                import_from_excel(table)
+        _initialized = True
+
+
+def _add_missing_columns(conn, table: str):
+    """Add columns introduced after the database was created, filling derived and version ones."""
+    columns, types, _ = TABLES[table]
+    existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    missing = [c for c in columns if c not in existing]
+    for col in missing:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {_q(col)} {types.get(col, 'TEXT')}")
+    for col in missing:
+        if col in DERIVED_COLUMNS:
+            source, fn, _ = DERIVED_COLUMNS[col]
+            df = pd.read_sql_query(f"SELECT rowid, {_q(source)} FROM {table}", conn)
+            keys = fn(df[source])
+            conn.executemany(
+                f"UPDATE {table} SET {_q(col)} = ? WHERE rowid = ?",
+                zip(keys.tolist(), df["rowid"].tolist()),
+            )
+        elif col == "version":
+            conn.execute(f"UPDATE {table} SET version = 1")
+
+
+def import_from_excel(table: str, path: Optional[str] = None) -> int:
+    """
+    Replace a table with the contents of its workbook.
+
+    Args:
+        table: records, customers, products, users or logs
+        path: Workbook to read (defaults to the legacy data/<table>.xlsx)
+
+    Returns:
+        Number of rows imported
+    """
+    columns, _, default_path = TABLES[table]
+    path = path or default_path
+    df = pd.DataFrame(columns=columns)
+    if os.path.exists(path):
+        try:
+            df = pd.read_excel(path)
+            if table != "products":
+                df.columns = [str(c).strip().lower() for c in df.columns]
+            if table == "records" and {"type", "number"}.issubset(df.columns):
+                df = df.drop_duplicates(subset=["type", "number"], keep="last")
+        except Exception as e:
+            print(f"Error importing {path}: {e}")
+            return 0
+    with _connect() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        rows = _rows_for(table, _stamp(table, df, _next_version(conn, table) if table in VERSIONED_TABLES else 1))
+        conn.execute(f"DELETE FROM {table}")
+        conn.executemany(_insert_sql(table, "INSERT OR REPLACE"), rows)
+        if table == "records":
+            _rebuild_aggregates(conn)
+        conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            (f"imported:{table}", _now()),
+        )
+    _touch(table)
+    return len(rows)
+
+
+def export_to_excel(tables: Optional[List[str]] = None) -> List[str]:
+    """
+    Write tables back to their data/*.xlsx workbooks.
+
+    Returns:
+        List of written file paths
+    """
+    written = []
+    for table in tables or list(TABLES):
+        try:
+            path = TABLES[table][2]
+            df = load_table(table)
+            internal = [*DERIVED_COLUMNS, *VERSION_COLUMNS, ROW_ID]
+            with atomic_writer(path) as f:
+                df.drop(columns=[c for c in internal if c in df.columns]).to_excel(f, index=False)
+            written.append(path)
+        except Exception as e:
+            print(f"Error exporting {table}: {e}")
+    return written
+
+
+# ==========================================
+# Generic table access
+# ==========================================
+
+def _query_table(table: str, where: str = "", params: tuple = ()) -> pd.DataFrame:
+    columns = TABLES[table][0]
+    cols = ",".join(_q(c) for c in columns)
+    if table in VERSIONED_TABLES:
+        columns = columns + [ROW_ID]
+        cols += f", rowid AS {ROW_ID}"
+    sql = f"SELECT {cols} FROM {table}"
+    if where:
+        sql += f" WHERE {where}"
+    sql += " ORDER BY rowid"
+    with _connect() as conn:
+        df = pd.read_sql_query(sql, conn, params=params)
+    return df.reindex(columns=columns)
+
+
+def load_table(table: str, where: str = "", params: tuple = (),
+               match: Optional[Callable[[pd.DataFrame], pd.Series]] = None) -> pd.DataFrame:
+    """
+    Load a table (optionally filtered) as a DataFrame with its canonical columns
+    (plus ROW_ID for versioned tables).
+    Unfiltered reads come from the shared cache as a private snapshot, including
+    rows still queued for writing (see register_overlay). Filtered reads include
+    them only when match, a row mask equivalent to where, is given.
+    """
+    init_storage()
+    if where:
+        rows = _query_table(table, where, params)
+        return rows if match is None else _with_overlay(table, rows, match)
+    return _with_overlay(table, cache.cached_frame(_cache_key(table), lambda: _query_table(table), DB_FILES))
+
+
+def count_rows(table: str, where: str = "", params: tuple = ()) -> int:
+    """Number of stored rows (optionally filtered), counted by SQLite."""
+    init_storage()
+    sql = f"SELECT COUNT(*) FROM {table}" + (f" WHERE {where}" if where else "")
+    with _connect() as conn:
+        return conn.execute(sql, params).fetchone()[0]
+
+
+def iter_rows(table: str, columns: Optional[List[str]] = None, where: str = "",
+              params: tuple = (), batch: int = 1000) -> Iterator[tuple]:
+    """
+    Rows of a table as tuples in insertion order, fetched batch rows at a time
+    (for streaming exports; rows still queued for writing are not included).
+    """
+    init_storage()
+    cols = ",".join(_q(c) for c in (columns or TABLES[table][0]))
+    sql = f"SELECT {cols} FROM {table}"
+    if where:
+        sql += f" WHERE {where}"
+    with _connect() as conn:
+        cur = conn.execute(sql + " ORDER BY rowid", params)
+        while True:
+            chunk = cur.fetchmany(batch)
+            if not chunk:
+                return
+            yield from chunk
+
+
+def replace_table(table: str, df: pd.DataFrame):
+    """Replace all rows of a table in a single transaction."""
+    init_storage()
+    with _connect() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        rows = _rows_for(table, _stamp(table, df, _next_version(conn, table) if table in VERSIONED_TABLES else 1))
+        conn.execute(f"DELETE FROM {table}")
+        conn.executemany(_insert_sql(table, "INSERT OR REPLACE"), rows)
+        if table == "records":
+            _rebuild_aggregates(conn)
+    _touch(table)
+
+
+def insert_rows(table: str, rows: List[Dict]):
+    """Append rows to a table."""
+    init_storage()
+    values = _rows_for(table, _stamp(table, pd.DataFrame(rows), 1))
+    with _connect() as conn:
+        conn.executemany(_insert_sql(table), values)
+        if table == "records":
+            for row in values:
+                _count_record(conn, dict(zip(RECORD_COLUMNS, row)), 1)
+    _touch(table)
+
+
+def save_changes(table: str, changed: Optional[pd.DataFrame] = None, deleted: Optional[pd.DataFrame] = None) -> int:
+    """
+    Write only the rows a user added, edited or deleted in a versioned table,
+    all in one transaction.
+
+    A row with a ROW_ID updates that row, but only if its stored version still
+    equals the row's "version" (the one it was loaded with); only the columns
+    present in changed are written, the rest keep their stored values. A row
+    without a ROW_ID is inserted. Deleted rows are matched the same way.
+
+    Args:
+        table: customers or products
+        changed: Added/edited rows (ROW_ID and version, plus the columns to set)
+        deleted: Rows to delete (ROW_ID and version)
+
+    Returns:
+        Number of rows written
+
+    Raises:
+        ConflictError: A row was changed or deleted since it was loaded;
+            nothing is written
+    """
+    init_storage()
+    columns = TABLES[table][0]
+    cols = ",".join(_q(c) for c in columns)
+    assignments = ",".join(f"{_q(c)} = ?" for c in columns)
+    changed = changed if changed is not None else pd.DataFrame()
+    deleted = deleted if deleted is not None else pd.DataFrame()
+    label = table[:-1].capitalize()
+    stale = f"{label} was changed or deleted by another user. Reload the page and try again."
+
+    def expected(row) -> tuple:
+        version = row.get("version")
+        return int(row[ROW_ID]), (None if _blank(version) else int(version))
+
+    written = 0
+    with _connect() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        for _, row in deleted.iterrows():
+            row_id, version = expected(row)
+            if conn.execute(f"DELETE FROM {table} WHERE rowid = ? AND version IS ?", (row_id, version)).rowcount != 1:
+                raise ConflictError(stale)
+            written += 1
+        for _, row in changed.iterrows():
+            fields = {c: row[c] for c in changed.columns if c in columns and c not in VERSION_COLUMNS}
+            if ROW_ID not in row or _blank(row[ROW_ID]):
+                values = _rows_for(table, _stamp(table, pd.DataFrame([fields]), 1))[0]
+                conn.execute(_insert_sql(table), values)
+            else:
+                row_id, version = expected(row)
+                hit = conn.execute(f"SELECT {cols} FROM {table} WHERE rowid = ?", (row_id,)).fetchone()
+                if hit is None or hit[columns.index("version")] != version:
+                    raise ConflictError(stale)
+                merged = {**dict(zip(columns, hit)), **fields}
+                values = _rows_for(table, _stamp(table, pd.DataFrame([merged]), (version or 0) + 1))[0]
+                conn.execute(f"UPDATE {table} SET {assignments} WHERE rowid = ?", (*values, row_id))
+            written += 1
+    if written:
+        _touch(table)
+    return written
+
+
+# ==========================================
+# Records
+# ==========================================
+
+def load_records() -> pd.DataFrame:
+    """Load all quotation/invoice/receipt records in insertion order."""
+    return load_table("records")
+
+
+def save_record(rec: Dict, conn=None):
+    """
+    Insert a record, replacing any existing row with the same type and number,
+    and update its project row (and the replaced record's) in the projects table.
+    """
+    values = _rows_for("records", pd.DataFrame([rec]))[0]
+    row = dict(zip(RECORD_COLUMNS, values))
+    cols = ",".join(_q(c) for c in RECORD_COLUMNS)
+    with _writing(conn, "records") as c:
+        old = c.execute(
+            f"SELECT {cols} FROM records WHERE type = ? AND number = ?", (row["type"], row["number"])
+        ).fetchone()
+        c.execute(_insert_sql("records", "INSERT OR REPLACE"), values)
+        if old:
+            _count_record(c, dict(zip(RECORD_COLUMNS, old)), -1)
+        _count_record(c, row, 1)
+
+
+# ==========================================
+# Projects / report cube
+# ==========================================
+
+def _count_record(conn, row: Dict, sign: int):
+    """Add (sign=1) or remove (sign=-1) one record's share of the aggregates: O(1)."""
+    _count_in_cube(conn, row, sign)
+    _count_in_project(conn, row, sign)
+
+
+def _count_in_cube(conn, row: Dict, sign: int):
+    cell = (str(row.get("date") or "")[:7], str(row.get("type") or ""),
+            str(row.get("location") or ""), str(row.get("client_name") or ""))
+    conn.execute(
+        "INSERT OR IGNORE INTO report_cube (month, type, location, client_name) VALUES (?, ?, ?, ?)", cell
+    )
+    conn.execute(
+        """UPDATE report_cube SET count = count + ?, amount = amount + ?
+           WHERE month = ? AND type = ? AND location = ? AND client_name = ?""",
+        (sign, sign * float(row.get("amount") or 0.0), *cell),
+    )
+    if sign < 0:
+        conn.execute(
+            """DELETE FROM report_cube WHERE count <= 0
+               AND month = ? AND type = ? AND location = ? AND client_name = ?""",
+            cell,
+        )
+
+
+def _count_in_project(conn, row: Dict, sign: int):
+    base_id, rtype = row.get("base_id"), row.get("type")
+    if not base_id or rtype not in ("q", "i", "r"):
+        return
+    amount = float(row.get("amount") or 0.0)
+    conn.execute("INSERT OR IGNORE INTO projects (base_id) VALUES (?)", (base_id,))
+    conn.execute(
+        f"""UPDATE projects SET {rtype}_count = {rtype}_count + ?,
+            invoiced = invoiced + ?, paid = paid + ?
+            WHERE base_id = ?""",
+        (
+            sign,
+            sign * amount if rtype == "i" else 0.0,
+            sign * amount if rtype == "r" else 0.0,
+            base_id,
+        ),
+    )
+    if sign < 0 and conn.execute(
+        "DELETE FROM projects WHERE base_id = ? AND q_count + i_count + r_count <= 0", (base_id,)
+    ).rowcount:
+        return
+    # Same as _rebuild_aggregates: the project's earliest stored record names its
+    # client and its latest date is the last update (indexed lookups on base_id)
+    conn.execute(
+        """UPDATE projects SET
+            (client_name, phone, location) = (
+                SELECT client_name, phone, location FROM records
+                WHERE base_id = ? ORDER BY rowid LIMIT 1),
+            last_update = (SELECT MAX(date) FROM records WHERE base_id = ?)
+           WHERE base_id = ?""",
+        (base_id, base_id, base_id),
+    )
+
+
+def _rebuild_aggregates(conn):
+    """Recompute the projects table and report cube from records (after bulk imports)."""
+    conn.execute("DELETE FROM report_cube")
+    conn.execute("""
+        INSERT INTO report_cube (month, type, location, client_name, count, amount)
+        SELECT substr(COALESCE(date, ''), 1, 7), COALESCE(type, ''), COALESCE(location, ''),
+               COALESCE(client_name, ''), COUNT(*), COALESCE(SUM(amount), 0)
+        FROM records GROUP BY 1, 2, 3, 4
+    """)
+    conn.execute("DELETE FROM projects")
+    conn.execute("""
+        WITH firsts AS (
+            SELECT base_id, MIN(rowid) AS first FROM records
+            WHERE base_id IS NOT NULL AND base_id != '' GROUP BY base_id
+        )
+        INSERT INTO projects (base_id, client_name, phone, location,
+                              q_count, i_count, r_count, invoiced, paid, last_update)
+        SELECT r.base_id, f.client_name, f.phone, f.location,
+               SUM(r.type = 'q'), SUM(r.type = 'i'), SUM(r.type = 'r'),
+               COALESCE(SUM(CASE WHEN r.type = 'i' THEN r.amount END), 0),
+               COALESCE(SUM(CASE WHEN r.type = 'r' THEN r.amount END), 0),
+               MAX(r.date)
+        FROM records r
+        JOIN firsts ON firsts.base_id = r.base_id
+        JOIN records f ON f.rowid = firsts.first
+        GROUP BY r.base_id
+    """)
+
+
+def _query_projects() -> pd.DataFrame:
+    cols = ",".join(_q(c) for c in PROJECT_COLUMNS)
+    with _connect() as conn:
+        df = pd.read_sql_query(f"SELECT {cols} FROM projects ORDER BY base_id", conn)
+    df["balance"] = df["invoiced"] - df["paid"]
+    return df
+
+
+def _query_cube() -> pd.DataFrame:
+    cols = ",".join(_q(c) for c in CUBE_COLUMNS)
+    with _connect() as conn:
+        return pd.read_sql_query(f"SELECT {cols} FROM report_cube ORDER BY month", conn)
+
+
+def load_cube() -> pd.DataFrame:
+    """Report cube: record count and amount per (month "YYYY-MM", type, location, client)."""
+    init_storage()
+    return cache.cached_frame(_cache_key("report_cube"), _query_cube, DB_FILES)
+
+
+def load_projects() -> pd.DataFrame:
+    """
+    One row per project (base_id): client, record counts per type, invoiced,
+    paid, balance and last update. Served from the shared cache.
+    """
+    init_storage()
+    return cache.cached_frame(_cache_key("projects"), _query_projects, DB_FILES)
+
+
+def record_base_id(rtype: str, number: str, conn=None) -> Optional[str]:
+    """base_id stored for the record of this type and number (None if unsaved or unset)."""
+    if conn is None:
+        init_storage()
+        with _connect() as own:
+            return record_base_id(rtype, number, own)
+    row = conn.execute(
+        "SELECT base_id FROM records WHERE type = ? AND number = ?", (rtype, str(number))
+    ).fetchone()
+    return row[0] if row and row[0] else None
+
+
+# ==========================================
+# Meta
+# ==========================================
+
+def get_meta(key: str, conn=None) -> Optional[str]:
+    if conn is None:
+        init_storage()
+        with _connect() as own:
+            return get_meta(key, own)
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+
+def set_meta(key: str, value: str, conn=None):
+    if conn is None:
+        init_storage()
+        with _connect() as own:
+            return set_meta(key, value, own)
+    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+
+def delete_meta(keys: List[str], conn=None):
+    if conn is None:
+        init_storage()
+        with _connect() as own:
+            return delete_meta(keys, own)
+    conn.executemany("DELETE FROM meta WHERE key = ?", [(k,) for k in keys])
+
+
+def meta_keys(prefix: str, conn=None) -> List[str]:
+    """Meta keys starting with prefix."""
+    if conn is None:
+        init_storage()
+        with _connect() as own:
+            return meta_keys(prefix, own)
+    return [k for (k,) in conn.execute("SELECT key FROM meta WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))]
+
+
+# ==========================================
+# Sequences
+# ==========================================
+
+def max_suffix(conn, column: str, prefix: str, rtype: Optional[str] = None) -> int:
+    """Largest number right after prefix among records.<column> values (0 if none)."""
+    sql = f"SELECT {_q(column)} FROM records WHERE substr({_q(column)}, 1, ?) = ?"
+    params = [len(prefix), prefix]
+    if rtype:
+        sql += " AND type = ?"
+        params.append(rtype)
+    best = 0
+    for (value,) in conn.execute(sql, params):
+        digits = str(value)[len(prefix):].split("-")[0]
+        if digits.isdigit():
+            best = max(best, int(digits))
+    return best
+
+
+def next_sequence(name: str, floor: Optional[Callable] = None, conn=None) -> int:
+    """
+    Atomically take the next value of a named counter (e.g. "invoice:20250101").
+
+    The increment is committed with synchronous=FULL before the value is
+    returned, so a value is never handed out twice, even after a crash.
+
+    Args:
+        name: Counter name
+        floor: Called with the open connection the first time a counter is
+            used; returns the highest value already taken (e.g. by records
+            saved before counters existed)
+        conn: Take the value inside this transaction() instead of its own
+
+    Returns:
+        The new value (1 for a fresh counter without a floor)
+    """
+    if conn is None:
+        with transaction() as own:
+            return next_sequence(name, floor, own)
+    row = conn.execute("SELECT value FROM sequences WHERE name = ?", (name,)).fetchone()
+    current = row[0] if row else (floor(conn) if floor else 0)
+    value = int(current) + 1
+    conn.execute("INSERT OR REPLACE INTO sequences (name, value) VALUES (?, ?)", (name, value))
+    return value
+
+
+def peek_sequence(name: str, floor: Optional[Callable] = None) -> int:
+    """The value next_sequence(name, floor) would take now, without taking it."""
+    init_storage()
+    with _connect() as conn:
+        row = conn.execute("SELECT value FROM sequences WHERE name = ?", (name,)).fetchone()
+    if row:
+        return int(row[0]) + 1
+    with transaction() as conn:
+        # Store the floor, so later peeks of this counter are a single lookup
+        current = floor(conn) if floor else 0
+        conn.execute("INSERT OR IGNORE INTO sequences (name, value) VALUES (?, ?)", (name, current))
+        return int(conn.execute("SELECT value FROM sequences WHERE name = ?", (name,)).fetchone()[0]) + 1
+
+
+# ==========================================
+# Customers / Products / Users
+# ==========================================
+
+def load_customers() -> pd.DataFrame:
+    return load_table("customers")
+
+
+def save_customers(changed: Optional[pd.DataFrame] = None, deleted: Optional[pd.DataFrame] = None) -> int:
+    """Save added, edited and deleted customers (see save_changes)."""
+    return save_changes("customers", changed, deleted)
+
+
+def _blank(value) -> bool:
+    return value is None or (isinstance(value, float) and pd.isna(value)) or str(value).strip() == ""
+
+
+def _find_customer(conn, name: str, phone: str) -> Optional[int]:
+    for col, key in (("name_key", name_key(name)), ("phone_key", phone_flat10(phone))):
+        if key:
+            hit = conn.execute(f"SELECT rowid FROM customers WHERE {col} = ? LIMIT 1", (key,)).fetchone()
+            if hit:
+                return hit[0]
+    return None
+
+
+def upsert_customer(fields: Dict, defaults: Optional[Dict] = None, conn=None) -> int:
+    """
+    Insert or update one customer, matched through the name and phone key
+    indexes (name first), without reading or rewriting the rest of the table.
+
+    Args:
+        fields: Values to write (client_name, phone, ...); on update, empty
+            values keep what is stored
+        defaults: Values for a new customer, also filled into empty columns
+            of an existing one
+        conn: Write inside this transaction() instead of its own
+
+    Returns:
+        Customer id (rowid)
+    """
+    defaults = defaults or {}
+    columns = TABLES["customers"][0]
+    with _writing(conn, "customers") as conn:
+        rowid = _find_customer(conn, fields.get("client_name"), fields.get("phone"))
+        if rowid is None:
+            values = _rows_for("customers", _stamp("customers", pd.DataFrame([{**defaults, **fields}]), 1))
+            rowid = conn.execute(_insert_sql("customers"), values[0]).lastrowid
+        else:
+            cols = ",".join(_q(c) for c in columns)
+            row = dict(zip(columns, conn.execute(f"SELECT {cols} FROM customers WHERE rowid = ?", (rowid,)).fetchone()))
+            for col, value in defaults.items():
+                if _blank(row.get(col)):
+                    row[col] = value
+            for col, value in fields.items():
+                if not _blank(value):
+                    row[col] = value
+            values = _rows_for("customers", _stamp("customers", pd.DataFrame([row]), (row["version"] or 0) + 1))[0]
+            assignments = ",".join(f"{_q(c)} = ?" for c in columns)
+            conn.execute(f"UPDATE customers SET {assignments} WHERE rowid = ?", (*values, rowid))
+    return rowid
+
+
+def load_products() -> pd.DataFrame:
+    return load_table("products")
+
+
+def save_products(changed: Optional[pd.DataFrame] = None, deleted: Optional[pd.DataFrame] = None) -> int:
+    """Save added, edited and deleted products (see save_changes)."""
+    return save_changes("products", changed, deleted)
+
+
+def load_users() -> pd.DataFrame:
+    return load_table("users")
+
+
+def save_users(df: pd.DataFrame):
+    replace_table("users", df)
+
+
+# ==========================================
+# Logs
+# ==========================================
+
+def load_logs() -> pd.DataFrame:
+    return load_table("logs")
+
+
+def delete_logs_before(cutoff: str) -> int:
+    """Delete log rows with timestamp earlier than cutoff ('%Y-%m-%d %H:%M:%S')."""
+    init_storage()
+    with _connect() as conn:
+        cur = conn.execute('DELETE FROM logs WHERE "timestamp" < ?', (cutoff,))
+        deleted = cur.rowcount
+    _touch("logs")
+    return deleted
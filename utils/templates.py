@@ -0,0 +1,155 @@
+"""
+Word Template Cache for Newton Smart Home Application
+Each .docx template is parsed once (cached by path + mtime) together with an
+index of the table cells and body paragraph runs holding {{placeholders}}. A
+render is a deepcopy of the parsed document plus direct substitution into the
+indexed cells and runs.
+"""
+
+import copy
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+from docx import Document
+
+from utils import cache
+
+
+PLACEHOLDER_RE = re.compile(r"\{\{[^{}]+\}\}")
+
+
+@dataclass
+class CompiledTemplate:
+    path: str
+    signature: tuple
+    document: object
+    # (table index, row index, cell index, placeholders in that cell)
+    cells: List[Tuple[int, int, int, Tuple[str, ...]]] = field(default_factory=list)
+    # (body paragraph index, indexes of the runs holding whole placeholders, or
+    # None when a placeholder is split across runs, placeholders in that paragraph)
+    paragraphs: List[Tuple[int, Optional[Tuple[int, ...]], Tuple[str, ...]]] = field(default_factory=list)
+    # Product table: first cell reads "item no"; rows end at the one marked "last"
+    item_table: Optional[int] = None
+    last_row: Optional[int] = None
+
+
+_lock = threading.Lock()
+_compiled: Dict[str, CompiledTemplate] = {}
+
+
+def _compile(path: str, signature: tuple) -> CompiledTemplate:
+    doc = Document(path)
+    compiled = CompiledTemplate(path=path, signature=signature, document=doc)
+    for p_idx, paragraph in enumerate(doc.paragraphs):
+        keys = tuple(dict.fromkeys(PLACEHOLDER_RE.findall(paragraph.text)))
+        if not keys:
+            continue
+        runs = paragraph.runs
+        in_runs = [i for i, run in enumerate(runs) if PLACEHOLDER_RE.search(run.text)]
+        whole = sum(len(PLACEHOLDER_RE.findall(runs[i].text)) for i in in_runs)
+        split = whole != len(PLACEHOLDER_RE.findall(paragraph.text))
+        compiled.paragraphs.append((p_idx, None if split else tuple(in_runs), keys))
+    seen = set()
+    for t_idx, table in enumerate(doc.tables):
+        for r_idx, row in enumerate(table.rows):
+            for c_idx, cell in enumerate(row.cells):
+                # merged cells are returned once per grid column
+                if cell._tc in seen:
+                    continue
+                seen.add(cell._tc)
+                keys = tuple(dict.fromkeys(PLACEHOLDER_RE.findall(cell.text)))
+                if keys:
+                    compiled.cells.append((t_idx, r_idx, c_idx, keys))
+        if compiled.item_table is None:
+            try:
+                if table.cell(0, 0).text.strip().lower() in ["item no", "item no."]:
+                    compiled.item_table = t_idx
+                    for r_idx, row in enumerate(table.rows):
+                        if row.cells[0].text.strip().lower() == "last":
+                            compiled.last_row = r_idx
+                            break
+            except Exception:
+                continue
+    return compiled
+
+
+def template_version(path: str) -> tuple:
+    """Signature (mtime/size) of a template file; changes when it is replaced."""
+    return cache.file_signature(path)
+
+
+def get_template(path: str) -> CompiledTemplate:
+    """Return the compiled template, re-parsing only if the file changed."""
+    signature = template_version(path)
+    with _lock:
+        hit = _compiled.get(path)
+        if hit is not None and hit.signature == signature:
+            return hit
+    compiled = _compile(path, signature)
+    with _lock:
+        _compiled[path] = compiled
+    return compiled
+
+
+def new_document(path: str):
+    """
+    Fresh, independent copy of a template.
+
+    Returns:
+        (document, compiled template)
+    """
+    compiled = get_template(path)
+    doc = copy.deepcopy(compiled.document)
+    # lxml's deepcopy ignores the memo, so the copied Document and its part hold
+    # separate element trees; rebind to the part's tree, which is what save() writes
+    return doc.part.document, compiled
+
+
+def fill_placeholders(doc, compiled: CompiledTemplate, data: Dict[str, object],
+                      on_replace: Optional[Callable] = None):
+    """
+    Replace {{placeholders}} in the indexed table cells and body paragraphs of doc.
+    Placeholders within a single run keep that run's formatting.
+
+    Args:
+        doc: Document returned by new_document()
+        compiled: Its compiled template
+        data: {"{{key}}": value}; None becomes an empty string
+        on_replace: Optional callback(cell, old_text, new_text) for formatting
+    """
+    tables = doc.tables
+    for t_idx, r_idx, c_idx, keys in compiled.cells:
+        if not any(k in data for k in keys):
+            continue
+        cell = tables[t_idx].rows[r_idx].cells[c_idx]
+        old = cell.text
+        new = old
+        for key in keys:
+            if key in data:
+                val = data[key]
+                new = new.replace(key, "" if val is None else str(val))
+        if new != old:
+            cell.text = new
+            if on_replace is not None:
+                on_replace(cell, old, new)
+
+    paragraphs = doc.paragraphs if compiled.paragraphs else []
+    for p_idx, run_ids, keys in compiled.paragraphs:
+        if not any(k in data for k in keys):
+            continue
+        paragraph = paragraphs[p_idx]
+        runs = paragraph.runs
+        targets = [runs[i] for i in run_ids] if run_ids is not None else runs[:1]
+        for run in targets:
+            text = paragraph.text if run_ids is None else run.text
+            for key in keys:
+                if key in data:
+                    val = data[key]
+                    text = text.replace(key, "" if val is None else str(val))
+            run.text = text
+        if run_ids is None:
+            # Placeholder split across runs: the paragraph text goes into its first run
+            for run in runs[1:]:
+                run.text = ""
@@ -0,0 +1,149 @@
+"""
+Customer Typeahead for Newton Smart Home Application
+In-memory prefix index over existing customers' canonical phone digits and
+lower-cased names, so the Quotation and Invoice pages can suggest a customer
+while the salesperson types. The index is built once from the customers table
+and rebuilt only after that table is written.
+"""
+
+import threading
+from bisect import bisect_left
+from typing import List, NamedTuple, Optional, Tuple
+
+from utils import storage
+from utils.normalize import name_key, phone_flat10
+
+
+MAX_SUGGESTIONS = 8
+MIN_PHONE_DIGITS = 3
+
+
+class Customer(NamedTuple):
+    client_name: str
+    phone: str
+    phone_key: str
+    location: str
+
+
+def _clean(value) -> str:
+    return "" if value is None or value != value else str(value)
+
+
+class PrefixIndex:
+    """Sorted (key, customer) arrays; a prefix lookup is two binary searches."""
+
+    def __init__(self, pairs: List[Tuple[str, int]]):
+        pairs = sorted(p for p in pairs if p[0])
+        self._keys = [k for k, _ in pairs]
+        self._ids = [i for _, i in pairs]
+
+    def search(self, prefix: str, limit: int) -> List[int]:
+        if not prefix:
+            return []
+        lo = bisect_left(self._keys, prefix)
+        hi = bisect_left(self._keys, prefix + "\uffff", lo)
+        out = []
+        for i in self._ids[lo:hi]:
+            if i not in out:
+                out.append(i)
+                if len(out) >= limit:
+                    break
+        return out
+
+
+class CustomerIndex:
+    """Name and phone prefix indexes over one snapshot of the customers table."""
+
+    def __init__(self, customers: List[Customer]):
+        self.customers = customers
+        names, phones = [], []
+        for i, c in enumerate(customers):
+            key = name_key(c.client_name)
+            # Full name plus every later word, so "omer" finds "Ahmed Omer"
+            words = key.split()
+            names.extend((" ".join(words[w:]), i) for w in range(len(words)))
+            phones.append((c.phone_key, i))
+        self._names = PrefixIndex(names)
+        self._phones = PrefixIndex(phones)
+
+    def __len__(self):
+        return len(self.customers)
+
+    def search(self, text: str, limit: int = MAX_SUGGESTIONS) -> List[Customer]:
+        """
+        Customers whose name (any word) or phone starts with the typed text.
+
+        Args:
+            text: What was typed: part of a name, or at least MIN_PHONE_DIGITS digits
+            limit: Maximum number of suggestions
+
+        Returns:
+            Matching customers, phone matches first
+        """
+        text = str(text or "").strip()
+        ids: List[int] = []
+        digits = "".join(ch for ch in text if ch.isdigit())
+        if len(digits) >= MIN_PHONE_DIGITS:
+            ids = self._phones.search(_phone_prefix(digits), limit)
+        if len(ids) < limit and any(ch.isalpha() for ch in text):
+            for i in self._names.search(" ".join(name_key(text).split()), limit):
+                if i not in ids and len(ids) < limit:
+                    ids.append(i)
+        return [self.customers[i] for i in ids]
+
+
+def _phone_prefix(digits: str) -> str:
+    """Map a partly typed number onto the 05XXXXXXXX key space."""
+    if digits.startswith("00971"):
+        digits = digits[2:]
+    if digits.startswith("971"):
+        return "0" + digits[3:] if len(digits) > 3 else "0"
+    if digits.startswith("5"):
+        return "0" + digits
+    return digits
+
+
+def build_index() -> CustomerIndex:
+    df = storage.load_customers()
+    customers = [
+        Customer(_clean(n).strip(), _clean(p), _clean(k) or phone_flat10(p), _clean(l))
+        for n, p, k, l in zip(df["client_name"], df["phone"], df["phone_key"], df["location"])
+        if _clean(n).strip()
+    ]
+    return CustomerIndex(customers)
+
+
+_lock = threading.Lock()
+_index: Optional[CustomerIndex] = None
+_index_version = None
+
+
+def get_customer_index() -> CustomerIndex:
+    """Shared index for this process, rebuilt when the customers table changed."""
+    global _index, _index_version
+    version = storage.table_version("customers")
+    with _lock:
+        if _index is not None and _index_version == version:
+            return _index
+    index = build_index()
+    with _lock:
+        _index, _index_version = index, version
+    return index
+
+
+def suggest_customers(text: str, limit: int = MAX_SUGGESTIONS) -> List[Customer]:
+    return get_customer_index().search(text, limit)
+
+
+def suggest_for_inputs(name_text: str, phone_text: str, limit: int = MAX_SUGGESTIONS) -> List[Customer]:
+    """
+    Suggestions for a client form: phone matches, then name matches, leaving out
+    the customer whose name and phone are already filled in.
+    """
+    index = get_customer_index()
+    typed = (name_key(name_text), phone_flat10(phone_text))
+    out = []
+    for c in index.search(phone_text, limit) + index.search(name_text, limit):
+        if c not in out and (name_key(c.client_name), c.phone_key) != typed:
+            out.append(c)
+    return out[:limit]
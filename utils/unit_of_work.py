@@ -0,0 +1,68 @@
+"""
+Unit of Work for Newton Smart Home Application
+Groups everything one user action saves (record, project id, customer, log
+entries) into a single durable SQLite transaction instead of one commit per
+write. Its reads are indexed lookups on the same connection (no table loads),
+and cached snapshots and the activity log are only updated after the
+transaction has committed.
+
+Example:
+    with unit_of_work() as uow:
+        base_id = uow.record_base_id("q", quote_no) or uow.next_base_id()
+        uow.save_record({...})
+        uow.upsert_customer({...}, defaults={...})
+        uow.log(user_name, "Quotation", "quotation_created", details)
+"""
+
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from utils import storage
+from utils.logger import log_event
+from utils.sequences import next_base_id
+
+
+class UnitOfWork:
+    """Reads and writes of one user action, on one open transaction."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self._changed: List[str] = []
+        self._logs: List[tuple] = []
+
+    def _changes(self, table: str):
+        if table not in self._changed:
+            self._changed.append(table)
+
+    def record_base_id(self, rtype: str, number: str) -> Optional[str]:
+        return storage.record_base_id(rtype, number, self.conn)
+
+    def next_base_id(self) -> str:
+        return next_base_id(conn=self.conn)
+
+    def save_record(self, rec: Dict):
+        storage.save_record(rec, self.conn)
+        self._changes("records")
+
+    def upsert_customer(self, fields: Dict, defaults: Optional[Dict] = None) -> int:
+        rowid = storage.upsert_customer(fields, defaults, self.conn)
+        self._changes("customers")
+        return rowid
+
+    def log(self, user: str, page: str, action: str, details: str = ""):
+        """Activity log entry, queued only if the unit commits."""
+        self._logs.append((user, page, action, details))
+
+
+@contextmanager
+def unit_of_work():
+    """
+    Open a unit; it commits when the block finishes and rolls back (writing
+    nothing, logging nothing) if the block raises.
+    """
+    with storage.transaction() as conn:
+        uow = UnitOfWork(conn)
+        yield uow
+    storage.mark_changed(*uow._changed)
+    for entry in uow._logs:
+        log_event(*entry)
@@ -0,0 +1,335 @@
+"""
+Write-Behind Queue for Newton Smart Home Application
+Saves a document (record, customer upsert, log entries) as one unit, either
+right away or, with the "write_behind" setting on, as soon as it is journaled:
+the save is appended (fsynced) to data/journal.jsonl, queued in memory and
+applied by a background thread in batches, one transaction per batch.
+
+Queued records already show up in records loads (and so in the records index
+and the pages). A new project id is allocated when the record is written, in
+the same transaction. Entries that fail are retried, in order, on the next
+flushes; entries a crash leaves in the journal are applied on the next startup.
+Each entry is applied once, since its id is committed along with it (and
+deleted once the entry is compacted out of the journal).
+
+An entry that still fails after MAX_ATTEMPTS (or again on replay) is moved to
+data/journal_failed.jsonl with its error and logged, so later saves go on.
+"""
+
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from utils import storage
+from utils.fileio import atomic_write, file_lock, locked_append
+from utils.logger import log_event
+from utils.sequences import next_base_id
+from utils.settings import load_settings
+from utils.unit_of_work import unit_of_work
+
+
+JOURNAL_PATH = "data/journal.jsonl"
+FAILED_PATH = "data/journal_failed.jsonl"
+FLUSH_INTERVAL = 0.5  # seconds a batch waits for more saves
+RETRY_INTERVAL = 2.0  # seconds before failed entries are retried
+MAX_ATTEMPTS = 5  # then the entry is moved to FAILED_PATH
+BATCH_SIZE = 50
+
+_queue: "queue.Queue[dict]" = queue.Queue()
+_start_lock = threading.Lock()
+_flusher: Optional[threading.Thread] = None
+_replayed = False
+
+# Entries that failed to apply, in order, with their attempt counts; they go
+# ahead of the next batch so later saves of a document never overtake them
+_apply_lock = threading.Lock()
+_retry: List[dict] = []
+_attempts: Dict[str, int] = {}
+
+# (type, number) -> (entry id, record) for records queued but not yet written
+_pending_lock = threading.Lock()
+_pending: "OrderedDict[Tuple[str, str], Tuple[str, Dict]]" = OrderedDict()
+_pending_version = 0
+
+
+def enabled() -> bool:
+    return bool(load_settings().get("write_behind", False))
+
+
+def _pending_records() -> Tuple[int, List[Dict]]:
+    with _pending_lock:
+        return _pending_version, [rec for _, rec in _pending.values()]
+
+
+storage.register_overlay("records", ["type", "number"], _pending_records)
+
+
+def _queue_record(entry: Dict):
+    global _pending_version
+    rec = entry["record"]
+    with _pending_lock:
+        key = (str(rec["type"]), str(rec["number"]))
+        _pending.pop(key, None)
+        _pending[key] = (entry["id"], rec)
+        _pending_version += 1
+
+
+def _forget(entries: List[Dict]):
+    """Drop finished entries from the overlay (unless a newer save of the document is queued)."""
+    global _pending_version
+    with _pending_lock:
+        for entry in entries:
+            rec = entry["record"]
+            key = (str(rec["type"]), str(rec["number"]))
+            if key in _pending and _pending[key][0] == entry["id"]:
+                del _pending[key]
+        _pending_version += 1
+
+
+def _applied_key(entry_id: str) -> str:
+    return f"journal:{entry_id}"
+
+
+def _apply(uow, entry: Dict):
+    if storage.get_meta(_applied_key(entry["id"]), uow.conn):
+        return
+    record = entry["record"]
+    if not record.get("base_id"):
+        record = {**record, "base_id": _resolve_base_id(entry.get("base_from") or [], uow.conn)}
+    uow.save_record(record)
+    customer = entry.get("customer")
+    if customer:
+        uow.upsert_customer(customer["fields"], customer.get("defaults"))
+    for log in entry.get("logs", []):
+        uow.log(*log)
+    storage.set_meta(_applied_key(entry["id"]), entry["record"]["number"], uow.conn)
+
+
+def _read_journal() -> List[Dict]:
+    if not os.path.exists(JOURNAL_PATH):
+        return []
+    entries = []
+    with open(JOURNAL_PATH, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                pass  # a line cut short by a crash was never acknowledged
+    return entries
+
+
+def _compact_journal(done: set):
+    """Remove applied (or failed) entries from the journal, then their applied markers."""
+    if not done:
+        return
+    with file_lock(JOURNAL_PATH):
+        keep = [e for e in _read_journal() if e.get("id") not in done]
+        atomic_write(JOURNAL_PATH, "".join(json.dumps(e, ensure_ascii=False) + "\n" for e in keep))
+        # Only once the entries are gone from the journal, so none can be applied twice
+        storage.delete_meta([_applied_key(i) for i in done])
+
+
+def _set_aside(entry: Dict, error: Exception):
+    """Move an entry that cannot be applied from the journal to FAILED_PATH and log it."""
+    rec = entry.get("record") or {}
+    failed = {**entry, "error": str(error), "failed_at": time.strftime("%Y-%m-%d %H:%M:%S")}
+    locked_append(FAILED_PATH, json.dumps(failed, ensure_ascii=False, default=str) + "\n")
+    _compact_journal({entry["id"]})
+    print(f"Journal entry {entry['id']} could not be written; moved to {FAILED_PATH}: {error}")
+    log_event("System", "Write-behind", "save_failed",
+              f"{rec.get('type', '')} {rec.get('number', '')}: {error} (kept in {FAILED_PATH})")
+
+
+def failed_writes() -> List[Dict]:
+    """Saves that could not be written (kept in FAILED_PATH, oldest first)."""
+    if not os.path.exists(FAILED_PATH):
+        return []
+    with open(FAILED_PATH, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _apply_batch(entries: List[Dict]) -> Tuple[List[Dict], Optional[Exception]]:
+    """
+    Apply entries in one transaction, or one by one if the batch fails.
+
+    Returns:
+        (entries left unapplied: the first one that failed and those after it,
+         the error it failed with)
+    """
+    try:
+        with unit_of_work() as uow:
+            for entry in entries:
+                _apply(uow, entry)
+        done, left, error = entries, [], None
+    except Exception as e:
+        print(f"Error applying write batch: {e}")
+        done, left, error = [], [], None
+        for i, entry in enumerate(entries):
+            try:
+                with unit_of_work() as uow:
+                    _apply(uow, entry)
+                done.append(entry)
+            except Exception as e:
+                print(f"Error applying journal entry {entry.get('id')}: {e}")
+                left, error = entries[i:], e
+                break
+    _compact_journal({e["id"] for e in done})
+    return left, error
+
+
+def _flush(batch: List[Dict]):
+    """Apply the entries waiting for a retry, then batch; keep what fails for the next flush."""
+    with _apply_lock:
+        batch = _retry + batch
+        _retry.clear()
+        finished = []
+        while batch:
+            left, error = _apply_batch(batch)
+            unapplied = {e["id"] for e in left}
+            finished += [e for e in batch if e["id"] not in unapplied]
+            if not left:
+                break
+            head = left[0]["id"]
+            _attempts[head] = _attempts.get(head, 0) + 1
+            if _attempts[head] < MAX_ATTEMPTS:
+                _retry.extend(left)
+                break
+            # Out of attempts: set it aside and go on with the entries behind it
+            _set_aside(left[0], error)
+            finished.append(left[0])
+            batch = left[1:]
+        for entry in finished:
+            _attempts.pop(entry["id"], None)
+        _forget(finished)
+
+
+def _drain_into(batch: List[dict]):
+    while len(batch) < BATCH_SIZE:
+        try:
+            batch.append(_queue.get_nowait())
+        except queue.Empty:
+            return
+
+
+def _flush_loop():
+    while True:
+        try:
+            batch = [_queue.get(timeout=RETRY_INTERVAL if _retry else None)]
+        except queue.Empty:
+            batch = []  # nothing new: retry the failed entries
+        time.sleep(FLUSH_INTERVAL)  # saves arriving meanwhile share the transaction
+        _drain_into(batch)
+        _flush(batch)
+
+
+def _ensure_flusher():
+    global _flusher
+    if _flusher is not None and _flusher.is_alive():
+        return
+    with _start_lock:
+        if _flusher is None or not _flusher.is_alive():
+            _flusher = threading.Thread(target=_flush_loop, name="write-behind", daemon=True)
+            _flusher.start()
+
+
+def flush_writes():
+    """Apply everything queued now (used at exit)."""
+    while True:
+        batch: List[dict] = []
+        _drain_into(batch)
+        _flush(batch)  # with nothing new, a last try for the entries waiting for a retry
+        if not batch:
+            return
+
+
+atexit.register(flush_writes)
+
+
+def replay_journal() -> int:
+    """
+    Apply journal entries left by a crashed process (once per process). An
+    entry that fails again is set aside (see failed_writes) and replay goes on.
+
+    Returns:
+        Number of entries found in the journal
+    """
+    global _replayed
+    if _replayed:
+        return 0
+    with _start_lock:
+        if _replayed:
+            return 0
+        _replayed = True
+    # Held throughout, so another process cannot compact (and drop the applied
+    # markers of) entries read here before they are applied
+    with file_lock(JOURNAL_PATH):
+        entries = _read_journal()
+        pos = 0
+        while pos < len(entries):
+            batch = entries[pos:pos + BATCH_SIZE]
+            left, error = _apply_batch(batch)
+            if left:
+                _set_aside(left[0], error)
+            pos += len(batch) - len(left) + (1 if left else 0)
+        # Markers of entries compacted away before a crash could delete them
+        live = {_applied_key(e.get("id")) for e in _read_journal()}
+        stale = [k for k in storage.meta_keys(_applied_key("")) if k not in live]
+        storage.delete_meta(stale)
+    return len(entries)
+
+
+def _resolve_base_id(base_from: Sequence[Tuple[str, str]], conn=None) -> str:
+    for rtype, number in base_from:
+        if not number:
+            continue
+        with _pending_lock:
+            queued = _pending.get((rtype, str(number)))
+        base_id = (queued and queued[1].get("base_id")) or storage.record_base_id(rtype, number, conn)
+        if base_id:
+            return base_id
+    return next_base_id(conn=conn)
+
+
+def save_document(record: Dict, customer: Optional[Dict] = None, logs: Sequence[tuple] = (),
+                  base_from: Sequence[Tuple[str, str]] = ()) -> str:
+    """
+    Save a quotation/invoice/receipt record with its customer upsert and log entries.
+
+    Args:
+        record: Record to save (replaces the stored one with the same type and number)
+        customer: {"fields": ..., "defaults": ...} for storage.upsert_customer, or None
+        logs: (user, page, action, details) activity log entries
+        base_from: (type, number) documents whose base_id the record takes, first
+            match wins, when it has none; otherwise a new project id is allocated
+
+    Returns:
+        The record's base_id; "" when write-behind is on and the record has none
+        yet (it is resolved from base_from when the record is written)
+    """
+    record = dict(record)
+    if not enabled():
+        with unit_of_work() as uow:
+            if not record.get("base_id"):
+                record["base_id"] = _resolve_base_id(base_from, uow.conn)
+            uow.save_record(record)
+            if customer:
+                uow.upsert_customer(customer["fields"], customer.get("defaults"))
+            for log in logs:
+                uow.log(*log)
+        return record["base_id"]
+
+    replay_journal()
+    entry = {"id": uuid.uuid4().hex, "record": record, "customer": customer,
+             "logs": [list(l) for l in logs], "base_from": [list(b) for b in base_from]}
+    # Durable once the journal line is fsynced; applied later by the flusher
+    locked_append(JOURNAL_PATH, json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+    _queue_record(entry)
+    _queue.put(entry)
+    _ensure_flusher()
+    return record.get("base_id") or ""